@@ -0,0 +1,191 @@
+"""
+Deterministic mean-variance allocation engine
+Builds both portfolios for a risk level (or all of them at once) from per-asset return/volatility
+assumptions, as an instant alternative (and fallback) to the LLM
+"""
+import math
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from assets import ASSET_PARAMS
+
+# Assumed ETH price drift (%/yr) earned by ETH-exposed assets on top of yield
+ETH_DRIFT_PCT = 12.0
+FACTOR_VOLS = np.array([0.65, 0.55, 0.18])
+FACTOR_CORR = np.array([
+    [1.00, 0.80, 0.35],
+    [0.80, 1.00, 0.35],
+    [0.35, 0.35, 1.00],
+])
+
+RISK_AVERSION = {"low": 3.0, "medium": 1.2, "high": 0.4}
+
+# Per-portfolio (min, max) weight bounds, in the key order the API returns
+PORTFOLIO_TEMPLATES = {
+    "etherfi-native": {
+        "Portfolio A — ether.fi Native": {
+            "tilt": 0.7,
+            "bounds": {
+                "weETH Staking": (0.15, 0.45),
+                "Liquid Vaults": (0.05, 0.35),
+                "Aave Integration": (0.05, 0.30),
+                "Pendle Integration": (0.0, 0.20),
+                "Gearbox Integration": (0.0, 0.15),
+                "eBTC": (0.05, 0.25),
+                "eUSD Stablecoins": (0.05, 0.35),
+            },
+        },
+        "Portfolio B — Balanced Yield": {
+            "tilt": 1.5,
+            "bounds": {
+                "weETH Staking": (0.10, 0.40),
+                "Liquid Vaults": (0.05, 0.30),
+                "Aave Integration": (0.05, 0.30),
+                "eUSD Stablecoins": (0.05, 0.40),
+                "US Stocks": (0.05, 0.30),
+                "ether.fi Cash": (0.05, 0.20),
+            },
+        },
+    },
+    "traditional": {
+        "Portfolio A — Crypto Tilt": {
+            "tilt": 0.7,
+            "bounds": {
+                "eETH": (0.15, 0.60),
+                "BTC/Alts": (0.05, 0.40),
+                "US Stocks": (0.05, 0.50),
+                "Cash/FD": (0.05, 0.50),
+            },
+        },
+        "Portfolio B — Balanced Traditional": {
+            "tilt": 1.5,
+            "bounds": {
+                "eETH": (0.10, 0.50),
+                "BTC/Alts": (0.0, 0.30),
+                "US Stocks": (0.10, 0.60),
+                "Cash/FD": (0.10, 0.60),
+            },
+        },
+    },
+}
+
+SOLVER_MAX_ITERATIONS = 300
+SOLVER_TOLERANCE = 1e-7
+
+# The market snapshot fields market_assumptions reads; nothing else changes the rates
+RATE_FIELDS = ("apy",)
+
+def market_assumptions(market: Dict[str, Any], assets: List[str] = None) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    Expected annual returns (fractions) and covariance matrix for `assets`
+    (default: the whole universe) under the given market snapshot.
+    """
+    names = list(assets or ASSET_PARAMS)
+    apy = float(market.get("apy") or 4.5)
+    params = [ASSET_PARAMS[name] for name in names]
+    loadings = np.array([p["loadings"] for p in params])
+    mu = np.array([
+        p["ret"] + (apy if p["apy_linked"] else 0.0) + ETH_DRIFT_PCT * p["loadings"][0]
+        for p in params
+    ]) / 100.0
+    factor_cov = FACTOR_CORR * np.outer(FACTOR_VOLS, FACTOR_VOLS)
+    idio = np.array([p["idio"] for p in params])
+    cov = loadings @ factor_cov @ loadings.T + np.diag(idio ** 2)
+    return names, mu, cov
+
+def _position_scale(profile: Dict[str, Any], market: Dict[str, Any]) -> float:
+    # Larger positions get a little more conservative: +15% aversion per 10x above $10k
+    eth_holdings = float(profile.get("eth_holdings") or 0.0)
+    eth_usd = float(market.get("eth_usd") or 3000.0)
+    usd = max(eth_holdings * eth_usd, 10_000.0)
+    return 1.0 + 0.15 * math.log10(usd / 10_000.0)
+
+def _project_box_simplex(v: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """
+    Row-wise Euclidean projection onto {w : sum(w) = 1, lo <= w <= hi}.
+    sum(clip(v - tau, lo, hi)) is piecewise linear and decreasing in tau, so
+    evaluate it at every breakpoint and interpolate inside the bracketing pair.
+    """
+    breaks = np.sort(np.concatenate([v - hi, v - lo], axis=1), axis=1)
+    shifted = v[:, None, :] - breaks[:, :, None]
+    sums = np.minimum(np.maximum(shifted, lo[:, None, :]), hi[:, None, :]).sum(axis=2)
+    # sums is non-increasing along axis 1; find the first breakpoint where it drops to <= 1
+    idx = np.clip((sums > 1.0).sum(axis=1), 1, breaks.shape[1] - 1)
+    rows = np.arange(v.shape[0])
+    t0, t1 = breaks[rows, idx - 1], breaks[rows, idx]
+    s0, s1 = sums[rows, idx - 1], sums[rows, idx]
+    span = np.where(s0 - s1 > 0, s0 - s1, 1.0)
+    tau = t0 + (s0 - 1.0) / span * (t1 - t0)
+    return np.minimum(np.maximum(v - tau[:, None], lo), hi)
+
+def solve_mean_variance(mu: np.ndarray, cov: np.ndarray, aversion: np.ndarray,
+                        lo: np.ndarray, hi: np.ndarray, iterations: int = SOLVER_MAX_ITERATIONS) -> np.ndarray:
+    """
+    Maximize mu.w - aversion/2 * w'Σw subject to the box-constrained simplex,
+    for K problems at once (aversion: (K,), lo/hi: (K, n)) with accelerated
+    projected gradient ascent, stopping early once every row has converged.
+    Returns (K, n) weights.
+    """
+    lipschitz = aversion * np.linalg.eigvalsh(cov)[-1]
+    step = (1.0 / np.maximum(lipschitz, 1e-9))[:, None]
+    w = _project_box_simplex(np.full(lo.shape, 1.0 / lo.shape[1]), lo, hi)
+    y, t = w, 1.0
+    for _ in range(iterations):
+        grad = mu[None, :] - aversion[:, None] * (y @ cov)
+        w_next = _project_box_simplex(y + step * grad, lo, hi)
+        t_next = (1.0 + math.sqrt(1.0 + 4.0 * t * t)) / 2.0
+        delta = w_next - w
+        y = w_next + ((t - 1.0) / t_next) * delta
+        w, t = w_next, t_next
+        if np.abs(delta).max() < SOLVER_TOLERANCE:
+            break
+    return w
+
+def _to_percentages(weights: np.ndarray) -> np.ndarray:
+    """Largest-remainder rounding of (K, n) weight rows to integer percents summing to 100"""
+    raw = weights * 100.0
+    floors = np.floor(raw + 1e-9)
+    short = (100 - floors.sum(axis=1)).astype(int)
+    order = np.argsort(-(raw - floors), axis=1, kind="stable")
+    bump = np.arange(weights.shape[1])[None, :] < short[:, None]
+    ranked = np.take_along_axis(floors, order, axis=1) + bump
+    np.put_along_axis(floors, order, ranked, axis=1)
+    return floors.astype(int)
+
+def allocate_all_risk_levels(profile: Dict[str, Any], market: Dict[str, Any],
+                             risks: List[str] = None) -> Dict[str, Dict[str, Dict[str, int]]]:
+    """
+    Both portfolios for every risk level in `risks` (default: all of them),
+    solved as one batch: {risk: {portfolio: {asset: pct}}}
+    """
+    portfolio_type = profile.get("portfolio_type", "etherfi-native")
+    templates = PORTFOLIO_TEMPLATES.get(portfolio_type, PORTFOLIO_TEMPLATES["etherfi-native"])
+    universe = []
+    for template in templates.values():
+        universe.extend(asset for asset in template["bounds"] if asset not in universe)
+    names, mu, cov = market_assumptions(market, universe)
+    scale = _position_scale(profile, market)
+
+    problems = [(risk, name) for risk in risks or RISK_AVERSION for name in templates]
+    aversion = np.array([RISK_AVERSION[risk] * templates[name]["tilt"] * scale for risk, name in problems])
+    lo = np.zeros((len(problems), len(names)))
+    hi = np.zeros((len(problems), len(names)))
+    for k, (_, name) in enumerate(problems):
+        for asset, (low, high) in templates[name]["bounds"].items():
+            j = names.index(asset)
+            lo[k, j], hi[k, j] = low, high
+
+    percents = _to_percentages(solve_mean_variance(mu, cov, aversion, lo, hi))
+    result: Dict[str, Dict[str, Dict[str, int]]] = {}
+    for k, (risk, name) in enumerate(problems):
+        result.setdefault(risk, {})[name] = {
+            asset: int(percents[k, names.index(asset)]) for asset in templates[name]["bounds"]
+        }
+    return result
+
+def allocate_portfolios(profile: Dict[str, Any], market: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+    """Both portfolios for the profile's risk level, in the same shape as generate_two_portfolios"""
+    risk = profile.get("risk", "medium")
+    risk = risk if risk in RISK_AVERSION else "medium"
+    return allocate_all_risk_levels(profile, market, [risk])[risk]
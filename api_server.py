@@ -1,16 +1,31 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, Response, stream_with_context, g
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
 import os
+import json
+import time
+import threading
+from datetime import datetime
 from dotenv import load_dotenv
-from backend import fetch_etherfi, fetch_eth_price_usd, generate_two_portfolios, llm_summary, reward_split, calculate_profit
-from utils import load_store, save_store, anon_hash, new_rec_id
+from backend import fetch_etherfi, fetch_eth_price_usd, fetch_factor_prices, FALLBACK_ETHERFI, FALLBACK_ETH_USD, generate_two_portfolios, generate_with_summary, instant_portfolios, stream_llm_summary, llm_metrics_snapshot, reward_split, calculate_profit
+from utils import load_store, save_store, store_lock, anon_hash, new_rec_id, ensure_rec_index
+from jobs import generation_queue, QueueFullError
+from batch import generate_batch, count_generations, BATCH_CONCURRENCY, BATCH_MAX_ITEMS
+from settlement import mark_for_settlement, settlement_worker
+from events import bus, rec_topic, cursor, parse_cursor, VersionMonitor
+from compression import init_compression, representation_etags
+from ratelimit import limiter, llm_slots, retry_after_header
 import database
+import metrics
+import profiling
+import search
 
-load_dotenv()
+# whatif, simulation, projection, backtest (numpy) and the Anthropic SDK are
+# imported by the routes that need them, so importing this module stays cheap
 
-# Initialize database
-database.init_db()
+load_dotenv()
 
+# Schema setup happens in create_app(), not on import
 app = Flask(__name__)
 
 # Enable CORS for all routes and origins (development mode)
@@ -20,10 +35,248 @@ CORS(app,
      methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
      supports_credentials=False)
 
+# ====================== REQUEST METRICS ======================
+# Per-route latency, status codes and requests in flight. Registered before
+# compression so the timing includes it (after_request hooks run in reverse).
+
+# Set in the WSGI environ of /api/batch sub-requests
+BATCH_SUBREQUEST = "etherfi.batch_subrequest"
+
+REQUEST_LATENCY = metrics.histogram("http_request_duration_seconds", "Time to produce the response",
+                                    ("method", "route"), metrics.REQUEST_LATENCY_BUCKETS)
+REQUEST_STATUS = metrics.counter("http_requests_total", "Responses by status code", ("method", "route", "status"))
+REQUESTS_IN_FLIGHT = metrics.gauge("http_requests_in_flight", "Requests being handled", ("route",))
+
+def _route_label():
+    # The URL rule, not the path, so /api/recommendation/<rec_id> is one series
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+    g.request_route = _route_label()
+    REQUESTS_IN_FLIGHT.inc(route=g.request_route)
+
+@app.after_request
+def _record_request(response):
+    started = g.get("request_started")
+    if started is not None:
+        # Streamed responses (SSE) are timed until their headers go out; the wait for
+        # the first summary text is backend's llm_first_chunk_seconds
+        REQUEST_LATENCY.observe(time.perf_counter() - started, method=request.method, route=g.request_route)
+        REQUEST_STATUS.inc(method=request.method, route=g.request_route, status=response.status_code)
+    return response
+
+@app.teardown_request
+def _finish_request(error=None):
+    if request.environ.get(BATCH_SUBREQUEST):
+        return  # Shares the outer request's g; the outer teardown does the bookkeeping
+    if g.pop("request_started", None) is not None:
+        REQUESTS_IN_FLIGHT.dec(route=g.request_route)
+
+# ====================== END REQUEST METRICS ======================
+
+# ====================== ADMISSION CONTROL ======================
+# Every request spends a token from its principal's bucket and the global
+# bucket of its endpoint class (ratelimit.DEFAULT_LIMITS); LLM requests also
+# need one of LLM_MAX_IN_FLIGHT slots, held until the response (or stream) ends.
+# Unlisted endpoints are "write" for POST and "read" for GET. Buckets and
+# slots are per worker process.
+
+RATE_CLASSES = {
+    "generate_portfolios": "llm",
+    "stream_generate_portfolios": "llm",
+    "batch_generate_portfolios": "llm",
+    "enqueue_generate_portfolios": "llm",
+    "get_market_data": "market",
+    "what_if_table": "compute",
+    "simulate": "compute",
+    "projection": "compute",
+    "get_backtest": "compute",
+    "api_batch": "read",  # Plus one read token per extra sub-request
+}
+# Health checks and scrapes must keep answering under overload
+UNLIMITED_ENDPOINTS = {"health", "get_metrics", "get_llm_metrics", "get_job_metrics", "get_event_stats"}
+# The job queue runs generations on its own bounded workers, so enqueueing takes no slot
+LLM_SLOT_ENDPOINTS = {"generate_portfolios", "stream_generate_portfolios", "batch_generate_portfolios"}
+
+# Validated session tokens are remembered this long, so a signed-in client
+# doesn't cost a session lookup on every request
+PRINCIPAL_CACHE_SECONDS = float(os.getenv("PRINCIPAL_CACHE_SECONDS", "60"))
+PRINCIPAL_CACHE_MAX = 10000
+_principals = {}  # token -> (principal, cached until)
+
+def _principal():
+    """
+    (bucket key, signed in): the account behind a valid session token, else
+    the client address. A made-up token shares its address's bucket, so
+    rotating tokens buys nothing.
+    """
+    address = f"ip:{request.remote_addr}"
+    token = request.headers.get('Authorization', '').replace('Bearer ', '')
+    if not token:
+        return address, False
+    now = time.monotonic()
+    cached = _principals.get(token)
+    if cached and cached[1] > now:
+        return cached[0], True
+    session = _session(token)
+    if not session:
+        return address, False
+    if len(_principals) >= PRINCIPAL_CACHE_MAX:
+        _principals.clear()
+    key = f"{session['user_type']}:{session['id']}"
+    _principals[token] = (key, now + PRINCIPAL_CACHE_SECONDS)
+    return key, True
+
+def _rate_class():
+    endpoint_class = RATE_CLASSES.get(request.endpoint)
+    if request.endpoint == "generate_portfolios" and (request.get_json(silent=True) or {}).get('mode') == 'instant':
+        return "compute"  # Engine only, no Claude call
+    return endpoint_class or ("read" if request.method in ("GET", "HEAD") else "write")
+
+def _turn_away(status, message, retry_after):
+    response = jsonify({"error": message, "retry_after": retry_after})
+    response.status_code = status
+    response.headers["Retry-After"] = retry_after_header(retry_after)
+    return response
+
+@app.before_request
+def _admit_request():
+    if request.method == "OPTIONS" or request.endpoint in UNLIMITED_ENDPOINTS or not limiter.enabled:
+        return None
+    endpoint_class = _rate_class()
+    principal, signed_in = _principal()
+    # Anyone can share an address, so only accounts get their tokens back when the global bucket refuses
+    wait = limiter.check(endpoint_class, principal, refund=signed_in)
+    if wait:
+        return _turn_away(429, f"Rate limit exceeded for {endpoint_class} requests", wait)
+    if endpoint_class == "llm" and request.endpoint in LLM_SLOT_ENDPOINTS:
+        if not llm_slots.try_acquire():
+            return _turn_away(503, "Too many portfolio generations in progress", 1)
+        g.llm_slot = True
+    return None
+
+@app.teardown_request
+def _release_llm_slot(error=None):
+    if g.pop("llm_slot", False):
+        llm_slots.release()
+    for _ in range(g.pop("llm_extra_slots", 0)):
+        llm_slots.release()
+
+# ====================== END ADMISSION CONTROL ======================
+
+# ====================== PROFILING ======================
+# Opt-in cProfile of single requests (see profiling.py). Started after
+# admission control, so turned-away requests are never profiled; streamed
+# responses are profiled up to their first byte.
+
+@app.before_request
+def _start_profile():
+    if not profiling.enabled() or request.environ.get(BATCH_SUBREQUEST):
+        return
+    trigger = profiling.trigger(request.headers.get(profiling.PROFILE_HEADER))
+    if trigger:
+        g.profile = profiling.start(trigger)
+
+@app.after_request
+def _write_profile(response):
+    profile = g.pop("profile", None)
+    if profile is not None:
+        response.headers["X-Profile-Id"] = profiling.finish(profile, request.method, g.request_route, response.status_code)
+    return response
+
+@app.teardown_request
+def _drop_profile(error=None):
+    profile = g.pop("profile", None)
+    if profile is not None:
+        profiling.abandon(profile)
+
+def _admin():
+    return profiling.is_admin(request.headers.get(profiling.ADMIN_HEADER))
+
+@app.route('/api/admin/profiles', methods=['GET'])
+def list_profiles():
+    """Recent request profiles, newest first (?limit=50&route=/api/...); needs X-Admin-Token"""
+    if not _admin():
+        return jsonify({"error": "Forbidden"}), 403
+    limit = max(1, min(request.args.get('limit', 50, type=int), profiling.PROFILE_KEEP))
+    return jsonify({"profiles": profiling.list_profiles(limit, request.args.get('route'))})
+
+@app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+def download_profile(profile_id):
+    """One profile's raw cProfile stats, for pstats or snakeviz; needs X-Admin-Token"""
+    if not _admin():
+        return jsonify({"error": "Forbidden"}), 403
+    path = profiling.profile_path(profile_id)
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    with open(path, 'rb') as f:
+        return Response(f.read(), mimetype='application/octet-stream',
+                        headers={"Content-Disposition": f'attachment; filename="{profile_id}.prof"'})
+
+# ====================== END PROFILING ======================
+
+# Compact (orjson) JSON and gzip/brotli for large responses
+init_compression(app)
+
+# ====================== CONDITIONAL GET ======================
+# Polled resources carry a version in SQLite, bumped after every store write
+# that changes them: "recs" (the list), "rec:<id>" (one recommendation with
+# its votes, decision and feedback) and "broker:<id>" (earnings and profile).
+# A matching If-None-Match gets a 304 before the store is even opened.
+
+def _etag(*resources):
+    versions = database.get_versions(list(resources))
+    return "-".join(str(versions[resource]) for resource in resources)
+
+def _not_modified(etag):
+    """304 response when the client already holds this version, else None"""
+    for candidate in representation_etags(etag):
+        if candidate in request.if_none_match:
+            return _tagged(Response(status=304), candidate)
+    return None
+
+def _tagged(response, etag):
+    response.set_etag(etag)
+    # Let browsers cache but always revalidate
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+# ====================== END CONDITIONAL GET ======================
+
+# ====================== REQUEST-SCOPED READS ======================
+# Read-only handlers get the store and the caller's session through these, so
+# each is loaded at most once per request, and once for all of an /api/batch
+# (whose sub-requests share the outer request's app context and `g`).
+
+def _read_store():
+    if "store" not in g:
+        g.store = load_store()
+    return g.store
+
+def _session(token):
+    sessions = g.setdefault("sessions", {})
+    if token not in sessions:
+        sessions[token] = database.validate_session(token)
+    return sessions[token]
+
+# ====================== END REQUEST-SCOPED READS ======================
+
 @app.route('/api/health', methods=['GET'])
 def health():
     return jsonify({"status": "ok"})
 
+@app.route('/api/metrics/llm', methods=['GET'])
+def get_llm_metrics():
+    """Claude latency, token usage, parse failures, model fallthroughs and fallback rates"""
+    return jsonify(llm_metrics_snapshot())
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Request, span and LLM metrics in the Prometheus text format"""
+    return Response(metrics.render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 # ====================== AUTHENTICATION ENDPOINTS ======================
 
 @app.route('/api/auth/signup/user', methods=['POST'])
@@ -149,7 +402,7 @@ def validate_token():
     if not token:
         return jsonify({"error": "No token provided"}), 401
     
-    session_data = database.validate_session(token)
+    session_data = _session(token)
     
     if session_data:
         return jsonify({"success": True, "user": session_data})
@@ -163,6 +416,7 @@ def logout():
     
     if token:
         database.delete_session(token)
+        _principals.pop(token, None)
     
     return jsonify({"success": True})
 
@@ -171,28 +425,159 @@ def logout():
 @app.route('/api/market-data', methods=['GET'])
 def get_market_data():
     """Get current market data (EtherFi, ETH price)"""
-    etherfi = fetch_etherfi()
-    eth_usd = fetch_eth_price_usd()
+    etherfi = fetch_etherfi(fallback=False)
+    eth_usd = fetch_eth_price_usd(fallback=False)
+    try:
+        # Builds the daily series the backtester replays; BTC and equities once a day.
+        # Only fetched values go in: a failed fetch leaves a gap, never the stand-in
+        from backtest import factors_to_fetch, record_market_snapshot
+        factors = fetch_factor_prices() if factors_to_fetch(("btc_usd", "spx")) else {}
+        record_market_snapshot({"eth_usd": eth_usd, "apy": (etherfi or {}).get("apy"), **factors})
+    except Exception as e:
+        print(f"Could not record market snapshot: {e}")
     return jsonify({
-        "etherfi": etherfi,
-        "eth_usd": eth_usd
+        "etherfi": etherfi or dict(FALLBACK_ETHERFI),
+        "eth_usd": FALLBACK_ETH_USD if eth_usd is None else eth_usd
     })
 
 @app.route('/api/generate-portfolios', methods=['POST'])
 def generate_portfolios():
-    """Generate two portfolio recommendations"""
+    """Generate two portfolio recommendations ("mode": "instant" skips the LLM)"""
+    data = request.json
+    profile = data.get('profile', {})
+    market = data.get('market', {})
+    
+    if data.get('mode') == 'instant':
+        return jsonify(instant_portfolios(profile, market))
+    
+    return jsonify(generate_with_summary(profile, market))
+
+def _sse(event, data, event_id=None):
+    """Format one server-sent event"""
+    prefix = f"id: {event_id}\n" if event_id else ""
+    return f"{prefix}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/generate-portfolios/stream', methods=['POST'])
+def stream_generate_portfolios():
+    """
+    Generate portfolios and stream the summary as server-sent events:
+    one `portfolios` event, then `summary` text chunks, then `done`
+    """
     data = request.json
     profile = data.get('profile', {})
     market = data.get('market', {})
     
-    portfolios = generate_two_portfolios(profile, market)
-    summary = llm_summary(profile, market, portfolios)
+    def events():
+        # Flush headers right away so the client knows the stream is open
+        yield ": stream opened\n\n"
+        portfolios = generate_two_portfolios(profile, market)
+        yield _sse("portfolios", portfolios)
+        summary = []
+        for chunk in stream_llm_summary(profile, market, portfolios):
+            summary.append(chunk)
+            yield _sse("summary", {"text": chunk})
+        yield _sse("done", {"summary": "".join(summary)})
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route('/api/generate-portfolios/batch', methods=['POST'])
+def batch_generate_portfolios():
+    """
+    Generate portfolios for a list of profiles (logged-in users and brokers
+    only); results stream back as JSON lines in completion order, followed
+    by a summary line
+    """
+    token = request.headers.get('Authorization', '').replace('Bearer ', '')
+    if not token or not _session(token):
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    data = request.json
+    items = data.get('items', [])
+    market = data.get('market', {})
+    try:
+        concurrency = int(data.get('concurrency', BATCH_CONCURRENCY))
+    except (TypeError, ValueError):
+        return jsonify({"error": "concurrency must be an integer"}), 400
+    
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "items must be a non-empty list"}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {BATCH_MAX_ITEMS} items per batch"}), 400
+    
+    # Every generation costs an llm token like a single one; admission already took the first
+    generations = count_generations(items, market)
+    if generations > limiter.max_cost("llm"):
+        return jsonify({"error": f"At most {int(limiter.max_cost('llm'))} distinct profiles per batch "
+                                 "under the current rate limits"}), 400
+    principal, signed_in = _principal()
+    wait = limiter.check("llm", principal, cost=generations - 1, refund=signed_in) if generations > 1 else 0
+    if wait:
+        return _turn_away(429, "Rate limit exceeded for llm requests", wait)
+    
+    # Each parallel generation beyond the first holds an LLM slot of its own, so a
+    # batch can't run more Claude calls at once than LLM_MAX_IN_FLIGHT allows
+    g.llm_extra_slots = 0
+    while g.llm_extra_slots < min(concurrency, generations) - 1 and llm_slots.try_acquire():
+        g.llm_extra_slots += 1
+    workers = 1 + g.llm_extra_slots
+    
+    def lines():
+        fallbacks = 0
+        for result in generate_batch(items, market, workers):
+            fallbacks += result["source"] == "fallback"
+            yield json.dumps(result) + "\n"
+        yield json.dumps({"done": True, "count": len(items), "fallbacks": fallbacks}) + "\n"
+    
+    return Response(stream_with_context(lines()), mimetype='application/x-ndjson')
+
+# ====================== GENERATION JOB ENDPOINTS ======================
+
+@app.route('/api/jobs/generate-portfolios', methods=['POST'])
+def enqueue_generate_portfolios():
+    """Queue portfolio generation and return a job id immediately"""
+    data = request.json
+    profile = data.get('profile', {})
+    market = data.get('market', {})
+    
+    try:
+        job_id = generation_queue.submit(generate_with_summary, profile, market)
+    except QueueFullError as e:
+        response = jsonify({"error": str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    
+    return jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "queue_depth": generation_queue.metrics()["queue_depth"]
+    }), 202
+
+@app.route('/api/jobs/metrics', methods=['GET'])
+def get_job_metrics():
+    """Get generation queue depth and outcome counters"""
+    return jsonify(generation_queue.metrics())
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Poll a generation job; result is included once status is done"""
+    job = generation_queue.get(job_id)
+    
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
     
     return jsonify({
-        "portfolios": portfolios,
-        "summary": summary
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "result": job["result"],
+        "error": job["error"]
     })
 
+# ====================== END GENERATION JOB ENDPOINTS ======================
+
 @app.route('/api/create-recommendation', methods=['POST'])
 def create_recommendation():
     """Create a new recommendation for broker voting"""
@@ -209,7 +594,7 @@ def create_recommendation():
     username = nickname
     
     if token:
-        session_data = database.validate_session(token)
+        session_data = _session(token)
         if session_data and session_data.get('user_type') == 'user':
             user_id = session_data.get('id')
             username = session_data.get('username')
@@ -217,18 +602,24 @@ def create_recommendation():
     user_hash = anon_hash(username.strip() or "guest")
     rec_id = new_rec_id()
     
-    store = load_store()
-    store["users"][user_hash] = profile
-    store["recs"][rec_id] = {
-        "user_hash": user_hash,
-        "user_id": user_id,  # Store user ID for broker filtering
-        "username": username,  # Store username for broker display
-        "input": {"profile": profile, "market": market},
-        "portfolios": portfolios,
-        "summary": summary
-    }
-    store["votes"][rec_id] = {}
-    save_store(store)
+    with store_lock():
+        store = ensure_rec_index(load_store())
+        store["users"][user_hash] = profile
+        store["recs"][rec_id] = {
+            "user_hash": user_hash,
+            "user_id": user_id,  # Store user ID for broker filtering
+            "username": username,  # Store username for broker display
+            "input": {"profile": profile, "market": market},
+            "portfolios": portfolios,
+            "summary": summary,
+            "created_at": datetime.now().isoformat()
+        }
+        # Newest last; ids are random, so this is the only creation order
+        store["rec_order"].append(rec_id)
+        store["votes"][rec_id] = {}
+        save_store(store)
+    search.index_recommendation(rec_id, store["recs"][rec_id])
+    database.bump_versions(["recs", f"rec:{rec_id}"])
     
     return jsonify({
         "rec_id": rec_id,
@@ -238,13 +629,43 @@ def create_recommendation():
 @app.route('/api/recommendations', methods=['GET'])
 def get_recommendations():
     """Get all recommendations"""
-    store = load_store()
-    return jsonify(store.get("recs", {}))
+    etag = _etag("recs")
+    cached = _not_modified(etag)
+    if cached:
+        return cached
+    store = _read_store()
+    return _tagged(jsonify(store.get("recs", {})), etag)
+
+def _arg_list(name):
+    # ?risk=low&risk=medium and ?risk=low,medium mean the same
+    return [value for arg in request.args.getlist(name) for value in arg.split(',')]
+
+@app.route('/api/recommendations/search', methods=['GET'])
+def search_recommendations():
+    """Ranked search over username, goal and summary (?q=) with exact filters (?risk=&portfolio_type=&username=&since=)"""
+    etag = _etag("recs")
+    cached = _not_modified(etag)
+    if cached:
+        return cached
+    results = search.search(
+        request.args.get('q', ''),
+        risk=_arg_list('risk'),
+        portfolio_type=_arg_list('portfolio_type'),
+        username=_arg_list('username'),
+        since=request.args.get('since'),
+        limit=request.args.get('limit', 20, type=int),
+        offset=request.args.get('offset', 0, type=int)
+    )
+    return _tagged(jsonify(results), etag)
 
 @app.route('/api/recommendation/<rec_id>', methods=['GET'])
 def get_recommendation(rec_id):
     """Get a specific recommendation"""
-    store = load_store()
+    etag = _etag(f"rec:{rec_id}")
+    cached = _not_modified(etag)
+    if cached:
+        return cached
+    store = _read_store()
     rec = store.get("recs", {}).get(rec_id)
     votes = store.get("votes", {}).get(rec_id, {})
     decision = store.get("decisions", {}).get(rec_id)
@@ -254,14 +675,185 @@ def get_recommendation(rec_id):
     if not rec:
         return jsonify({"error": "Recommendation not found"}), 404
     
-    return jsonify({
+    return _tagged(jsonify({
         "recommendation": rec,
         "votes": votes,
         "decision": decision,
         "feedback": feedback,
         "broker_votes": broker_votes
+    }), etag)
+
+# ====================== RECOMMENDATION EVENTS ======================
+# Votes, decisions and feedback are pushed to watchers as they happen.
+# Events come from this process's bus; a write served by another worker is
+# noticed by the process's version monitor (one query every
+# EVENTS_VERSION_CHECK seconds for all watched recs, see CONDITIONAL GET) and
+# announced as a `changed` event, telling the client to refetch.
+# Every watcher holds a worker thread, so at most EVENTS_MAX_WATCHERS per
+# process wait at once; the rest are answered straight away and come back
+# later. The dashboard long-polls with short holds; SSE is for tools.
+
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+# SSE streams end after this long; EventSource reconnects with Last-Event-ID
+EVENTS_STREAM_SECONDS = float(os.getenv("EVENTS_STREAM_SECONDS", "60"))
+EVENTS_LONGPOLL_MAX = float(os.getenv("EVENTS_LONGPOLL_MAX", "15"))
+# Watchers held at once per worker process; keep it well under GUNICORN_THREADS
+EVENTS_MAX_WATCHERS = int(os.getenv("EVENTS_MAX_WATCHERS", str(max(1, int(os.getenv("GUNICORN_THREADS", "8")) // 2))))
+# How long a watcher turned away should wait before asking again
+EVENTS_BUSY_RETRY_MS = 3000
+
+version_monitor = VersionMonitor(bus, database.get_versions)
+_watch_slots = threading.BoundedSemaphore(EVENTS_MAX_WATCHERS)
+
+def _event_payload(seq, event, data):
+    return {"id": cursor(seq), "event": event, "data": data}
+
+@app.route('/api/recommendation/<rec_id>/events', methods=['GET'])
+def recommendation_events(rec_id):
+    """
+    Stream changes to one recommendation as server-sent events, or with
+    ?transport=longpoll answer once something newer than `since` happens.
+    """
+    topic = rec_topic(rec_id)
+    token = request.headers.get('Last-Event-ID') or request.args.get('since')
+    seq = parse_cursor(token)
+    # An unknown cursor (first connect, other worker, restart) may have missed something
+    stale = token is not None and seq is None
+    if seq is None:
+        seq = bus.last_seq
+    current = version_monitor.track(topic)
+    version = request.args.get('version', type=int)
+    if version is None:
+        version = current
+    
+    if request.args.get('transport') == 'longpoll':
+        timeout = min(request.args.get('timeout', 10.0, type=float), EVENTS_LONGPOLL_MAX)
+        busy = not _watch_slots.acquire(blocking=False)
+        try:
+            # Turned away: report what's already buffered without holding a thread
+            events = [] if stale else bus.since(topic, seq) if busy else bus.wait(topic, seq, timeout)
+        finally:
+            if not busy:
+                _watch_slots.release()
+        current = version_monitor.track(topic)
+        payload = {
+            "events": [_event_payload(*e) for e in events],
+            "cursor": cursor(events[-1][0] if events else seq),
+            # Our own events have already bumped it; the monitor may not have read it yet
+            "version": database.get_versions([topic])[topic] if events else current,
+            # Something changed that these events don't describe: refetch. The
+            # monitor's copy can lag a local write, so only a newer version counts
+            "changed": stale or any(e[1] == "changed" for e in events) or (not events and current > version)
+        }
+        if busy:
+            payload["retry_ms"] = EVENTS_BUSY_RETRY_MS
+        return jsonify(payload)
+    
+    if not _watch_slots.acquire(blocking=False):
+        response = jsonify({"error": "Too many watchers, retry shortly or use ?transport=longpoll"})
+        response.headers['Retry-After'] = str(EVENTS_BUSY_RETRY_MS // 1000)
+        return response, 503
+    
+    def generate():
+        nonlocal seq
+        yield f"retry: {EVENTS_BUSY_RETRY_MS}\n: watching {rec_id}\n\n"
+        if stale or current > version:
+            yield _sse("changed", {"version": current}, cursor(seq))
+        started = last_beat = time.monotonic()
+        while True:
+            remaining = EVENTS_STREAM_SECONDS - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            version_monitor.track(topic)
+            # Foreign writes arrive here as `changed` events from the monitor
+            events = bus.wait(topic, seq, min(EVENTS_HEARTBEAT, version_monitor.interval, remaining))
+            for event_seq, event, data in events:
+                seq = event_seq
+                yield _sse(event, data, cursor(seq))
+            now = time.monotonic()
+            if now - last_beat >= EVENTS_HEARTBEAT:
+                yield ": heartbeat\n\n"
+                last_beat = now
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # On close rather than in the generator: a stream never started never runs its finally
+    response.call_on_close(_watch_slots.release)
+    return response
+
+@app.route('/api/events/stats', methods=['GET'])
+def get_event_stats():
+    """Open topics and blocked watchers in this worker"""
+    return jsonify(bus.stats())
+
+# ====================== END RECOMMENDATION EVENTS ======================
+
+# ====================== BATCH REQUESTS ======================
+
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "10"))
+# Long-lived or nested responses can't be answered inside a batch
+UNBATCHABLE_ENDPOINTS = {"api_batch", "recommendation_events"}
+# Sub-requests skip admission control, so only cheap reads may be batched;
+# market, compute and LLM endpoints must be called on their own
+BATCHABLE_CLASSES = {"read"}
+
+def _subrequest(spec, principal, charge):
+    """Run one GET sub-request in a nested request context; returns its result entry"""
+    if isinstance(spec, str):
+        spec = {"path": spec}
+    path = spec.get("path") if isinstance(spec, dict) else None
+    if not isinstance(path, str) or not path.startswith("/api/"):
+        return {"path": path, "status": 400, "body": {"error": "path must start with /api/"}}
+    
+    # Sub-requests run as the caller, with their own conditional headers
+    headers = {"Authorization": request.headers.get("Authorization", "")}
+    headers.update({key: str(value) for key, value in (spec.get("headers") or {}).items()})
+    environ = {BATCH_SUBREQUEST: True, "REMOTE_ADDR": request.remote_addr}
+    with app.test_request_context(path, method="GET", headers=headers, environ_overrides=environ):
+        if request.endpoint in UNBATCHABLE_ENDPOINTS or _rate_class() not in BATCHABLE_CLASSES:
+            return {"path": path, "status": 400, "body": {"error": "This endpoint can't be batched"}}
+        if charge:
+            # Charged like the same request made on its own
+            key, signed_in = principal
+            wait = limiter.check(_rate_class(), key, refund=signed_in)
+            if wait:
+                return {"path": path, "status": 429,
+                        "body": {"error": f"Rate limit exceeded for {_rate_class()} requests", "retry_after": wait}}
+        try:
+            response = app.make_response(app.dispatch_request())
+        except HTTPException as e:
+            return {"path": path, "status": e.code, "body": {"error": e.description}}
+        except Exception as e:
+            print(f"Batch sub-request {path} failed: {e}")
+            return {"path": path, "status": 500, "body": {"error": "Internal server error"}}
+        result = {"path": path, "status": response.status_code}
+        etag, _ = response.get_etag()
+        if etag:
+            result["etag"] = f'"{etag}"'
+        if response.status_code != 304:
+            result["body"] = response.get_json(silent=True) if response.is_json else response.get_data(as_text=True)
+        return result
+
+@app.route('/api/batch', methods=['POST'])
+def api_batch():
+    """
+    Answer several GET sub-requests in one round trip, in order, with one
+    session lookup and one store read shared by all of them
+    """
+    data = request.json or {}
+    subrequests = data.get('requests')
+    if not isinstance(subrequests, list) or not subrequests:
+        return jsonify({"error": "requests must be a non-empty list of paths or {path, headers}"}), 400
+    if len(subrequests) > BATCH_MAX_REQUESTS:
+        return jsonify({"error": f"At most {BATCH_MAX_REQUESTS} requests per batch"}), 400
+    
+    principal = _principal()
+    return jsonify({
+        "responses": [_subrequest(spec, principal, charge=i > 0) for i, spec in enumerate(subrequests)]
     })
 
+# ====================== END BATCH REQUESTS ======================
+
 @app.route('/api/vote', methods=['POST'])
 def submit_vote():
     """Submit a broker vote"""
@@ -275,33 +867,48 @@ def submit_vote():
     broker_username = 'Anonymous'
     
     if token:
-        session_data = database.validate_session(token)
+        session_data = _session(token)
         if session_data and session_data.get('user_type') == 'broker':
             broker_id = session_data.get('id')
             broker_username = session_data.get('username')
     
-    store = load_store()
-    if rec_id not in store.get("recs", {}):
-        return jsonify({"error": "Recommendation not found"}), 404
-    
-    # Store vote with broker tracking
-    store["votes"].setdefault(rec_id, {})
-    
-    # Update aggregate vote count
-    store["votes"][rec_id][choice] = store["votes"][rec_id].get(choice, 0) + 1
-    
-    # Track individual broker votes
-    if "broker_votes" not in store:
-        store["broker_votes"] = {}
-    
-    store["broker_votes"].setdefault(rec_id, {})
-    store["broker_votes"][rec_id][str(broker_id)] = {
-        "broker_id": broker_id,
-        "broker_username": broker_username,
-        "choice": choice
-    }
-    
-    save_store(store)
+    with store_lock():
+        store = load_store()
+        if rec_id not in store.get("recs", {}):
+            return jsonify({"error": "Recommendation not found"}), 404
+        
+        # Store vote with broker tracking
+        store["votes"].setdefault(rec_id, {})
+        
+        # Update aggregate vote count
+        store["votes"][rec_id][choice] = store["votes"][rec_id].get(choice, 0) + 1
+        
+        # Track individual broker votes
+        if "broker_votes" not in store:
+            store["broker_votes"] = {}
+        
+        store["broker_votes"].setdefault(rec_id, {})
+        if broker_id and str(broker_id) not in store["broker_votes"][rec_id]:
+            ensure_rec_index(store)["broker_voted"].setdefault(str(broker_id), []).append(rec_id)
+        store["broker_votes"][rec_id][str(broker_id)] = {
+            "broker_id": broker_id,
+            "broker_username": broker_username,
+            "choice": choice
+        }
+        
+        # A vote on an already decided recommendation earns the broker its share too
+        decided = rec_id in store.get("decisions", {})
+        if decided:
+            mark_for_settlement(store, rec_id)
+        
+        save_store(store)
+    database.bump_versions([f"rec:{rec_id}"] + ([f"broker:{broker_id}"] if broker_id else []))
+    bus.publish(rec_topic(rec_id), "vote", {
+        "votes": store["votes"][rec_id],
+        "broker_votes": store["broker_votes"][rec_id]
+    })
+    if decided:
+        settlement_worker.nudge()
     
     return jsonify({"success": True, "votes": store["votes"][rec_id]})
 
@@ -313,44 +920,75 @@ def get_broker_earnings():
     if not token:
         return jsonify({"error": "No token provided"}), 401
     
-    session_data = database.validate_session(token)
+    session_data = _session(token)
     if not session_data or session_data.get('user_type') != 'broker':
         return jsonify({"error": "Unauthorized"}), 401
     
     broker_id = session_data.get('id')
+    etag = _etag(f"broker:{broker_id}")
+    cached = _not_modified(etag)
+    if cached:
+        return cached
     
-    # Calculate earnings from decisions where this broker voted
-    store = load_store()
-    total_earnings = 0.0
-    recommendations_voted = []
+    # Earnings are settled into the brokers table in the background (see settlement.py)
+    details = [
+        {
+            "rec_id": row["rec_id"],
+            "earnings": row["amount"],
+            "user": row["username"] or "Anonymous",
+            "decision": row["decision"]
+        }
+        for row in database.get_broker_ledger(broker_id)
+        if row["amount"]
+    ]
     
-    broker_votes = store.get("broker_votes", {})
+    return _tagged(jsonify({
+        "total_earnings": round(session_data.get('total_earnings') or 0.0, 2),
+        "recommendations_count": len(details),
+        "details": details
+    }), etag)
+
+BROKER_FEED_MAX = 100
+
+@app.route('/api/broker/feed', methods=['GET'])
+def get_broker_feed():
+    """Newest recommendations the logged-in broker hasn't voted on yet (?limit=20)"""
+    token = request.headers.get('Authorization', '').replace('Bearer ', '')
+    session_data = _session(token) if token else None
+    if not session_data or session_data.get('user_type') != 'broker':
+        return jsonify({"error": "Unauthorized"}), 401
     
-    for rec_id, votes_by_broker in broker_votes.items():
-        # Check if this broker voted on this recommendation
-        if str(broker_id) in votes_by_broker:
-            # Check if there's a decision with earnings
-            decision = store.get("decisions", {}).get(rec_id)
-            if decision and "reward_split" in decision and decision["reward_split"].get("broker"):
-                broker_earnings = decision["reward_split"]["broker"]
-                total_earnings += broker_earnings
-                recommendations_voted.append({
-                    "rec_id": rec_id,
-                    "earnings": broker_earnings,
-                    "user": store["recs"][rec_id].get("username", "Anonymous"),
-                    "decision": decision.get("decision")
-                })
+    broker_id = session_data.get('id')
+    limit = max(1, min(request.args.get('limit', 20, type=int), BROKER_FEED_MAX))
+    # New recommendations and this broker's votes are the only things that change it
+    etag = _etag("recs", f"broker:{broker_id}")
+    cached = _not_modified(etag)
+    if cached:
+        return cached
     
-    return jsonify({
-        "total_earnings": round(total_earnings, 2),
-        "recommendations_count": len(recommendations_voted),
-        "details": recommendations_voted
-    })
+    store = ensure_rec_index(_read_store())
+    recs = store["recs"]
+    voted = set(store["broker_voted"].get(str(broker_id), []))
+    feed = []
+    # Walk the index from the newest end and stop once the page is full
+    for rec_id in reversed(store["rec_order"]):
+        if rec_id in voted:
+            continue
+        if len(feed) == limit:
+            break
+        feed.append({"rec_id": rec_id, **recs[rec_id]})
+    has_more = len(feed) == limit and len(store["rec_order"]) - len(voted) > limit
+    
+    return _tagged(jsonify({"recommendations": feed, "has_more": has_more}), etag)
 
 @app.route('/api/broker/profile/<int:broker_id>', methods=['GET'])
 def get_broker_profile(broker_id):
     """Get public profile stats for a specific broker"""
-    store = load_store()
+    etag = _etag(f"broker:{broker_id}")
+    cached = _not_modified(etag)
+    if cached:
+        return cached
+    store = _read_store()
     broker_votes = store.get("broker_votes", {})
     decisions = store.get("decisions", {})
     
@@ -362,7 +1000,6 @@ def get_broker_profile(broker_id):
     
     # Calculate stats
     total_votes = 0
-    total_earnings = 0.0
     successful_recommendations = 0
     portfolio_recommendations = {}
     vote_history = []
@@ -384,7 +1021,6 @@ def get_broker_profile(broker_id):
                 
                 if decision.get("reward_split", {}).get("broker"):
                     earnings = decision["reward_split"]["broker"]
-                    total_earnings += earnings
                 
                 if chosen_portfolio == recommended_portfolio:
                     successful_recommendations += 1
@@ -407,13 +1043,16 @@ def get_broker_profile(broker_id):
                     "timestamp": None
                 })
     
+    # Settled earnings, the same figure /api/broker/earnings reports
+    total_earnings = broker_info.get('total_earnings') or 0.0
+    
     # Calculate success rate
     success_rate = (successful_recommendations / total_votes * 100) if total_votes > 0 else 0
     
     # Sort vote history by most recent
     vote_history.sort(key=lambda x: x.get("timestamp") or "", reverse=True)
     
-    return jsonify({
+    return _tagged(jsonify({
         "broker_id": broker_id,
         "username": broker_info['username'],  # Access by key name
         "total_votes": total_votes,
@@ -422,7 +1061,7 @@ def get_broker_profile(broker_id):
         "success_rate": round(success_rate, 2),
         "portfolio_recommendations": portfolio_recommendations,
         "vote_history": vote_history[:10]  # Last 10 votes
-    })
+    }), etag)
 
 @app.route('/api/decision', methods=['POST'])
 def submit_decision():
@@ -437,23 +1076,30 @@ def submit_decision():
     eth_price = data.get('eth_price', 3000.0)
     expected_return = data.get('expected_return', 8.0)  # Annual return percentage
     
-    store = load_store()
-    if rec_id not in store.get("recs", {}):
-        return jsonify({"error": "Recommendation not found"}), 404
-    
-    # Calculate profit based on investment and expected return
-    profit_info = calculate_profit(eth_holdings, eth_price, expected_return, time_limit_days)
-    
-    # Calculate reward split based on the profit
-    split = reward_split(profit_info['profit'])
-    
-    store["decisions"][rec_id] = {
-        "decision": decision,
-        "time_limit_days": int(time_limit_days),
-        "profit_info": profit_info,
-        "reward_split": split
-    }
-    save_store(store)
+    with store_lock():
+        store = load_store()
+        if rec_id not in store.get("recs", {}):
+            return jsonify({"error": "Recommendation not found"}), 404
+        
+        # Calculate profit based on investment and expected return
+        profit_info = calculate_profit(eth_holdings, eth_price, expected_return, time_limit_days)
+        
+        # Calculate reward split based on the profit
+        split = reward_split(profit_info['profit'])
+        
+        store["decisions"][rec_id] = {
+            "decision": decision,
+            "time_limit_days": int(time_limit_days),
+            "profit_info": profit_info,
+            "reward_split": split,
+            "timestamp": datetime.now().isoformat()
+        }
+        mark_for_settlement(store, rec_id)
+        save_store(store)
+    voters = [key for key in store.get("broker_votes", {}).get(rec_id, {}) if key != "None"]
+    database.bump_versions([f"rec:{rec_id}"] + [f"broker:{key}" for key in voters])
+    bus.publish(rec_topic(rec_id), "decision", {"decision": store["decisions"][rec_id]})
+    settlement_worker.nudge()
     
     return jsonify({
         "success": True,
@@ -461,6 +1107,98 @@ def submit_decision():
         "reward_split": split
     })
 
+@app.route('/api/what-if', methods=['POST'])
+def what_if_table():
+    """Profit and reward split for a grid of holdings, prices, returns and horizons"""
+    from whatif import what_if, to_json as whatif_to_json
+    data = request.json or {}
+    try:
+        result = what_if(
+            data.get('eth_holdings', 5.0),
+            data.get('eth_price', 3000.0),
+            data.get('expected_return', 8.0),
+            data.get('time_limit_days', 30),
+            grid=bool(data.get('grid', True))
+        )
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(whatif_to_json(result))
+
+def _scenario_inputs(data):
+    """
+    (portfolios, market, eth_holdings, eth_price) for a scenario request:
+    the posted portfolios, or those of `rec_id` with its stored market and
+    holdings as defaults. Returns an error response instead when neither resolves.
+    """
+    portfolios = data.get('portfolios')
+    market = data.get('market', {})
+    eth_holdings = data.get('eth_holdings')
+    
+    rec_id = data.get('rec_id')
+    if rec_id:
+        store = load_store()
+        rec = store.get("recs", {}).get(rec_id)
+        if not rec:
+            return None, (jsonify({"error": "Recommendation not found"}), 404)
+        portfolios = rec.get("portfolios", {})
+        market = market or rec.get("input", {}).get("market", {})
+        if eth_holdings is None:
+            eth_holdings = rec.get("input", {}).get("profile", {}).get("eth_holdings")
+    if not portfolios:
+        return None, (jsonify({"error": "Pass portfolios or rec_id"}), 400)
+    
+    eth_holdings = 5.0 if eth_holdings is None else eth_holdings
+    eth_price = data.get('eth_price', market.get('eth_usd') or 3000.0)
+    return (portfolios, market, eth_holdings, eth_price), None
+
+@app.route('/api/simulate', methods=['POST'])
+def simulate():
+    """Monte Carlo outcome bands for each portfolio of a recommendation (or of the posted portfolios)"""
+    from simulation import simulate_portfolio, DEFAULT_PATHS
+    data = request.json or {}
+    inputs, error = _scenario_inputs(data)
+    if error:
+        return error
+    portfolios, market, eth_holdings, eth_price = inputs
+    try:
+        results = {
+            name: simulate_portfolio(
+                allocation, market, eth_holdings, eth_price,
+                data.get('time_limit_days', 30),
+                paths=data.get('paths', DEFAULT_PATHS),
+                seed=data.get('seed')
+            )
+            for name, allocation in portfolios.items()
+        }
+    except (ValueError, TypeError, KeyError) as e:
+        return jsonify({"error": f"Invalid simulation input: {e}"}), 400
+    return jsonify({"results": results})
+
+@app.route('/api/projection', methods=['POST'])
+def projection():
+    """Compounded daily value curve, per asset and in total, for each portfolio"""
+    from projection import project_portfolio
+    data = request.json or {}
+    inputs, error = _scenario_inputs(data)
+    if error:
+        return error
+    portfolios, market, eth_holdings, eth_price = inputs
+    try:
+        results = {
+            name: project_portfolio(allocation, market, eth_holdings, eth_price, data.get('time_limit_days', 30))
+            for name, allocation in portfolios.items()
+        }
+    except (ValueError, TypeError, KeyError) as e:
+        return jsonify({"error": f"Invalid projection input: {e}"}), 400
+    return jsonify({"results": results})
+
+@app.route('/api/backtest', methods=['GET'])
+def get_backtest():
+    """Realized returns per decided recommendation and hindsight vote accuracy per broker"""
+    from backtest import latest_results
+    results = latest_results(full=request.args.get('full') == '1')
+    return jsonify(results)
+
 @app.route('/api/feedback', methods=['POST'])
 def submit_feedback():
     """Submit feedback"""
@@ -469,19 +1207,34 @@ def submit_feedback():
     thumb = data.get('thumb')
     note = data.get('note', '')
     
-    store = load_store()
-    if rec_id not in store.get("recs", {}):
-        return jsonify({"error": "Recommendation not found"}), 404
-    
-    store["feedback"].setdefault(rec_id, [])
-    store["feedback"][rec_id].append({
-        "thumb": thumb,
-        "note": note
-    })
-    save_store(store)
+    with store_lock():
+        store = load_store()
+        if rec_id not in store.get("recs", {}):
+            return jsonify({"error": "Recommendation not found"}), 404
+        
+        store["feedback"].setdefault(rec_id, [])
+        store["feedback"][rec_id].append({
+            "thumb": thumb,
+            "note": note
+        })
+        save_store(store)
+    database.bump_versions([f"rec:{rec_id}"])
+    bus.publish(rec_topic(rec_id), "feedback", {"feedback": store["feedback"][rec_id][-1]})
     
     return jsonify({"success": True})
 
+def create_app():
+    """
+    App factory: set up the database schema and return the app. Called once
+    per process by whoever serves it (the block below, gunicorn via
+    serve.py, the test fixtures and benchmarks). Stores from before the
+    search index existed are indexed once with `python search.py --rebuild`,
+    not at every boot.
+    """
+    database.init_db()
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5001, host='127.0.0.1')
+    # Development server; use `python serve.py` for production
+    create_app().run(debug=True, port=5001, host='127.0.0.1')
 
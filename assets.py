@@ -0,0 +1,22 @@
+"""
+Per-asset assumptions shared by the allocation engine, simulator,
+backtester and stream parser
+Kept free of numpy so importing it (e.g. from the stream parser) is cheap
+"""
+
+# Annual expected return (% on top of the EtherFi APY when apy_linked),
+# factor loadings on [ETH, BTC, equities] and idiosyncratic volatility
+ASSET_PARAMS = {
+    "weETH Staking":       {"ret": 0.0,  "apy_linked": True,  "loadings": (1.00, 0.0, 0.0), "idio": 0.02},
+    "Liquid Vaults":       {"ret": 3.0,  "apy_linked": True,  "loadings": (1.00, 0.0, 0.0), "idio": 0.10},
+    "Aave Integration":    {"ret": 1.5,  "apy_linked": True,  "loadings": (0.95, 0.0, 0.0), "idio": 0.05},
+    "Pendle Integration":  {"ret": 2.5,  "apy_linked": True,  "loadings": (0.90, 0.0, 0.0), "idio": 0.06},
+    "Gearbox Integration": {"ret": 6.0,  "apy_linked": True,  "loadings": (1.60, 0.0, 0.0), "idio": 0.15},
+    "eBTC":                {"ret": 11.0, "apy_linked": False, "loadings": (0.0, 1.00, 0.0), "idio": 0.03},
+    "eUSD Stablecoins":    {"ret": 6.0,  "apy_linked": False, "loadings": (0.0, 0.0, 0.0),  "idio": 0.02},
+    "US Stocks":           {"ret": 9.0,  "apy_linked": False, "loadings": (0.0, 0.0, 1.00), "idio": 0.02},
+    "ether.fi Cash":       {"ret": 3.0,  "apy_linked": False, "loadings": (0.0, 0.0, 0.0),  "idio": 0.01},
+    "eETH":                {"ret": 0.0,  "apy_linked": True,  "loadings": (1.00, 0.0, 0.0), "idio": 0.02},
+    "BTC/Alts":            {"ret": 15.0, "apy_linked": False, "loadings": (0.0, 1.10, 0.0), "idio": 0.15},
+    "Cash/FD":             {"ret": 3.5,  "apy_linked": False, "loadings": (0.0, 0.0, 0.0),  "idio": 0.005},
+}
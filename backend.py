@@ -1,12 +1,307 @@
-import os, requests, json
-from typing import Dict, Any
+import os, time, threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
-import anthropic
+import metrics
+from stream_parser import StreamingPortfolioParser, PortfolioStreamError, parse_stream
 
 load_dotenv()
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 
-def fetch_etherfi() -> Dict[str, float]:
+# Try newer models first, fallback to older models if needed
+PORTFOLIO_MODELS = [
+    "claude-sonnet-4-20250514",
+    "claude-3-5-sonnet-20241022",
+    "claude-3-opus-20240229"
+]
+
+SUMMARY_MODELS = [
+    "claude-sonnet-4-20250514",
+    "claude-3-5-sonnet-20241022",
+    "claude-3-opus-20240229",
+    "claude-3-haiku-20240307"
+]
+
+# Per-task routing: the primary model is matched to the task's latency SLO.
+# If it hasn't answered by its observed `percentile` latency (or the default
+# deadline until enough samples exist), the same request is hedged to the
+# secondary model and whichever returns a valid result first wins.
+ROUTING = {
+    "portfolios": {
+        "primary": os.getenv("LLM_PORTFOLIO_MODEL", "claude-sonnet-4-20250514"),
+        "hedge": os.getenv("LLM_PORTFOLIO_HEDGE_MODEL", "claude-3-5-sonnet-20241022"),
+        "percentile": float(os.getenv("LLM_PORTFOLIO_HEDGE_PERCENTILE", "0.95")),
+        "default_deadline": float(os.getenv("LLM_PORTFOLIO_HEDGE_DEADLINE", "12")),
+    },
+    "summary": {
+        "primary": os.getenv("LLM_SUMMARY_MODEL", "claude-3-haiku-20240307"),
+        "hedge": os.getenv("LLM_SUMMARY_HEDGE_MODEL", "claude-3-5-sonnet-20241022"),
+        "percentile": float(os.getenv("LLM_SUMMARY_HEDGE_PERCENTILE", "0.9")),
+        "default_deadline": float(os.getenv("LLM_SUMMARY_HEDGE_DEADLINE", "4")),
+    },
+}
+# Hedged calls allowed as a fraction of routed calls (plus a small burst)
+LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.1"))
+LLM_HEDGE_BURST = 2
+# Successful calls needed before the observed percentile replaces the default deadline
+LLM_HEDGE_MIN_SAMPLES = 20
+
+_llm_pool = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_THREADS", "16")), thread_name_prefix="llm")
+_hedge_lock = threading.Lock()
+_hedge_budget = {"routed": 0, "hedged": 0}
+
+class LLMCancelled(Exception):
+    """Raised inside an attempt whose hedged twin already won"""
+
+class LLMTimeout(Exception):
+    """Raised when a call would run past the caller's deadline"""
+
+class CancelEvent(threading.Event):
+    """
+    Set when a hedged twin wins. Setting it also closes the attempt's open
+    stream, so the loser stops (and frees its pool thread) right away rather
+    than at its next chunk.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._stream_lock = threading.Lock()
+        self._stream = None
+
+    def attach(self, stream):
+        with self._stream_lock:
+            self._stream = stream
+            cancelled = self.is_set()
+        if cancelled:
+            stream.close()
+
+    def set(self):
+        with self._stream_lock:
+            super().set()
+            stream = self._stream
+        if stream is not None:
+            stream.close()
+
+def _attach(cancel: Optional[threading.Event], stream):
+    if isinstance(cancel, CancelEvent):
+        cancel.attach(stream)
+
+def _cancelled(cancel: Optional[threading.Event]) -> bool:
+    return cancel is not None and cancel.is_set()
+
+def _get_client():
+    """Create the Anthropic client (swapped for a stub in tests)"""
+    # Imported on first use: the SDK (and httpx under it) is most of the import
+    # time of this module, and workers that never call Claude don't need it
+    import anthropic
+    return anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+
+# ====================== LLM INSTRUMENTATION ======================
+
+LLM_LATENCY = metrics.histogram("llm_request_seconds", "Claude call latency", ("task", "model", "outcome"))
+LLM_INPUT_TOKENS = metrics.counter("llm_input_tokens_total", "Prompt tokens sent to Claude", ("task", "model"))
+LLM_OUTPUT_TOKENS = metrics.counter("llm_output_tokens_total", "Completion tokens received from Claude", ("task", "model"))
+LLM_PARSE_FAILURES = metrics.counter("llm_parse_failures_total", "Portfolio completions rejected by the parser", ("model",))
+LLM_FALLTHROUGH = metrics.counter("llm_model_fallthrough_total", "Times a model was skipped for the next one", ("task", "model", "reason"))
+LLM_RESULTS = metrics.counter("llm_results_total", "Where each portfolio/summary result came from", ("task", "source", "reason"))
+LLM_HEDGES = metrics.counter("llm_hedges_total", "Hedged requests by outcome", ("task", "outcome"))
+LLM_PRIMARY_LATENCY = metrics.histogram("llm_primary_seconds", "Routed primary latency the hedge deadline is set from; hedged-over primaries count as the time they had run", ("task", "model"))
+LLM_FIRST_CHUNK = metrics.histogram("llm_first_chunk_seconds", "Time from opening a streamed summary to its first text chunk", ("task", "model"))
+
+def _retryable(e: Exception) -> bool:
+    """
+    Whether another model might succeed where this call failed: a missing
+    model, invalid output, overload, rate limiting, 5xx or a dropped
+    connection, but not auth or request errors or a passed deadline
+    """
+    if isinstance(e, (LLMCancelled, LLMTimeout)):
+        return False
+    if isinstance(e, PortfolioStreamError) or _error_outcome(e) == "not_found":
+        return True
+    status = getattr(e, "status_code", None)
+    if status is None:
+        return True  # Connection errors and timeouts carry no status
+    return status in (408, 409, 429) or status >= 500
+
+def _error_outcome(e: Exception) -> str:
+    if isinstance(e, LLMCancelled):
+        return "cancelled"
+    if isinstance(e, LLMTimeout):
+        return "timeout"
+    return "not_found" if "not_found_error" in str(e) or "404" in str(e) else "error"
+
+def _usage(response) -> Tuple[int, int]:
+    usage = getattr(response, "usage", None)
+    return (getattr(usage, "input_tokens", 0) or 0, getattr(usage, "output_tokens", 0) or 0)
+
+def _stream_usage(stream, chars_received: int) -> Tuple[int, int]:
+    """Token usage of a (possibly abandoned) stream; output is estimated from text if the stream was cut short"""
+    try:
+        input_tokens, output_tokens = _usage(stream.current_message_snapshot)
+    except Exception:
+        input_tokens, output_tokens = 0, 0
+    return input_tokens, max(output_tokens, chars_received // 4)
+
+def _record_llm_call(task: str, model: str, started: float, outcome: str,
+                     usage: Tuple[int, int] = (0, 0), **fields):
+    """Record latency and token usage of one Claude call and emit an llm_call event"""
+    elapsed = time.perf_counter() - started
+    input_tokens, output_tokens = usage
+    LLM_LATENCY.observe(elapsed, task=task, model=model, outcome=outcome)
+    metrics.SPAN_SECONDS.observe(elapsed, span=f"llm_{task}", outcome="ok" if outcome == "ok" else "error")
+    LLM_INPUT_TOKENS.inc(input_tokens, task=task, model=model)
+    LLM_OUTPUT_TOKENS.inc(output_tokens, task=task, model=model)
+    metrics.log_event(
+        "llm_call", task=task, model=model, outcome=outcome, latency_ms=round(elapsed * 1000, 1),
+        input_tokens=input_tokens, output_tokens=output_tokens, **fields
+    )
+
+def _record_result(task: str, source: str, reason: str = ""):
+    LLM_RESULTS.inc(task=task, source=source, reason=reason)
+    if source != "llm":
+        metrics.log_event("llm_fallback", task=task, source=source, reason=reason)
+
+def llm_metrics_snapshot() -> Dict[str, Any]:
+    """Per-model latency and tokens, parse failures, fallthroughs and fallback rates"""
+    rates = {}
+    for task in ("portfolios", "summary"):
+        total = LLM_RESULTS.total(task=task)
+        fallback = total - LLM_RESULTS.total(task=task, source="llm")
+        rates[task] = round(fallback / total, 4) if total else 0.0
+    return {
+        **metrics.snapshot("llm_"),
+        "fallback_rate": rates
+    }
+
+# ====================== END LLM INSTRUMENTATION ======================
+
+def _call_options(model: str, deadline: Optional[float]) -> Dict[str, Any]:
+    """
+    Extra arguments for one Claude call: a client timeout of the time left
+    before `deadline` (epoch seconds), so a hung request gives up with it.
+    Raises LLMTimeout if the deadline has already passed.
+    """
+    if deadline is None:
+        return {}
+    left = deadline - time.time()
+    if left <= 0:
+        raise LLMTimeout(f"{model}: deadline passed")
+    return {"timeout": left}
+
+def _check_deadline(model: str, deadline: Optional[float]):
+    if deadline is not None and time.time() > deadline:
+        raise LLMTimeout(f"{model}: deadline passed mid-stream")
+
+# ====================== LLM ROUTING ======================
+
+def _route_order(task: str, models: List[str]) -> List[str]:
+    """Primary, then hedge, then the task's remaining fallback models"""
+    route = ROUTING[task]
+    head = [route["primary"], route["hedge"]]
+    return head + [model for model in models if model not in head]
+
+def hedge_deadline(task: str) -> float:
+    """
+    Seconds to wait for the primary before hedging: its observed SLO
+    percentile latency. Primaries that were hedged over count at the time
+    they had run when the race ended (at least the deadline), so cancelling
+    slow primaries doesn't drag the percentile, and with it the deadline, down.
+    """
+    route = ROUTING[task]
+    match = {"task": task, "model": route["primary"]}
+    if LLM_PRIMARY_LATENCY.count(**match) < LLM_HEDGE_MIN_SAMPLES:
+        return route["default_deadline"]
+    return LLM_PRIMARY_LATENCY.percentile(route["percentile"], **match)
+
+def _take_hedge_budget() -> bool:
+    with _hedge_lock:
+        allowed = _hedge_budget["hedged"] + 1 <= LLM_HEDGE_BUDGET * _hedge_budget["routed"] + LLM_HEDGE_BURST
+        if allowed:
+            _hedge_budget["hedged"] += 1
+        return allowed
+
+def _race(task: str, attempt: Callable[[str, threading.Event], Any], primary: str, hedge: str,
+          keep_going: Callable[[Exception], bool]):
+    """
+    Run `attempt(model, cancel)` on the primary; start the hedge if the primary
+    is still running at the deadline (budget permitting), or has failed with
+    an error that is retryable and `keep_going` allows. The first attempt to
+    return wins and the other one is cancelled. Raises the last error if
+    both fail.
+    """
+    with _hedge_lock:
+        _hedge_budget["routed"] += 1
+    started = time.perf_counter()
+    cancels = {primary: CancelEvent()}
+    futures = {_llm_pool.submit(attempt, primary, cancels[primary]): primary}
+    primary_future = next(iter(futures))
+
+    def launch_hedge():
+        cancels[hedge] = CancelEvent()
+        futures[_llm_pool.submit(attempt, hedge, cancels[hedge])] = hedge
+
+    done, pending = wait(futures, timeout=hedge_deadline(task))
+    if pending:
+        if _take_hedge_budget():
+            LLM_HEDGES.inc(task=task, outcome="launched")
+            launch_hedge()
+        else:
+            LLM_HEDGES.inc(task=task, outcome="denied")
+
+    last_error = None
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                last_error = e
+                if hedge not in cancels and keep_going(e) and _retryable(e):
+                    launch_hedge()  # Primary failed outright: plain fallthrough
+                    pending = set(f for f in futures if not f.done())
+                continue
+            winner = futures[future]
+            if winner == primary or not primary_future.done():
+                # The primary's latency, or (hedged over) a lower bound on it
+                LLM_PRIMARY_LATENCY.observe(time.perf_counter() - started, task=task, model=primary)
+            for other in pending:
+                cancels[futures[other]].set()
+            if len(futures) > 1:
+                LLM_HEDGES.inc(task=task, outcome="hedge_won" if winner == hedge else "primary_won")
+            return result
+    raise last_error
+
+def _routed_call(task: str, models: List[str], attempt: Callable[[str, threading.Event], Any],
+                 keep_going: Callable[[Exception], bool]) -> Optional[Any]:
+    """
+    Hedged race between the task's primary and hedge models, then the rest of
+    `models` in order while `keep_going(error)` allows. None if all fail.
+    """
+    order = _route_order(task, models)
+    try:
+        return _race(task, attempt, order[0], order[1], keep_going)
+    except Exception as e:
+        if not keep_going(e):
+            return None
+    for model in order[2:]:
+        try:
+            return attempt(model, threading.Event())
+        except Exception as e:
+            if not keep_going(e):
+                return None
+    return None
+
+# ====================== END LLM ROUTING ======================
+
+# Stand-ins served when a market fetch fails, so the dashboard still renders
+FALLBACK_ETHERFI = {"apy": 4.5, "tvl_b": 2.70}
+FALLBACK_ETH_USD = 3000.0
+
+@metrics.timed("fetch_etherfi")
+def fetch_etherfi(fallback: bool = True) -> Optional[Dict[str, float]]:
+    """APY and TVL from DefiLlama; on failure FALLBACK_ETHERFI, or None with fallback=False"""
+    import requests
     url = "https://api.llama.fi/protocol/etherfi"
     try:
         r = requests.get(url, timeout=10)
@@ -16,9 +311,12 @@ def fetch_etherfi() -> Dict[str, float]:
         tvl_usd = float(data.get("tvlUsd"))
         return {"apy": apy, "tvl_b": round(tvl_usd/1e9, 2)}
     except Exception:
-        return {"apy": 4.5, "tvl_b": 2.70}
+        return dict(FALLBACK_ETHERFI) if fallback else None
 
-def fetch_eth_price_usd() -> float:
+@metrics.timed("fetch_eth_price")
+def fetch_eth_price_usd(fallback: bool = True) -> Optional[float]:
+    """ETH/USD from CoinGecko; on failure FALLBACK_ETH_USD, or None with fallback=False"""
+    import requests
     url = "https://api.coingecko.com/api/v3/simple/price?ids=ethereum&vs_currencies=usd"
     try:
         r = requests.get(url, timeout=10)
@@ -26,9 +324,43 @@ def fetch_eth_price_usd() -> float:
         data = r.json()
         return float(data["ethereum"]["usd"])
     except Exception:
-        return 3000.0
+        return FALLBACK_ETH_USD if fallback else None
 
-def generate_two_portfolios(profile: Dict[str, Any], market: Dict[str, Any]) -> Dict[str, Any]:
+@metrics.timed("fetch_factor_prices")
+def fetch_factor_prices() -> Dict[str, Optional[float]]:
+    """
+    BTC and S&P 500 prices for the backtester's market history. Unlike the
+    ETH price there's no made-up fallback: a failed fetch is None, so the
+    history gets a gap (forward-filled) instead of a fake price.
+    """
+    import requests
+    prices = {"btc_usd": None, "spx": None}
+    try:
+        r = requests.get("https://api.coingecko.com/api/v3/simple/price?ids=bitcoin&vs_currencies=usd", timeout=10)
+        r.raise_for_status()
+        prices["btc_usd"] = float(r.json()["bitcoin"]["usd"])
+    except Exception as e:
+        print(f"Could not fetch BTC price: {e}")
+    try:
+        # Symbol,Date,Close as CSV; no API key needed
+        r = requests.get("https://stooq.com/q/l/?s=%5Espx&f=sdc&h&e=csv", timeout=10)
+        r.raise_for_status()
+        prices["spx"] = float(r.text.strip().splitlines()[1].split(",")[2])
+    except Exception as e:
+        print(f"Could not fetch S&P 500 level: {e}")
+    return prices
+
+def generate_two_portfolios(profile: Dict[str, Any], market: Dict[str, Any],
+                            deadline: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Two portfolios from Claude, or from the engine if every model fails or
+    `deadline` (epoch seconds) passes first
+    """
+    return _generate_portfolios(profile, market, deadline)[0]
+
+def _generate_portfolios(profile: Dict[str, Any], market: Dict[str, Any],
+                         deadline: Optional[float] = None) -> Tuple[Dict[str, Any], str]:
+    """generate_two_portfolios, plus where they came from: "llm" or "fallback" (the engine)"""
     risk = profile.get("risk", "medium")
     eth_holdings = profile.get("eth_holdings", 5.0)
     goal = profile.get("goal", "steady yield")
@@ -37,15 +369,13 @@ def generate_two_portfolios(profile: Dict[str, Any], market: Dict[str, Any]) ->
     tvl = market.get("tvl_b", 2.7)
     eth_usd = market.get("eth_usd", 3000.0)
     
-    # Fallback portfolios if API fails
-    fallback_portfolios = _get_fallback_portfolios(risk, portfolio_type)
-    
     if not ANTHROPIC_API_KEY:
         print("No Anthropic API key, using fallback portfolios")
-        return fallback_portfolios
+        _record_result("portfolios", "fallback", "no_api_key")
+        return _get_fallback_portfolios(profile, market), "fallback"
     
     try:
-        client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+        client = _get_client()
         
         # Generate different prompts based on portfolio type
         if portfolio_type == "traditional":
@@ -162,187 +492,116 @@ Generate two portfolios using ether.fi protocols and asset classes:
 
 Generate the JSON now:"""
 
-        # Try newer models first
-        models_to_try = [
-            "claude-sonnet-4-20250514",
-            "claude-3-5-sonnet-20241022",
-            "claude-3-opus-20240229"
-        ]
-        
-        for model in models_to_try:
+        def attempt(model: str, cancel: threading.Event) -> Dict[str, Any]:
             try:
-                response = client.messages.create(
-                    model=model,
-                    max_tokens=1000,
-                    temperature=0.7,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                
-                response_text = getattr(response.content[0], "text", str(response.content))
-                print(f"Claude response (model: {model}):", response_text[:200])
-                
-                # Parse JSON from response
-                portfolios = _parse_portfolio_json(response_text)
-                
-                if portfolios:
-                    print(f"Successfully generated portfolios using {model}")
-                    return portfolios
-                    
+                portfolios = _stream_portfolios(client, model, prompt, cancel, deadline)
+            except PortfolioStreamError as e:
+                print(f"Rejected portfolio output from {model}: {e}")
+                LLM_FALLTHROUGH.inc(task="portfolios", model=model, reason="invalid")
+                raise
+            except (LLMCancelled, LLMTimeout):
+                raise
             except Exception as e:
-                if "not_found_error" in str(e) or "404" in str(e):
-                    continue  # Try next model
-                else:
+                LLM_FALLTHROUGH.inc(task="portfolios", model=model, reason=_error_outcome(e))
+                if _error_outcome(e) != "not_found":
                     print(f"Error with model {model}: {e}")
-                    continue
-        
-        # If all models fail, use fallback
-        print("All Claude models failed, using fallback portfolios")
-        return fallback_portfolios
+                raise
+            print(f"Successfully generated portfolios using {model}")
+            return portfolios
+
+        # Missing models, invalid output and transient errors fall through to the next one, until the deadline
+        portfolios = _routed_call("portfolios", PORTFOLIO_MODELS, attempt, keep_going=_retryable)
+        if portfolios is not None:
+            _record_result("portfolios", "llm")
+            return portfolios, "llm"
+
+        # If all models fail (or time runs out), use fallback
+        timed_out = deadline is not None and time.time() > deadline
+        print("Ran out of time for Claude, using fallback portfolios" if timed_out
+              else "All Claude models failed, using fallback portfolios")
+        _record_result("portfolios", "fallback", "timeout" if timed_out else "all_models_failed")
+        return _get_fallback_portfolios(profile, market), "fallback"
         
     except Exception as e:
         print(f"Error generating portfolios with AI: {e}")
-        return fallback_portfolios
+        _record_result("portfolios", "fallback", "error")
+        return _get_fallback_portfolios(profile, market), "fallback"
 
-def _parse_portfolio_json(response_text: str) -> Dict[str, Any]:
-    """Parse portfolio JSON from Claude response, handling markdown code blocks"""
+def _stream_portfolios(client, model: str, prompt: str, cancel: threading.Event = None,
+                       deadline: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Stream a completion through the incremental parser. Leaving the stream
+    as soon as the JSON object closes cancels the rest of the generation;
+    invalid output raises PortfolioStreamError before it is fully generated,
+    setting `cancel` (a hedged twin won) abandons it with LLMCancelled and
+    passing `deadline` abandons it with LLMTimeout.
+    """
+    parser = StreamingPortfolioParser()
+    started = time.perf_counter()
+    stream = None
     try:
-        # Remove markdown code blocks if present
-        text = response_text.strip()
-        if "```json" in text:
-            text = text.split("```json")[1].split("```")[0].strip()
-        elif "```" in text:
-            text = text.split("```")[1].split("```")[0].strip()
-        
-        # Parse JSON
-        portfolios = json.loads(text)
-        
-        # Validate structure
-        if not isinstance(portfolios, dict):
-            return None
-            
-        # Check that we have two portfolios
-        if len(portfolios) != 2:
-            return None
-        
-        # Validate each portfolio
-        for name, allocation in portfolios.items():
-            if not isinstance(allocation, dict):
-                return None
-            
-            # Check that we have at least some assets
-            if len(allocation) < 3:
-                return None
-            
-            # Check that allocations are numbers and sum to ~100
-            total = sum(allocation.values())
-            if not (95 <= total <= 105):  # Allow small rounding errors
-                # Normalize to 100
-                factor = 100.0 / total
-                for asset in allocation:
-                    allocation[asset] = round(allocation[asset] * factor)
-        
-        return portfolios
-        
-    except json.JSONDecodeError as e:
-        print(f"JSON decode error: {e}")
-        return None
+        with client.messages.stream(
+            model=model,
+            max_tokens=1000,
+            temperature=0.7,
+            messages=[{"role": "user", "content": prompt}],
+            **_call_options(model, deadline)
+        ) as stream:
+            _attach(cancel, stream)
+            for chunk in stream.text_stream:
+                if _cancelled(cancel):
+                    raise LLMCancelled(model)
+                _check_deadline(model, deadline)
+                if parser.feed(chunk):
+                    break
+        if _cancelled(cancel):
+            raise LLMCancelled(model)  # Stream closed under us by the winning twin
+        portfolios = parser.close()
+    except PortfolioStreamError as e:
+        LLM_PARSE_FAILURES.inc(model=model)
+        _record_llm_call("portfolios", model, started, "invalid", _stream_usage(stream, parser.chars_seen), error=str(e))
+        raise
     except Exception as e:
+        # Reading a stream the winner closed fails however the SDK sees fit; it's still a cancel
+        error = LLMCancelled(model) if _cancelled(cancel) else e
+        _record_llm_call("portfolios", model, started, _error_outcome(error), error=str(error))
+        raise error
+    _record_llm_call("portfolios", model, started, "ok", _stream_usage(stream, parser.chars_seen))
+    return portfolios
+
+def _parse_portfolio_json(response_text: str) -> Dict[str, Any]:
+    """Parse portfolio JSON from a complete Claude response, handling markdown code blocks"""
+    try:
+        return parse_stream([response_text])
+    except PortfolioStreamError as e:
         print(f"Error parsing portfolio JSON: {e}")
         return None
 
-def _get_fallback_portfolios(risk: str, portfolio_type: str = "etherfi-native") -> Dict[str, Any]:
-    """Fallback portfolios if AI generation fails"""
-    
-    if portfolio_type == "traditional":
-        # Traditional portfolios with simple asset classes
-        if risk == "low":
-            crypto_tilt = {"eETH": 20, "BTC/Alts": 10, "US Stocks": 40, "Cash/FD": 30}
-            balanced = {"eETH": 15, "BTC/Alts": 5, "US Stocks": 45, "Cash/FD": 35}
-        elif risk == "high":
-            crypto_tilt = {"eETH": 40, "BTC/Alts": 30, "US Stocks": 20, "Cash/FD": 10}
-            balanced = {"eETH": 35, "BTC/Alts": 25, "US Stocks": 30, "Cash/FD": 10}
-        else:  # medium
-            crypto_tilt = {"eETH": 30, "BTC/Alts": 20, "US Stocks": 30, "Cash/FD": 20}
-            balanced = {"eETH": 25, "BTC/Alts": 15, "US Stocks": 35, "Cash/FD": 25}
-        
-        return {
-            "Portfolio A — Crypto Tilt": crypto_tilt,
-            "Portfolio B — Balanced Traditional": balanced
-        }
-    else:
-        # ether.fi Native portfolios with protocols
-        if risk == "low":
-            etherfi_native = {
-                "weETH Staking": 35,
-                "Liquid Vaults": 10,
-                "Aave Integration": 20,
-                "Pendle Integration": 0,
-                "Gearbox Integration": 0,
-                "eBTC": 5,
-                "eUSD Stablecoins": 30
-            }
-            balanced = {
-                "weETH Staking": 25,
-                "Liquid Vaults": 5,
-                "Aave Integration": 15,
-                "eUSD Stablecoins": 35,
-                "US Stocks": 15,
-                "ether.fi Cash": 5
-            }
-        elif risk == "high":
-            etherfi_native = {
-                "weETH Staking": 25,
-                "Liquid Vaults": 30,
-                "Aave Integration": 15,
-                "Pendle Integration": 10,
-                "Gearbox Integration": 10,
-                "eBTC": 10,
-                "eUSD Stablecoins": 0
-            }
-            balanced = {
-                "weETH Staking": 30,
-                "Liquid Vaults": 25,
-                "Aave Integration": 15,
-                "eUSD Stablecoins": 10,
-                "US Stocks": 15,
-                "ether.fi Cash": 5
-            }
-        else:  # medium
-            etherfi_native = {
-                "weETH Staking": 30,
-                "Liquid Vaults": 20,
-                "Aave Integration": 15,
-                "Pendle Integration": 10,
-                "Gearbox Integration": 5,
-                "eBTC": 10,
-                "eUSD Stablecoins": 10
-            }
-            balanced = {
-                "weETH Staking": 25,
-                "Liquid Vaults": 15,
-                "Aave Integration": 20,
-                "eUSD Stablecoins": 20,
-                "US Stocks": 15,
-                "ether.fi Cash": 5
-            }
-        
+def _get_fallback_portfolios(profile: Dict[str, Any], market: Dict[str, Any]) -> Dict[str, Any]:
+    """Fallback portfolios if AI generation fails, from the mean-variance engine"""
+    from allocation import allocate_portfolios  # numpy, loaded on first use
+    return allocate_portfolios(profile, market)
+
+def instant_portfolios(profile: Dict[str, Any], market: Dict[str, Any]) -> Dict[str, Any]:
+    """Engine-only portfolios and the default summary, without calling Claude"""
+    from allocation import allocate_portfolios
     return {
-            "Portfolio A — ether.fi Native": etherfi_native,
-            "Portfolio B — Balanced Yield": balanced
+        "portfolios": allocate_portfolios(profile, market),
+        "summary": _default_summary(profile, market)
     }
 
-def llm_summary(profile: Dict[str, Any], market: Dict[str, Any], portfolios: Dict[str, Any]) -> str:
+def _default_summary(profile: Dict[str, Any], market: Dict[str, Any]) -> str:
     apy = market.get("apy"); tvl = market.get("tvl_b"); eth = market.get("eth_usd")
-    text = (
+    return (
         f"For a {profile.get('risk')} risk user holding {profile.get('eth_holdings')} ETH at ${eth:,.2f}, "
         f"EtherFi APY is {apy}% and TVL is {tvl}B. Two illustrative portfolios: "
         "A (Crypto Tilt) favors eETH and BTC/Alts; B (Conservative Income) favors Cash/FD and US Stocks. "
         "Educational guidance only — not financial advice."
     )
-    if not ANTHROPIC_API_KEY:
-        return text
-    client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
-    prompt = f"""
+
+def _summary_prompt(profile: Dict[str, Any], market: Dict[str, Any], portfolios: Dict[str, Any]) -> str:
+    apy = market.get("apy"); tvl = market.get("tvl_b"); eth = market.get("eth_usd")
+    return f"""
 You are a cautious DeFi/finance explainer. Summarize the two portfolios (A and B) below for a beginner.
 Avoid advice; be educational and concise (<=100 words).
 
@@ -350,30 +609,141 @@ User: {profile}
 Market: EtherFi APY {apy}%, TVL {tvl}B, ETH ${eth}
 Portfolios: {portfolios}
 """
-    # Try newer model first, fallback to older models if needed
-    models_to_try = [
-        "claude-sonnet-4-20250514",
-        "claude-3-5-sonnet-20241022",
-        "claude-3-opus-20240229",
-        "claude-3-haiku-20240307"
-    ]
-    for model in models_to_try:
+
+def llm_summary(profile: Dict[str, Any], market: Dict[str, Any], portfolios: Dict[str, Any],
+                deadline: Optional[float] = None) -> str:
+    text = _default_summary(profile, market)
+    if not ANTHROPIC_API_KEY:
+        _record_result("summary", "default", "no_api_key")
+        return text
+    client = _get_client()
+    prompt = _summary_prompt(profile, market, portfolios)
+    errors = []
+
+    def attempt(model: str, cancel: threading.Event) -> str:
         try:
-            resp = client.messages.create(
+            return _collect_summary(client, model, prompt, cancel, deadline)
+        except LLMCancelled:
+            raise
+        except LLMTimeout as e:
+            errors.append(e)
+            raise
+        except Exception as e:
+            LLM_FALLTHROUGH.inc(task="summary", model=model, reason=_error_outcome(e))
+            errors.append(e)
+            raise
+
+    def keep_going(e: Exception) -> bool:
+        # Only a missing model moves on; auth, rate limit etc. return the default text
+        return _error_outcome(e) == "not_found"
+
+    summary = _routed_call("summary", SUMMARY_MODELS, attempt, keep_going)
+    if summary is not None:
+        _record_result("summary", "llm")
+        return summary
+    if errors and isinstance(errors[-1], LLMTimeout):
+        _record_result("summary", "default", "timeout")
+    elif errors and not keep_going(errors[-1]):
+        _record_result("summary", "default", "error")
+    else:
+        _record_result("summary", "default", "all_models_failed")
+    return text
+
+def _collect_summary(client, model: str, prompt: str, cancel: threading.Event = None,
+                     deadline: Optional[float] = None) -> str:
+    """Stream one summary to completion; streaming lets a losing hedge (or an overdue call) be abandoned"""
+    started = time.perf_counter()
+    stream = None
+    parts = []
+    try:
+        with client.messages.stream(
+            model=model,
+            max_tokens=300,
+            temperature=0.3,
+            messages=[{"role":"user","content":prompt}],
+            **_call_options(model, deadline)
+        ) as stream:
+            _attach(cancel, stream)
+            for chunk in stream.text_stream:
+                if _cancelled(cancel):
+                    raise LLMCancelled(model)
+                _check_deadline(model, deadline)
+                parts.append(chunk)
+        if _cancelled(cancel):
+            raise LLMCancelled(model)
+    except Exception as e:
+        error = LLMCancelled(model) if _cancelled(cancel) else e
+        _record_llm_call("summary", model, started, _error_outcome(error), _stream_usage(stream, sum(map(len, parts))),
+                         error=str(error))
+        raise error
+    _record_llm_call("summary", model, started, "ok", _stream_usage(stream, sum(map(len, parts))))
+    return "".join(parts)
+
+def stream_llm_summary(profile: Dict[str, Any], market: Dict[str, Any], portfolios: Dict[str, Any]) -> Iterator[str]:
+    """
+    Yield the portfolio summary as text chunks while Claude generates it.
+    Falls back to the default text in one chunk, like llm_summary.
+    """
+    text = _default_summary(profile, market)
+    if not ANTHROPIC_API_KEY:
+        _record_result("summary", "default", "no_api_key")
+        yield text
+        return
+    client = _get_client()
+    prompt = _summary_prompt(profile, market, portfolios)
+    # Chunks go straight to the client, so this can't be hedged; it still starts with the routed primary
+    for model in _route_order("summary", SUMMARY_MODELS):
+        started = time.perf_counter()
+        stream = None
+        chars = 0
+        try:
+            with client.messages.stream(
                 model=model,
                 max_tokens=300,
                 temperature=0.3,
                 messages=[{"role":"user","content":prompt}],
-            )
-            return getattr(resp.content[0], "text", str(resp.content))
+            ) as stream:
+                for chunk in stream.text_stream:
+                    if not chars:
+                        # What the user waits for before any of the summary shows up
+                        LLM_FIRST_CHUNK.observe(time.perf_counter() - started, task="summary", model=model)
+                    chars += len(chunk)
+                    yield chunk
+            _record_llm_call("summary", model, started, "ok", _stream_usage(stream, chars), streamed=True)
+            _record_result("summary", "llm")
+            return
         except Exception as e:
+            _record_llm_call("summary", model, started, _error_outcome(e), _stream_usage(stream, chars),
+                             streamed=True, error=str(e))
+            if chars:
+                # Part of the summary is already out; can't restart with another model
+                print(f"Summary stream from {model} interrupted: {e}")
+                _record_result("summary", "llm", "interrupted")
+                return
+            LLM_FALLTHROUGH.inc(task="summary", model=model, reason=_error_outcome(e))
             if "not_found_error" in str(e) or "404" in str(e):
                 continue  # Try next model
             else:
-                # Other error (auth, rate limit, etc.) - return default text
-                return text
-    # If all models fail, return default text
-    return text
+                _record_result("summary", "default", "error")
+                yield text
+                return
+    _record_result("summary", "default", "all_models_failed")
+    yield text
+
+def generate_with_summary(profile: Dict[str, Any], market: Dict[str, Any],
+                          deadline: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Run portfolio generation and the LLM summary for one profile; with a
+    `deadline` (epoch seconds) every Claude call is cut off by then. `source`
+    says whether the portfolios came from Claude ("llm") or the engine ("fallback")
+    """
+    portfolios, source = _generate_portfolios(profile, market, deadline)
+    summary = llm_summary(profile, market, portfolios, deadline)
+    return {
+        "portfolios": portfolios,
+        "summary": summary,
+        "source": source
+    }
 
 def reward_split(total_reward: float) -> Dict[str, float]:
     """
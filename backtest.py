@@ -0,0 +1,315 @@
+"""
+Backtester for stored recommendations
+Replays a recorded daily market series against both portfolios of every
+decided recommendation over its time limit, then scores which portfolio
+actually did better and which brokers' votes were right in hindsight
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import date, datetime
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from assets import ASSET_PARAMS
+from utils import file_lock, load_store, write_json_atomic
+
+MARKET_HISTORY_PATH = 'data/market_history.json'
+BACKTEST_PATH = 'data/backtest.json'
+# Price series driving the three factors in ASSET_PARAMS loadings
+FACTOR_SERIES = ("eth_usd", "btc_usd", "spx")
+DEFAULT_APY = 4.5
+# Today's ETH price and APY are refreshed at most this often; new fields are added at once
+MARKET_SNAPSHOT_SECONDS = float(os.getenv("MARKET_SNAPSHOT_SECONDS", "3600"))
+
+ASSETS = list(ASSET_PARAMS)
+LOADINGS = np.array([ASSET_PARAMS[a]["loadings"] for a in ASSETS])
+APY_LINKED = np.array([ASSET_PARAMS[a]["apy_linked"] for a in ASSETS])
+# Yield earned on top of price moves (%/yr): the APY spread for staking assets,
+# the whole expected return for assets with no price exposure
+CARRY_PCT = np.array([
+    ASSET_PARAMS[a]["ret"] if ASSET_PARAMS[a]["apy_linked"] or not any(ASSET_PARAMS[a]["loadings"]) else 0.0
+    for a in ASSETS
+])
+
+# ====================== MARKET HISTORY ======================
+
+def load_market_history(path: str = MARKET_HISTORY_PATH) -> List[Dict[str, Any]]:
+    """Daily rows {date, eth_usd, btc_usd, spx, apy}, oldest first"""
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        rows = json.load(f)
+    return sorted(rows, key=lambda row: row["date"])
+
+def record_market_snapshot(market: Dict[str, Any], path: str = MARKET_HISTORY_PATH, day: str = None) -> bool:
+    """
+    Upsert today's row with whatever prices `market` has ({eth_usd, apy, ...}).
+    Values the row already has are refreshed at most every MARKET_SNAPSHOT_SECONDS;
+    the file is replaced atomically under a lock, as every worker records. Returns
+    whether it was written.
+    """
+    day = day or date.today().isoformat()
+    fields = [field for field in FACTOR_SERIES + ("apy",) if market.get(field) is not None]
+    try:
+        recent = time.time() - os.path.getmtime(path) < MARKET_SNAPSHOT_SECONDS
+    except FileNotFoundError:
+        recent = False
+    with file_lock(path):
+        rows = {row["date"]: row for row in load_market_history(path)}
+        row = rows.setdefault(day, {"date": day})
+        if recent:
+            fields = [field for field in fields if row.get(field) is None]
+        before = dict(row)
+        for field in fields:
+            row[field] = float(market[field])
+        if row == before:
+            return False
+        write_json_atomic(path, [rows[d] for d in sorted(rows)])
+        return True
+
+def missing_today(fields, path: str = MARKET_HISTORY_PATH, day: str = None) -> List[str]:
+    """Which of `fields` today's row doesn't have yet (all of them if there is no row)"""
+    day = day or date.today().isoformat()
+    row = next((row for row in load_market_history(path) if row["date"] == day), {})
+    return [field for field in fields if row.get(field) is None]
+
+# (history file, day) -> fields this process already tried to fetch that day, successfully or not
+_fetched_today: Dict[Tuple[str, str], set] = {}
+
+def factors_to_fetch(fields, path: str = MARKET_HISTORY_PATH, day: str = None) -> List[str]:
+    """
+    missing_today, less what this process has already tried today: a fetch
+    that failed isn't retried on every request, only the next day
+    """
+    day = day or date.today().isoformat()
+    for old in [key for key in _fetched_today if key[1] != day]:
+        del _fetched_today[old]
+    tried = _fetched_today.setdefault((os.path.abspath(path), day), set())
+    wanted = [field for field in missing_today(fields, path, day) if field not in tried]
+    tried.update(wanted)
+    return wanted
+
+def _series(rows: List[Dict[str, Any]], field: str, default: float) -> np.ndarray:
+    """Column as floats, forward-filled (back-filled before the first value)"""
+    values = np.array([np.nan if row.get(field) is None else row[field] for row in rows], dtype=float)
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return np.full(len(rows), default)
+    index = np.where(valid, np.arange(len(values)), 0)
+    np.maximum.accumulate(index, out=index)
+    filled = values[index]
+    filled[:np.argmax(valid)] = values[np.argmax(valid)]
+    return filled
+
+def _first_observed(rows: List[Dict[str, Any]], field: str) -> int:
+    """Index of the first row with a value for `field` (len(rows) if there is none)"""
+    return next((i for i, row in enumerate(rows) if row.get(field) is not None), len(rows))
+
+def market_paths(rows: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (dates as datetime64[D], cumulative log price per factor (T, 3),
+    cumulative APY accrued as a fraction (T,), index of each factor's first
+    real observation (3,)) so any window's return is a difference of two
+    rows. Factors with no data at all are flat. Rows are only recorded on
+    days someone asked for market data, so each row's APY accrues over the
+    days until the next row, not over one day.
+    """
+    dates = np.array([row["date"] for row in rows], dtype="datetime64[D]")
+    log_prices = np.stack([np.log(_series(rows, field, 1.0)) for field in FACTOR_SERIES], axis=1)
+    apy = _series(rows, "apy", DEFAULT_APY)
+    gaps = np.diff(dates).astype(int)
+    accrued = np.concatenate([[0.0], np.cumsum(apy[:-1] / 100.0 / 365.0 * gaps)])
+    observed_from = np.array([_first_observed(rows, field) for field in FACTOR_SERIES])
+    return dates, log_prices, accrued, observed_from
+
+# ====================== SCORING ======================
+
+def _decision_start(decision: Dict[str, Any]):
+    timestamp = decision.get("timestamp")
+    if not timestamp:
+        return None
+    return np.datetime64(datetime.fromisoformat(timestamp).date(), "D")
+
+def score_windows(allocations: np.ndarray, starts: np.ndarray, days: np.ndarray,
+                  dates: np.ndarray, log_prices: np.ndarray, accrued: np.ndarray,
+                  observed_from: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Realized buy-and-hold return (fraction) of each allocation row ((N, assets)
+    weights summing to 1 over ASSETS) from its start date for `days` days,
+    all rows at once, measured from the first row on or after its start to
+    the last row on or before its end. Returns (returns, complete) where `complete` is False
+    when the history doesn't reach the end of the window yet, or (given
+    `observed_from`) has no price at its start for a factor the allocation
+    is exposed to.
+    """
+    start_idx = np.minimum(np.searchsorted(dates, starts), len(dates) - 1)
+    end_dates = starts + days.astype("timedelta64[D]")
+    end_idx = np.minimum(np.searchsorted(dates, end_dates, side="right") - 1, len(dates) - 1)
+    # A gap may skip the end date itself; any later row means the window is over
+    complete = dates[-1] >= end_dates
+    if observed_from is not None:
+        exposed = np.abs(allocations @ LOADINGS) > 0  # (N, 3)
+        unobserved = start_idx[:, None] < observed_from[None, :]
+        complete &= ~(exposed & unobserved).any(axis=1)
+    end_idx = np.maximum(end_idx, start_idx)
+
+    factor_returns = np.exp(log_prices[end_idx] - log_prices[start_idx]) - 1.0  # (N, 3)
+    elapsed_years = (dates[end_idx] - dates[start_idx]).astype(int) / 365.0
+    apy_accrued = accrued[end_idx] - accrued[start_idx]
+    asset_returns = (factor_returns @ LOADINGS.T
+                     + APY_LINKED[None, :] * apy_accrued[:, None]
+                     + CARRY_PCT[None, :] / 100.0 * elapsed_years[:, None])
+    return (allocations * asset_returns).sum(axis=1), complete
+
+def backtest(store: Dict[str, Any], rows: List[Dict[str, Any]], previous: Dict[str, Any] = None,
+             full: bool = False) -> Dict[str, Any]:
+    """
+    Score every decided recommendation whose decision changed (or whose
+    window wasn't complete) since `previous`; reuse the rest. Returns
+    {"recs": {rec_id: result}, "brokers": {broker_id: stats}, "rescored": n}.
+    """
+    cached = {} if full or not previous else dict(previous.get("recs", {}))
+    decisions = store.get("decisions", {})
+    todo = []
+    for rec_id, decision in decisions.items():
+        old = cached.get(rec_id)
+        if old and old.get("complete") and old.get("seq") == decision.get("seq", 0):
+            continue
+        start = _decision_start(decision)
+        portfolios = store.get("recs", {}).get(rec_id, {}).get("portfolios", {})
+        if start is None or not portfolios or not rows:
+            continue
+        todo.append((rec_id, decision, start, portfolios))
+    # Decisions that vanished from the store drop out of the results
+    cached = {rec_id: result for rec_id, result in cached.items() if rec_id in decisions}
+
+    if todo:
+        dates, log_prices, accrued, observed_from = market_paths(rows)
+        keys, weights, starts, days = [], [], [], []
+        for rec_id, decision, start, portfolios in todo:
+            for name, allocation in portfolios.items():
+                row = np.array([float(allocation.get(asset, 0.0)) for asset in ASSETS])
+                if row.sum() <= 0:
+                    continue
+                keys.append((rec_id, name))
+                weights.append(row / row.sum())
+                starts.append(start)
+                days.append(int(decision.get("time_limit_days", 30)))
+        realized: Dict[str, Dict[str, Any]] = {}
+        returns, complete = score_windows(np.array(weights).reshape(len(keys), len(ASSETS)),
+                                          np.array(starts, dtype="datetime64[D]"),
+                                          np.array(days, dtype=int), dates, log_prices, accrued, observed_from)
+        for (rec_id, name), ret, done in zip(keys, returns, complete):
+            entry = realized.setdefault(rec_id, {"returns_pct": {}, "complete": True})
+            entry["returns_pct"][name] = round(float(ret) * 100.0, 4)
+            entry["complete"] = entry["complete"] and bool(done)
+        for rec_id, decision, start, portfolios in todo:
+            if rec_id in realized:
+                cached[rec_id] = _rec_result(decision, start, realized[rec_id])
+
+    return {
+        "recs": cached,
+        "brokers": _broker_stats(store, cached),
+        "rescored": len(todo),
+        "history_end": rows[-1]["date"] if rows else None
+    }
+
+def _rec_result(decision: Dict[str, Any], start, realized: Dict[str, Any]) -> Dict[str, Any]:
+    returns = realized["returns_pct"]
+    top = max(returns.values())
+    # A tie (e.g. two flat portfolios) has no best portfolio
+    leaders = [name for name, value in returns.items() if value == top]
+    best = leaders[0] if len(leaders) == 1 else None
+    chosen = decision.get("decision")
+    initial = decision.get("profit_info", {}).get("initial_investment", 0.0)
+    return {
+        "seq": decision.get("seq", 0),
+        "start": str(start),
+        "time_limit_days": int(decision.get("time_limit_days", 30)),
+        "complete": realized["complete"],
+        "returns_pct": returns,
+        "best": best,
+        "chosen": chosen,
+        "chosen_was_best": chosen == best if best else None,
+        "realized_profit": round(initial * returns[chosen] / 100.0, 2) if chosen in returns else None,
+        "expected_profit": decision.get("profit_info", {}).get("profit")
+    }
+
+def _broker_stats(store: Dict[str, Any], results: Dict[str, Any]) -> Dict[str, Any]:
+    """Per broker: how often their vote was the portfolio that did better, and by how much"""
+    stats: Dict[str, Dict[str, Any]] = {}
+    for rec_id, result in results.items():
+        if not result["complete"] or len(result["returns_pct"]) < 2 or result["best"] is None:
+            continue
+        returns = result["returns_pct"]
+        for broker_key, vote in store.get("broker_votes", {}).get(rec_id, {}).items():
+            choice = vote.get("choice")
+            if choice not in returns:
+                continue
+            others = [value for name, value in returns.items() if name != choice]
+            entry = stats.setdefault(broker_key, {
+                "username": vote.get("broker_username"), "scored_votes": 0, "correct": 0, "edge_pct_total": 0.0
+            })
+            entry["scored_votes"] += 1
+            entry["correct"] += int(choice == result["best"])
+            entry["edge_pct_total"] += returns[choice] - sum(others) / len(others)
+    for entry in stats.values():
+        entry["hit_rate"] = round(entry["correct"] / entry["scored_votes"], 4)
+        entry["avg_edge_pct"] = round(entry.pop("edge_pct_total") / entry["scored_votes"], 4)
+    return stats
+
+# ====================== INCREMENTAL RUNS ======================
+
+def load_results(path: str = BACKTEST_PATH) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def run_backtest(full: bool = False, history_path: str = MARKET_HISTORY_PATH,
+                 results_path: str = BACKTEST_PATH) -> Dict[str, Any]:
+    """Rescore new or changed decisions against the recorded history and save the results"""
+    results = backtest(load_store(), load_market_history(history_path), load_results(results_path), full)
+    os.makedirs(os.path.dirname(results_path) or '.', exist_ok=True)
+    with open(results_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    return results
+
+# The API's last results, per process; it never writes the results file
+_latest: Dict[str, Any] = {}
+_latest_lock = threading.Lock()
+
+def latest_results(full: bool = False, history_path: str = MARKET_HISTORY_PATH,
+                   results_path: str = BACKTEST_PATH) -> Dict[str, Any]:
+    """
+    run_backtest for the API: rescores incrementally from this process's
+    previous results (or the file the CLI saved) and keeps them in memory
+    """
+    with _latest_lock:
+        previous = _latest.get("results") or load_results(results_path)
+        results = backtest(load_store(), load_market_history(history_path), previous, full)
+        _latest["results"] = results
+    return results
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Backtest decided recommendations against recorded market history")
+    parser.add_argument("--history", default=MARKET_HISTORY_PATH, help="JSON list of daily {date, eth_usd, btc_usd, spx, apy}")
+    parser.add_argument("--out", default=BACKTEST_PATH, help="Where results are kept between runs")
+    parser.add_argument("--full", action="store_true", help="Rescore every decision, not just new ones")
+    args = parser.parse_args(argv)
+
+    results = run_backtest(args.full, args.history, args.out)
+    print(f"Rescored {results['rescored']} decisions; {len(results['recs'])} scored, "
+          f"history through {results['history_end']}")
+    for broker_key, entry in sorted(results["brokers"].items(), key=lambda item: -item[1]["hit_rate"]):
+        print(f"  {entry['username'] or broker_key}: {entry['correct']}/{entry['scored_votes']} right, "
+              f"avg edge {entry['avg_edge_pct']:+.2f}%")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
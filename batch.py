@@ -0,0 +1,142 @@
+"""
+Batch portfolio generation for whole user segments
+Deduplicates identical profiles, runs generation with a bounded number of
+parallel upstream calls and yields results as they complete
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List
+
+from backend import generate_with_summary
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+# Per API request; every item is up to two paid Claude calls (the CLI has no cap)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+
+RISK_LEVELS = ["low", "medium", "high"]
+PORTFOLIO_TYPES = ["etherfi-native", "traditional"]
+
+def profile_key(profile: Dict[str, Any], market: Dict[str, Any]) -> str:
+    """Canonical key for a (profile, market) pair; identical pairs are generated once"""
+    return json.dumps({"profile": profile, "market": market}, sort_keys=True)
+
+def _generate_one(profile: Dict[str, Any], market: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        # "source" is "fallback" when backend fell back to the engine on its own
+        result = generate_with_summary(profile, market)
+    except Exception as e:
+        print(f"Batch item failed, using engine fallback: {e}")
+        from allocation import allocate_portfolios  # numpy, loaded on first use
+        result = {
+            "portfolios": allocate_portfolios(profile, market),
+            "summary": "",
+            "source": "fallback",
+            "error": str(e)
+        }
+    return result
+
+def count_generations(items: List[Dict[str, Any]], market: Dict[str, Any] = None) -> int:
+    """How many generations generate_batch will run for `items` (identical pairs count once)"""
+    return len({profile_key(item.get("profile", {}), item.get("market") or market or {}) for item in items})
+
+def generate_batch(items: List[Dict[str, Any]], market: Dict[str, Any] = None,
+                   concurrency: int = BATCH_CONCURRENCY) -> Iterator[Dict[str, Any]]:
+    """
+    Generate portfolios for every item ({"id", "profile", "market"}; `market`
+    defaults to the shared one). Yields one result per item, in completion
+    order, with at most `concurrency` generations in flight.
+    """
+    market = market or {}
+    groups: Dict[str, List[int]] = {}
+    pairs = []
+    for index, item in enumerate(items):
+        pair = (item.get("profile", {}), item.get("market") or market)
+        key = profile_key(*pair)
+        if key not in groups:
+            groups[key] = []
+            pairs.append((key, pair))
+        groups[key].append(index)
+
+    workers = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as pool:
+        futures = {pool.submit(_generate_one, *pair): key for key, pair in pairs}
+        for future in as_completed(futures):
+            result = future.result()
+            indices = groups[futures[future]]
+            for position, index in enumerate(indices):
+                yield {
+                    "index": index,
+                    "id": items[index].get("id"),
+                    "deduplicated": position > 0,
+                    **result
+                }
+
+def segment_items(users: List[Dict[str, Any]], risks: List[str] = None,
+                  portfolio_types: List[str] = None, goal: str = "steady yield") -> List[Dict[str, Any]]:
+    """One batch item per user x risk level x portfolio type"""
+    items = []
+    for user in users:
+        for risk in risks or RISK_LEVELS:
+            for portfolio_type in portfolio_types or PORTFOLIO_TYPES:
+                items.append({
+                    "id": f"{user['username']}:{risk}:{portfolio_type}",
+                    "profile": {
+                        "eth_holdings": user["eth_holdings"],
+                        "risk": risk,
+                        "goal": goal,
+                        "portfolio_type": portfolio_type
+                    }
+                })
+    return items
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Precompute portfolio recommendations for a user segment")
+    parser.add_argument("--input", help="JSON file with a list of {id, profile, market} items")
+    parser.add_argument("--seed-users", action="store_true", help="Use the users from seed_database.py")
+    parser.add_argument("--risks", default=",".join(RISK_LEVELS), help="Comma-separated risk levels for --seed-users")
+    parser.add_argument("--types", default=",".join(PORTFOLIO_TYPES), help="Comma-separated portfolio types for --seed-users")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Max parallel generations")
+    parser.add_argument("--offline", action="store_true", help="Use default market data instead of fetching it")
+    parser.add_argument("--stub", action="store_true", help="Answer LLM calls from the local stub (no API key needed)")
+    parser.add_argument("--out", help="Write JSON lines here instead of stdout")
+    args = parser.parse_args(argv)
+
+    if args.input:
+        with open(args.input) as f:
+            items = json.load(f)
+    elif args.seed_users:
+        from seed_database import SEED_USERS
+        items = segment_items(SEED_USERS, args.risks.split(","), args.types.split(","))
+    else:
+        parser.error("pass --input or --seed-users")
+
+    if args.stub:
+        import llm_stub
+        llm_stub.install(llm_stub.StubAnthropic())
+
+    if args.offline:
+        market = {"apy": 4.5, "tvl_b": 2.7, "eth_usd": 3000.0}
+    else:
+        from backend import fetch_etherfi, fetch_eth_price_usd
+        market = {**fetch_etherfi(), "eth_usd": fetch_eth_price_usd()}
+
+    out = open(args.out, "w") if args.out else sys.stdout
+    try:
+        # backend logs with print(); keep them off the JSON lines
+        with contextlib.redirect_stdout(sys.stderr):
+            for result in generate_batch(items, market, args.concurrency):
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+    finally:
+        if args.out:
+            out.close()
+    print(f"Generated {len(items)} items", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""
+Offline benchmark suite for api_server
+Drives the app through the Flask test client against synthetic stores (1k
+to 1M recommendations) in a throwaway directory, with Claude and the market
+APIs stubbed, and reports throughput and p50/p95/p99 latency per endpoint.
+Results can be saved as a baseline and later runs checked against it.
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import backend
+import database
+import llm_stub
+import ratelimit
+import settlement
+import utils
+from measure_payloads import synthetic_recs
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_BASELINE_PATH = os.path.join(HERE, 'benchmarks', 'baseline.json')
+DEFAULT_SIZES = (1_000, 10_000)
+BROKERS = 20
+# A run regresses when p50 is this much slower (or throughput this much lower) than the baseline
+DEFAULT_TOLERANCE = 0.5
+PASSWORD = "bench-password"
+
+@contextlib.contextmanager
+def offline_app(workdir: str):
+    """api_server.app with its store and database in `workdir` and no network or Claude calls"""
+    import api_server
+    patches = [
+        (database, "DB_PATH", os.path.join(workdir, "auth.db")),
+        (backend, "_get_client", lambda: llm_stub.StubAnthropic()),
+        (backend, "ANTHROPIC_API_KEY", "stub-key"),
+        (api_server, "fetch_etherfi", lambda **kwargs: {"apy": 4.5, "tvl_b": 2.7}),
+        (api_server, "fetch_eth_price_usd", lambda **kwargs: 3000.0),
+        (api_server, "fetch_factor_prices", lambda: {"btc_usd": 60000.0, "spx": 5000.0}),
+        # Settlement is its own benchmark (python settlement.py); keep its thread out of the timings
+        (settlement.settlement_worker, "nudge", lambda: None),
+        # Measures the handlers, not admission control turning the benchmark away
+        (ratelimit.limiter, "enabled", False),
+    ]
+    saved = [(target, name, getattr(target, name)) for target, name, _ in patches]
+    cwd = os.getcwd()
+    try:
+        for target, name, value in patches:
+            setattr(target, name, value)
+        os.chdir(workdir)
+        yield api_server.create_app()
+    finally:
+        os.chdir(cwd)
+        for target, name, value in saved:
+            setattr(target, name, value)
+
+def seed(size: int, seed_value: int = 7) -> Dict[str, Any]:
+    """
+    Users, brokers and a store of `size` recommendations where every broker
+    has voted on a slice of them and about half are decided. Returns the
+    ids the scenarios need.
+    """
+    rng = random.Random(seed_value)
+    user = database.create_user("bench_user", "bench_user@example.com", PASSWORD, 5.0)
+    brokers = [database.create_broker(f"bench_broker{i}", f"bench_broker{i}@example.com", PASSWORD)["broker_id"]
+               for i in range(BROKERS)]
+
+    recs = synthetic_recs(size, seed_value)
+    store = {"users": {}, "recs": recs, "recommendations": {}, "votes": {}, "broker_votes": {},
+             "decisions": {}, "feedback": {}, "market": {}}
+    for rec_id in recs:
+        voters = rng.sample(brokers, 2)
+        choices = [rng.choice(["Portfolio A", "Portfolio B"]) for _ in voters]
+        store["votes"][rec_id] = {}
+        for choice in choices:
+            store["votes"][rec_id][choice] = store["votes"][rec_id].get(choice, 0) + 1
+        store["broker_votes"][rec_id] = {
+            str(broker_id): {"broker_id": broker_id, "broker_username": f"bench_broker{broker_id - 1}", "choice": choice}
+            for broker_id, choice in zip(voters, choices)
+        }
+        if rng.random() < 0.5:
+            store["decisions"][rec_id] = {
+                "decision": rng.choice(["Portfolio A", "Portfolio B"]),
+                "time_limit_days": 30,
+                "profit_info": {"initial_investment": 15000.0, "profit": 98.63},
+                "reward_split": {"user": 88.77, "broker": 6.9, "platform": 2.96},
+                "timestamp": "2025-01-01T00:00:00"
+            }
+    utils.save_store(store)
+    return {"user_id": user["user_id"], "broker_id": brokers[0], "rec_ids": list(recs)}
+
+def _scenarios(client, ids: Dict[str, Any], rng: random.Random) -> List[Tuple[str, Callable[[], Any]]]:
+    """(name, one request) per endpoint; reads first so conditional polls see stable versions"""
+    login = {"username": "bench_user", "password": PASSWORD}
+    user_token = client.post('/api/auth/login/user', json=login).get_json()["token"]
+    broker_token = client.post('/api/auth/login/broker', json={"username": "bench_broker0", "password": PASSWORD}).get_json()["token"]
+    user_auth = {"Authorization": f"Bearer {user_token}"}
+    broker_auth = {"Authorization": f"Bearer {broker_token}"}
+    rec_ids = ids["rec_ids"]
+    polled = rec_ids[0]
+    rec_etag = client.get(f'/api/recommendation/{polled}').headers["ETag"]
+    list_etag = client.get('/api/recommendations').headers["ETag"]
+
+    return [
+        ("login", lambda: client.post('/api/auth/login/user', json=login)),
+        ("validate", lambda: client.get('/api/auth/validate', headers=user_auth)),
+        ("poll_recommendation", lambda: client.get(f'/api/recommendation/{polled}')),
+        ("poll_recommendation_304", lambda: client.get(f'/api/recommendation/{polled}', headers={"If-None-Match": rec_etag})),
+        ("poll_recommendations", lambda: client.get('/api/recommendations')),
+        ("poll_recommendations_304", lambda: client.get('/api/recommendations', headers={"If-None-Match": list_etag})),
+        ("broker_earnings", lambda: client.get('/api/broker/earnings', headers=broker_auth)),
+        ("broker_profile", lambda: client.get(f'/api/broker/profile/{ids["broker_id"]}')),
+        ("vote", lambda: client.post('/api/vote', headers=broker_auth,
+                                     json={"rec_id": rng.choice(rec_ids), "choice": "Portfolio A"})),
+        ("decision", lambda: client.post('/api/decision', headers=user_auth,
+                                         json={"rec_id": rng.choice(rec_ids), "decision": "Portfolio B"})),
+    ]
+
+def _summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    def pct(q):
+        return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 3)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+
+def run_size(size: int, requests: int, seconds: float) -> Dict[str, Any]:
+    """Every scenario against a fresh store of `size` recs: up to `requests` calls or `seconds` each"""
+    with tempfile.TemporaryDirectory(prefix="etherfi-bench-") as workdir, offline_app(workdir) as app:
+        ids = seed(size)
+        client = app.test_client()
+        results = {}
+        for name, call in _scenarios(client, ids, random.Random(size)):
+            latencies, errors = [], 0
+            started = time.perf_counter()
+            while len(latencies) < max(3, requests) and (len(latencies) < 3 or time.perf_counter() - started < seconds):
+                begin = time.perf_counter()
+                response = call()
+                latencies.append(time.perf_counter() - begin)
+                errors += response.status_code >= 400
+            results[name] = _summarize(latencies, errors, time.perf_counter() - started)
+        return results
+
+def run_benchmark(sizes=DEFAULT_SIZES, requests: int = 200, seconds: float = 5.0) -> Dict[str, Any]:
+    """{str(size): {scenario: {requests, errors, rps, p50_ms, p95_ms, p99_ms}}}"""
+    return {str(size): run_size(size, requests, seconds) for size in sizes}
+
+# ====================== STARTUP ======================
+
+# Runs in a fresh interpreter: what a gunicorn worker (without preload) or a
+# test session pays before it can answer its first request
+STARTUP_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import api_server
+imported = time.perf_counter()
+import database
+database.DB_PATH = sys.argv[1]
+app = api_server.create_app()
+created = time.perf_counter()
+app.test_client().get('/api/health')
+answered = time.perf_counter()
+heavy = [name for name in ("anthropic", "requests", "numpy") if name in sys.modules]
+print(json.dumps({"import": imported - started, "create_app": created - imported,
+                  "first_request": answered - created, "heavy": heavy}))
+"""
+
+def measure_startup(runs: int = 10) -> Dict[str, Any]:
+    """Cold-start phases over `runs` fresh interpreters, same shape as an endpoint result"""
+    phases: Dict[str, List[float]] = {"process": [], "import_api_server": [], "create_app": [], "first_request": []}
+    env = dict(os.environ, PYTHONPATH=HERE, EVENT_LOG_LEVEL="WARNING")
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="etherfi-startup-") as workdir:
+        for _ in range(runs):
+            begin = time.perf_counter()
+            output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, os.path.join(workdir, "auth.db")],
+                                    cwd=workdir, env=env, capture_output=True, text=True, check=True).stdout
+            phases["process"].append(time.perf_counter() - begin)
+            timings = json.loads(output.strip().splitlines()[-1])
+            phases["import_api_server"].append(timings["import"])
+            phases["create_app"].append(timings["create_app"])
+            phases["first_request"].append(timings["first_request"])
+            if timings["heavy"]:
+                print(f"Imported at startup: {', '.join(timings['heavy'])}")
+    elapsed = time.perf_counter() - started
+    return {name: _summarize(values, 0, elapsed) for name, values in phases.items()}
+
+# ====================== BASELINES ======================
+
+def load_baseline(path: str = BENCHMARK_BASELINE_PATH) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_baseline(results: Dict[str, Any], path: str = BENCHMARK_BASELINE_PATH):
+    """Merge `results` into the saved baseline (sizes not run keep their old numbers)"""
+    baseline = load_baseline(path)
+    baseline.update(results)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+def regressions(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """Scenarios slower than the baseline by more than `tolerance`, or newly failing"""
+    found = []
+    for size, scenarios in results.items():
+        for name, current in scenarios.items():
+            previous = baseline.get(size, {}).get(name)
+            if not previous:
+                continue
+            label = f"{name} @ {size} recs" if size.isdigit() else f"{name} @ {size}"
+            if current["errors"] > previous["errors"]:
+                found.append(f"{label}: {current['errors']} errors (baseline {previous['errors']})")
+            if current["p50_ms"] > previous["p50_ms"] * (1 + tolerance):
+                found.append(f"{label}: p50 {current['p50_ms']} ms (baseline {previous['p50_ms']} ms)")
+            if current["rps"] * (1 + tolerance) < previous["rps"]:
+                found.append(f"{label}: {current['rps']} req/s (baseline {previous['rps']} req/s)")
+    return found
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the API offline against synthetic stores")
+    parser.add_argument("--sizes", type=int, nargs="*", default=list(DEFAULT_SIZES), help="Recommendations per store (up to 1000000); none for startup only")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Time cap per endpoint")
+    parser.add_argument("--startup-runs", type=int, default=10, help="Fresh interpreters for the cold-start timings (0 skips them)")
+    parser.add_argument("--baseline", default=BENCHMARK_BASELINE_PATH, help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Record this run as the baseline")
+    parser.add_argument("--check", action="store_true", help="Exit 1 if any endpoint regressed against the baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed slowdown as a fraction")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.sizes, args.requests, args.seconds)
+    if args.startup_runs > 0:
+        results["startup"] = measure_startup(args.startup_runs)
+    for size, scenarios in results.items():
+        print(f"\n{int(size):,} recommendations" if size.isdigit() else f"\n{size} (fresh interpreter)")
+        print(f"  {'endpoint':<26}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for name, r in scenarios.items():
+            print(f"  {name:<26}{r['rps']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{r['errors']:>8}")
+
+    status = 0
+    if args.check:
+        found = regressions(results, load_baseline(args.baseline), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        status = 1 if found else 0
+        print(f"\n{len(found)} regressions against {args.baseline}")
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        print(f"\nBaseline saved to {args.baseline}")
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
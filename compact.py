@@ -0,0 +1,183 @@
+"""
+Compact in-memory model for recommendations and votes
+The JSON store repeats the same keys, asset names and portfolio names in
+every recommendation. Here every distinct key layout is one shared tuple of
+interned keys, equal short strings are one object, numeric objects
+(allocations, vote tallies, market snapshots) keep their numbers in an
+array('d'), every object is a slotted class, and identical numeric objects
+and broker votes packed together are stored once.
+pack_store/unpack_store (and pack_rec/unpack) round-trip the JSON shape
+exactly: same keys in the same order, ints stay ints, floats stay floats.
+Packed objects are read-only snapshots; writes still go through the store.
+"""
+import sys
+from array import array
+from typing import Any, Dict, Tuple
+
+# Strings up to this long are shared between equal values (names, enums, ids); longer text isn't compared
+SHARE_MAX_LEN = 64
+# Largest int a double holds exactly; bigger ones stay in a Record
+_MAX_EXACT_INT = 2 ** 53
+
+REC_FIELDS = ("user_hash", "user_id", "username", "input", "portfolios", "summary", "created_at")
+BROKER_VOTE_FIELDS = ("broker_id", "broker_username", "choice")
+
+class Record:
+    """A JSON object: shared key tuple plus a tuple of packed values"""
+    __slots__ = ("keys", "values")
+
+    def __init__(self, keys: Tuple[str, ...], values: tuple):
+        self.keys = keys
+        self.values = values
+
+    def to_json(self) -> Dict[str, Any]:
+        return {key: unpack(value) for key, value in zip(self.keys, self.values)}
+
+class Weights:
+    """A JSON object of numbers (a portfolio allocation, vote tally, market snapshot)"""
+    __slots__ = ("names", "values", "int_mask")
+
+    def __init__(self, names: Tuple[str, ...], values: array, int_mask: int):
+        self.names = names
+        self.values = values
+        self.int_mask = int_mask  # Bit i set: values[i] was an int
+
+    def to_json(self) -> Dict[str, Any]:
+        mask = self.int_mask
+        return {name: int(value) if mask >> i & 1 else value
+                for i, (name, value) in enumerate(zip(self.names, self.values))}
+
+class BrokerVote:
+    """One broker's vote on a recommendation (store["broker_votes"][rec_id][broker_key])"""
+    __slots__ = BROKER_VOTE_FIELDS
+
+    def __init__(self, broker_id, broker_username, choice):
+        self.broker_id = broker_id
+        self.broker_username = broker_username
+        self.choice = choice
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"broker_id": self.broker_id, "broker_username": self.broker_username, "choice": self.choice}
+
+class CompactRec:
+    """One recommendation; keys it doesn't have a slot for go in `extra`"""
+    __slots__ = ("layout",) + REC_FIELDS + ("extra",)
+
+    def to_json(self) -> Dict[str, Any]:
+        extra = dict(zip(self.extra.keys, self.extra.values)) if self.extra else {}
+        return {key: unpack(getattr(self, key) if key in REC_FIELDS else extra[key]) for key in self.layout}
+
+def _share_key(value: Any) -> tuple:
+    # 1, 1.0 and True (and 0.0 and -0.0) are equal but must not be shared
+    return (float, value.hex()) if type(value) is float else (type(value), value)
+
+def _weights(obj: Dict[str, Any]):
+    # array('d') + int mask when every value is a plain number; None otherwise
+    values = array("d")
+    mask = 0
+    for i, value in enumerate(obj.values()):
+        if type(value) is int and -_MAX_EXACT_INT <= value <= _MAX_EXACT_INT:
+            mask |= 1 << i
+        elif type(value) is not float:
+            return None
+        values.append(value)
+    return values, mask
+
+class Packer:
+    """
+    Packs JSON values, storing equal numeric objects (the same allocation,
+    market snapshot or tally across recommendations) and broker votes once.
+    Use one per bulk load and drop it afterwards; the packed values don't
+    reference it.
+    """
+
+    def __init__(self):
+        self._layouts: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+        self._strings: Dict[str, str] = {}
+        self._shared: Dict[tuple, Any] = {}
+
+    def layout(self, keys: Tuple[str, ...]) -> Tuple[str, ...]:
+        """The one tuple for this key layout; keys are interned, so they're also shared with the code's literals"""
+        shared = self._layouts.get(keys)
+        if shared is None:
+            shared = self._layouts[keys] = tuple(sys.intern(key) for key in keys)
+        return shared
+
+    def string(self, value: str) -> str:
+        if len(value) > SHARE_MAX_LEN:
+            return value
+        return self._strings.setdefault(value, value)
+
+    def _share(self, key: tuple, make):
+        try:
+            found = self._shared.get(key)
+        except TypeError:  # Holds a list or object; not worth sharing
+            return make()
+        if found is None:
+            found = self._shared[key] = make()
+        return found
+
+    def value(self, obj: Any) -> Any:
+        if type(obj) is str:
+            return self.string(obj)
+        if type(obj) is list:
+            return [self.value(item) for item in obj]
+        if type(obj) is not dict:
+            return obj  # int, float, bool, None
+        keys = self.layout(tuple(obj))
+        numbers = _weights(obj) if obj else None
+        if numbers is not None:
+            values, mask = numbers
+            return self._share((Weights, keys, values.tobytes(), mask), lambda: Weights(keys, values, mask))
+        values = tuple(self.value(item) for item in obj.values())
+        if keys == BROKER_VOTE_FIELDS:
+            # A few brokers times two choices; the same handful of votes recurs everywhere
+            return self._share((BrokerVote,) + tuple(_share_key(value) for value in values), lambda: BrokerVote(*values))
+        # Profiles and containers rarely repeat exactly, so they aren't worth a lookup
+        return Record(keys, values)
+
+    def rec(self, rec: Dict[str, Any]) -> CompactRec:
+        packed = CompactRec()
+        packed.layout = self.layout(tuple(rec))
+        for field in REC_FIELDS:
+            setattr(packed, field, self.value(rec.get(field)))
+        extra = [key for key in rec if key not in REC_FIELDS]
+        packed.extra = Record(self.layout(tuple(extra)), tuple(self.value(rec[key]) for key in extra)) if extra else None
+        return packed
+
+def unpack(value: Any) -> Any:
+    """The JSON value a packed value came from"""
+    if isinstance(value, (Record, Weights, BrokerVote, CompactRec)):
+        return value.to_json()
+    if type(value) is list:
+        return [unpack(item) for item in value]
+    return value
+
+def pack_rec(rec: Dict[str, Any], packer: Packer = None) -> CompactRec:
+    return (packer or Packer()).rec(rec)
+
+def pack_store(store: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The store with recs, votes and broker_votes packed, and rec ids shared
+    with rec_order and broker_voted; other sections are left as they are
+    """
+    packer = Packer()
+    packed = dict(store)
+    packed["recs"] = {packer.string(rec_id): packer.rec(rec) for rec_id, rec in store.get("recs", {}).items()}
+    for section in ("votes", "broker_votes"):
+        if section in store:
+            packed[section] = {packer.string(rec_id): packer.value(value) for rec_id, value in store[section].items()}
+    if "rec_order" in store:
+        packed["rec_order"] = [packer.string(rec_id) for rec_id in store["rec_order"]]
+    if "broker_voted" in store:
+        packed["broker_voted"] = {key: [packer.string(rec_id) for rec_id in rec_ids]
+                                  for key, rec_ids in store["broker_voted"].items()}
+    return packed
+
+def unpack_store(packed: Dict[str, Any]) -> Dict[str, Any]:
+    """The JSON store pack_store was given"""
+    store = dict(packed)
+    for section in ("recs", "votes", "broker_votes"):
+        if section in packed:
+            store[section] = {rec_id: unpack(value) for rec_id, value in packed[section].items()}
+    return store
@@ -0,0 +1,100 @@
+"""
+Response compression and compact JSON for the API
+Large JSON bodies are gzip- or brotli-compressed when the client accepts
+it, and jsonify uses orjson (when installed) with no indentation
+"""
+import gzip
+import json
+import os
+
+from flask import Flask, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional: the stdlib encoder is used instead
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # Optional: only gzip is offered
+    brotli = None
+
+# Bodies smaller than this aren't worth the CPU (and barely shrink)
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html", "text/csv", "application/x-ndjson")
+
+ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson else 0
+
+class CompactJSONProvider(DefaultJSONProvider):
+    """jsonify without whitespace, through orjson when it's available"""
+
+    compact = True
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs) -> str:
+        if orjson is not None and not kwargs:
+            try:
+                return orjson.dumps(obj, option=ORJSON_OPTIONS).decode()
+            except TypeError:
+                pass  # Something orjson can't encode; the stdlib encoder handles `default`
+        kwargs.setdefault("default", self.default)
+        kwargs.setdefault("ensure_ascii", self.ensure_ascii)
+        kwargs.setdefault("separators", (",", ":"))
+        return json.dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if orjson is not None:
+            try:
+                body = orjson.dumps(obj, option=ORJSON_OPTIONS)
+            except TypeError:
+                body = self.dumps(obj).encode()
+        else:
+            body = self.dumps(obj).encode()
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+def choose_encoding(accept_encoding) -> str:
+    """Best encoding we support from an Accept-Encoding header, or "" """
+    if brotli is not None and accept_encoding["br"]:
+        return "br"
+    if accept_encoding["gzip"]:
+        return "gzip"
+    return ""
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+def _compress_response(response):
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(request.accept_encodings)
+    if not encoding:
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    response.set_data(compress(body, encoding))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        # Each encoding is its own representation and needs its own strong ETag
+        response.set_etag(f"{etag}-{encoding}", weak)
+    return response
+
+def representation_etags(etag: str):
+    """Every ETag a client may hold for `etag`, one per encoding we send"""
+    return [etag, f"{etag}-gzip", f"{etag}-br"]
+
+def init_compression(app: Flask):
+    """Install the compact JSON provider and compress eligible responses"""
+    app.json_provider_class = CompactJSONProvider
+    app.json = CompactJSONProvider(app)
+    app.after_request(_compress_response)
@@ -0,0 +1,33 @@
+"""
+Shared pytest fixtures: an isolated store/database per test and a stubbed LLM
+"""
+import pytest
+
+import database
+import llm_stub
+
+# Manual smoke test against a live server; run it directly with `python test_api.py`
+collect_ignore = ["test_api.py"]
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Flask test client backed by a throwaway store.json and auth.db"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "auth.db"))
+    import api_server
+    import ratelimit
+    import settlement
+    # Tests call settlement.settle_pending() themselves instead of waiting on the worker
+    monkeypatch.setattr(settlement.settlement_worker, "nudge", lambda: None)
+    # Fresh token buckets, so earlier tests don't eat this one's budget
+    ratelimit.limiter.reset()
+    return api_server.create_app().test_client()
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    """Route backend's Anthropic calls to an in-process stub"""
+    import backend
+    stub = llm_stub.StubAnthropic()
+    monkeypatch.setattr(backend, "_get_client", lambda: stub)
+    monkeypatch.setattr(backend, "ANTHROPIC_API_KEY", "stub-key")
+    return stub
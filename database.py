@@ -6,9 +6,12 @@ import sqlite3
 import hashlib
 import secrets
 import os
-from typing import Optional, Dict, Any
+import json
+from typing import Optional, Dict, Any, List
 from datetime import datetime, timedelta
 
+import metrics
+
 DB_PATH = os.path.join(os.path.dirname(__file__), 'auth.db')
 
 def get_db():
@@ -61,6 +64,102 @@ def init_db():
         )
     ''')
     
+    # Broker earnings ledger: one row per (broker, recommendation) settled
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS broker_earnings_ledger (
+            broker_id INTEGER NOT NULL,
+            rec_id TEXT NOT NULL,
+            amount REAL NOT NULL,
+            decision TEXT,
+            username TEXT,
+            decision_seq INTEGER NOT NULL,
+            settled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (broker_id, rec_id),
+            FOREIGN KEY (broker_id) REFERENCES brokers(id)
+        )
+    ''')
+    
+    # Settlement watermarks: highest decision sequence number already applied
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS settlement_state (
+            name TEXT PRIMARY KEY,
+            watermark INTEGER NOT NULL
+        )
+    ''')
+    
+    # Last decision sequence number handed out, next to the watermark it is compared with
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS settlement_sequences (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+    
+    # Version counters for cacheable API resources (ETags)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS resource_versions (
+            resource TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+    
+    # Generation jobs (see jobs.py), shared so any worker can answer a poll
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS generation_jobs (
+            job_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            submitted_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            result TEXT,
+            error TEXT
+        )
+    ''')
+    
+    # Recommendation search (see search.py): one row per indexed recommendation
+    # with its filterable fields, and the inverted index of its text with each
+    # posting's precomputed BM25 weight, read best first
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS search_docs (
+            rec_id TEXT PRIMARY KEY,
+            username TEXT,
+            username_key TEXT,
+            risk TEXT,
+            portfolio_type TEXT,
+            goal TEXT,
+            summary TEXT,
+            created_at TEXT,
+            length INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS search_docs_risk ON search_docs (risk, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS search_docs_type ON search_docs (portfolio_type, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS search_docs_user ON search_docs (username_key, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS search_docs_created ON search_docs (created_at)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS search_postings (
+            term TEXT NOT NULL,
+            rec_id TEXT NOT NULL,
+            impact REAL NOT NULL,
+            PRIMARY KEY (term, rec_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS search_postings_impact ON search_postings (term, impact DESC)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS search_postings_rec ON search_postings (rec_id)')
+    # Document frequency per term and running totals, so a query never counts the index
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS search_terms (
+            term TEXT PRIMARY KEY,
+            df INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS search_stats (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+    
     conn.commit()
     conn.close()
     print("Database initialized successfully")
@@ -253,6 +352,207 @@ def update_broker_earnings(broker_id: int, additional_earnings: float) -> bool:
     conn.close()
     return success
 
+# ====================== SETTLEMENT FUNCTIONS ======================
+
+def get_settlement_watermark(name: str = "decisions") -> int:
+    """Highest decision sequence number already settled (-1 if none)"""
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT watermark FROM settlement_state WHERE name = ?', (name,))
+    
+    row = cursor.fetchone()
+    conn.close()
+    return row['watermark'] if row else -1
+
+def next_decision_seq(floor: int = 0, name: str = "decisions") -> int:
+    """
+    Hand out the next decision sequence number. It is allocated here rather
+    than in store.json so it always stays above the settlement watermark,
+    even after the store is reset or restored; `floor` is the store's own
+    counter from before, so existing numbers are never reused.
+    """
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('SELECT value FROM settlement_sequences WHERE name = ?', (name,))
+        row = cursor.fetchone()
+        cursor.execute('SELECT watermark FROM settlement_state WHERE name = ?', (name,))
+        settled = cursor.fetchone()
+        seq = max(row['value'] if row else 0, settled['watermark'] if settled else 0, floor) + 1
+        cursor.execute('''
+            INSERT INTO settlement_sequences (name, value) VALUES (?, ?)
+            ON CONFLICT (name) DO UPDATE SET value = excluded.value
+        ''', (name, seq))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return seq
+
+def apply_settlement(entries: List[Dict[str, Any]], watermark: int, expected_watermark: int,
+                     name: str = "decisions") -> Optional[Dict[int, float]]:
+    """
+    Settle a batch of ledger entries ({broker_id, rec_id, amount, decision,
+    username, decision_seq}) in one transaction: upsert each ledger row, add
+    the change versus its previous amount to brokers.total_earnings and move
+    the watermark. Returns {broker_id: increment}, or None without touching
+    anything if another settler already moved the watermark.
+    """
+    conn = get_db()
+    cursor = conn.cursor()
+    increments: Dict[int, float] = {}
+    
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('SELECT watermark FROM settlement_state WHERE name = ?', (name,))
+        row = cursor.fetchone()
+        if (row['watermark'] if row else -1) != expected_watermark:
+            conn.rollback()
+            return None
+        
+        for entry in entries:
+            cursor.execute('''
+                SELECT amount FROM broker_earnings_ledger
+                WHERE broker_id = ? AND rec_id = ?
+            ''', (entry['broker_id'], entry['rec_id']))
+            previous = cursor.fetchone()
+            delta = entry['amount'] - (previous['amount'] if previous else 0.0)
+            cursor.execute('''
+                INSERT INTO broker_earnings_ledger (broker_id, rec_id, amount, decision, username, decision_seq)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (broker_id, rec_id) DO UPDATE SET
+                    amount = excluded.amount,
+                    decision = excluded.decision,
+                    username = excluded.username,
+                    decision_seq = excluded.decision_seq,
+                    settled_at = CURRENT_TIMESTAMP
+            ''', (entry['broker_id'], entry['rec_id'], entry['amount'], entry.get('decision'),
+                  entry.get('username'), entry['decision_seq']))
+            if delta:
+                increments[entry['broker_id']] = increments.get(entry['broker_id'], 0.0) + delta
+        _bump_versions(cursor, [f"broker:{broker_id}" for broker_id in increments])
+        
+        cursor.executemany('''
+            UPDATE brokers
+            SET total_earnings = ROUND(total_earnings + ?, 2)
+            WHERE id = ?
+        ''', [(amount, broker_id) for broker_id, amount in increments.items()])
+        cursor.execute('''
+            INSERT INTO settlement_state (name, watermark) VALUES (?, ?)
+            ON CONFLICT (name) DO UPDATE SET watermark = excluded.watermark
+        ''', (name, watermark))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return increments
+
+def get_broker_ledger(broker_id: int) -> List[Dict[str, Any]]:
+    """Settled earnings rows for one broker, newest first"""
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        SELECT rec_id, amount, decision, username, decision_seq, settled_at
+        FROM broker_earnings_ledger
+        WHERE broker_id = ?
+        ORDER BY decision_seq DESC
+    ''', (broker_id,))
+    
+    rows = cursor.fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+# ====================== RESOURCE VERSIONS ======================
+
+def _bump_versions(cursor, resources: List[str]):
+    # Versions start at the current time in ms and only move forward, so an
+    # ETag handed out before the database was recreated can't match again
+    now_ms = int(datetime.now().timestamp() * 1000)
+    cursor.executemany('''
+        INSERT INTO resource_versions (resource, version) VALUES (?, ?)
+        ON CONFLICT (resource) DO UPDATE SET version = MAX(version + 1, excluded.version)
+    ''', [(resource, now_ms) for resource in resources])
+
+def bump_versions(resources: List[str]):
+    """Mark resources (e.g. "rec:<id>", "recs", "broker:<id>") as changed"""
+    if not resources:
+        return
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    _bump_versions(cursor, resources)
+    
+    conn.commit()
+    conn.close()
+
+def get_versions(resources: List[str]) -> Dict[str, int]:
+    """Current version of each resource (0 if it never changed)"""
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    cursor.execute(
+        'SELECT resource, version FROM resource_versions WHERE resource IN (%s)' % ",".join("?" * len(resources)),
+        list(resources)
+    )
+    
+    found = {row['resource']: row['version'] for row in cursor.fetchall()}
+    conn.close()
+    return {resource: found.get(resource, 0) for resource in resources}
+
+# ====================== GENERATION JOBS ======================
+
+def save_job(job: Dict[str, Any]):
+    """Insert or update a generation job; the result is stored as JSON"""
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        INSERT OR REPLACE INTO generation_jobs
+            (job_id, status, submitted_at, started_at, finished_at, result, error)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (job["job_id"], job["status"], job["submitted_at"], job["started_at"],
+          job["finished_at"], json.dumps(job["result"]), job["error"]))
+    
+    conn.commit()
+    conn.close()
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Get a generation job by id, whichever worker ran it"""
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    cursor.execute('SELECT * FROM generation_jobs WHERE job_id = ?', (job_id,))
+    row = cursor.fetchone()
+    conn.close()
+    
+    if not row:
+        return None
+    job = dict(row)
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+def delete_jobs_before(finished_before: float, submitted_before: float):
+    """Drop jobs finished before the first cutoff, or submitted before the
+    second and never finished (their worker went away)"""
+    conn = get_db()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        DELETE FROM generation_jobs
+        WHERE finished_at < ? OR (finished_at IS NULL AND submitted_at < ?)
+    ''', (finished_before, submitted_before))
+    
+    conn.commit()
+    conn.close()
+
 # ====================== SESSION FUNCTIONS ======================
 
 def create_session(user_id: Optional[int], broker_id: Optional[int], user_type: str) -> str:
@@ -273,6 +573,7 @@ def create_session(user_id: Optional[int], broker_id: Optional[int], user_type:
     
     return token
 
+@metrics.timed("validate_session")
 def validate_session(token: str) -> Optional[Dict[str, Any]]:
     """Validate session token and return user/broker data"""
     conn = get_db()
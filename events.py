@@ -0,0 +1,201 @@
+"""
+In-process pub/sub for recommendation updates
+Writers publish small change events per topic; watchers block on a
+condition until something newer than their last sequence number arrives,
+so idle watchers cost no CPU. Writes made by other processes are noticed by
+one VersionMonitor thread per process, which turns them into `changed`
+events, so watchers never query the database themselves.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Dict, List, Tuple
+
+# Events kept per topic for watchers that reconnect with Last-Event-ID / since
+EVENTS_BACKLOG = int(os.getenv("EVENTS_BACKLOG", "50"))
+# Topics with no watchers and no events for this long are dropped
+EVENTS_TOPIC_TTL = float(os.getenv("EVENTS_TOPIC_TTL", "600"))
+# Seconds between the version monitor's checks for writes made by other processes
+EVENTS_VERSION_CHECK = float(os.getenv("EVENTS_VERSION_CHECK", "5"))
+
+Event = Tuple[int, str, Dict[str, Any]]
+
+class _Topic:
+    __slots__ = ("cond", "events", "watchers", "touched")
+
+    def __init__(self, lock: threading.Lock):
+        # One condition per topic, so a publish only wakes that topic's watchers
+        self.cond = threading.Condition(lock)
+        self.events: deque = deque(maxlen=EVENTS_BACKLOG)
+        self.watchers = 0
+        self.touched = time.time()
+
+class EventBus:
+    """
+    Topics are created on first use. Sequence numbers are global and
+    increasing, so `since` works across topics and is never reused.
+    """
+
+    def __init__(self):
+        # Identifies this process's sequence numbers; cursors from another
+        # process (or before a restart) carry a different epoch
+        self.epoch = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._topics: Dict[str, _Topic] = {}
+        self._seq = 0
+        self._last_sweep = time.time()
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    def publish(self, topic: str, event: str, data: Dict[str, Any]) -> int:
+        """Append an event to `topic` and wake its watchers; returns its sequence number"""
+        with self._lock:
+            self._seq += 1
+            entry = self._topic(topic)
+            entry.events.append((self._seq, event, data))
+            entry.touched = time.time()
+            entry.cond.notify_all()
+            self._sweep()
+            return self._seq
+
+    def topic_seq(self, topic: str) -> int:
+        """Sequence number of the newest event buffered on `topic` (0 if none)"""
+        with self._lock:
+            entry = self._topics.get(topic)
+            return entry.events[-1][0] if entry and entry.events else 0
+
+    def since(self, topic: str, seq: int) -> List[Event]:
+        """Buffered events on `topic` newer than `seq`"""
+        with self._lock:
+            entry = self._topics.get(topic)
+            return [e for e in entry.events if e[0] > seq] if entry else []
+
+    def wait(self, topic: str, seq: int, timeout: float) -> List[Event]:
+        """Block until `topic` has events newer than `seq` or `timeout` passes"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            entry = self._topic(topic)
+            entry.watchers += 1
+            try:
+                while True:
+                    events = [e for e in entry.events if e[0] > seq]
+                    remaining = deadline - time.monotonic()
+                    if events or remaining <= 0:
+                        return events
+                    entry.cond.wait(remaining)
+            finally:
+                entry.watchers -= 1
+                entry.touched = time.time()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "topics": len(self._topics),
+                "watchers": sum(t.watchers for t in self._topics.values()),
+                "last_seq": self._seq
+            }
+
+    def _topic(self, name: str) -> _Topic:
+        entry = self._topics.get(name)
+        if entry is None:
+            entry = self._topics[name] = _Topic(self._lock)
+        return entry
+
+    def _sweep(self):
+        # Called with the lock held, at most once a minute
+        now = time.time()
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        stale = [name for name, t in self._topics.items() if not t.watchers and now - t.touched > EVENTS_TOPIC_TTL]
+        for name in stale:
+            del self._topics[name]
+
+class VersionMonitor:
+    """
+    Polls the version counters of recently watched topics every `interval`
+    seconds, one query per process however many watchers there are, and
+    publishes a `changed` event on a topic whose version moved without an
+    event on this process's bus (the write was served by another worker).
+    """
+
+    def __init__(self, bus: EventBus, read_versions: Callable[[List[str]], Dict[str, int]],
+                 interval: float = EVENTS_VERSION_CHECK):
+        self.bus = bus
+        self.read_versions = read_versions
+        self.interval = interval
+        self._lock = threading.Lock()
+        # topic -> [version, newest bus seq on it when read, last watched]
+        self._known: Dict[str, list] = {}
+        self._thread = None
+
+    def track(self, topic: str) -> int:
+        """Start (or keep) watching `topic`; returns its current version as last read"""
+        with self._lock:
+            self._start()
+            known = self._known.get(topic)
+            if known:
+                known[2] = time.time()
+                return known[0]
+        version = self.read_versions([topic])[topic]
+        with self._lock:
+            known = self._known.setdefault(topic, [version, self.bus.topic_seq(topic), time.time()])
+            return known[0]
+
+    def check(self):
+        """One round: read the versions of recently watched topics and announce foreign writes"""
+        now = time.time()
+        with self._lock:
+            # Long-poll watchers reconnect between holds, so a topic stays watched for a few rounds
+            for topic in [t for t, known in self._known.items() if now - known[2] > 3 * self.interval]:
+                del self._known[topic]
+            topics = list(self._known)
+        if not topics:
+            return
+        versions = self.read_versions(topics)
+        changed = []
+        with self._lock:
+            for topic in topics:
+                known = self._known.get(topic)
+                if known is None:
+                    continue
+                seq = self.bus.topic_seq(topic)
+                if versions[topic] != known[0] and seq == known[1]:
+                    changed.append((topic, versions[topic]))
+                known[0], known[1] = versions[topic], seq
+        for topic, version in changed:
+            self.bus.publish(topic, "changed", {"version": version})
+
+    def _start(self):
+        # Called with the lock held; started lazily so a forking server gets one per worker
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="version-monitor", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Version monitor check failed: {e}")
+
+bus = EventBus()
+
+def rec_topic(rec_id: str) -> str:
+    return f"rec:{rec_id}"
+
+def cursor(seq: int) -> str:
+    """Opaque resume token ("<epoch>:<seq>") used as SSE id and long-poll `since`"""
+    return f"{bus.epoch}:{seq}"
+
+def parse_cursor(token: str):
+    """Sequence number from a cursor issued by this process, else None"""
+    epoch, _, seq = (token or "").partition(":")
+    if epoch != bus.epoch or not seq.isdigit():
+        return None
+    return int(seq)
@@ -3,6 +3,14 @@ import { useModal } from '../contexts/ModalContext';
 import { api } from '../utils/api';
 import PortfolioChart from '../components/PortfolioChart';
 
+// Newest first by created_at; older recommendations without one keep the
+// server's order (creation order) and come after them
+const newestFirst = (recs) =>
+  Object.keys(recs)
+    .map((id, index) => [id, index])
+    .sort(([a, i], [b, j]) => (recs[b].created_at || '').localeCompare(recs[a].created_at || '') || j - i)
+    .map(([id]) => id);
+
 function BrokerDashboard() {
   const { showModal } = useModal();
   const [recommendations, setRecommendations] = useState({});
@@ -23,44 +31,60 @@ function BrokerDashboard() {
     }
   }, [selectedRecId]);
 
-  const loadRecommendations = async () => {
+  // Recommendations, earnings and (when one is selected) its details in one batch request
+  const loadRecommendations = async (recId = selectedRecId) => {
+    const paths = ['/api/recommendations', '/api/broker/earnings'];
+    if (recId) {
+      paths.push(`/api/recommendation/${recId}`);
+    }
     try {
-      const response = await api.getRecommendations();
-      setRecommendations(response.data);
+      const response = await api.batch(paths);
+      const [recsResult, earningsResult, detailsResult] = response.data.responses;
+      if (recsResult.status !== 200) {
+        throw new Error(recsResult.body?.error || `HTTP ${recsResult.status}`);
+      }
+      setRecommendations(recsResult.body);
       
       // Auto-select the first recommendation if available
-      const recIds = Object.keys(response.data).sort().reverse();
+      const recIds = newestFirst(recsResult.body);
       if (recIds.length > 0 && !selectedRecId) {
         setSelectedRecId(recIds[0]);
       }
       
-      // Get broker-specific earnings
-      try {
-        const earningsResponse = await api.getBrokerEarnings();
-        setTotalBrokerEarnings(earningsResponse.data.total_earnings);
-      } catch (err) {
-        console.error('Error loading broker earnings:', err);
+      // Broker-specific earnings
+      if (earningsResult.status === 200) {
+        setTotalBrokerEarnings(earningsResult.body.total_earnings);
+      } else {
+        console.error('Error loading broker earnings:', earningsResult.body);
         setTotalBrokerEarnings(0);
       }
+      
+      if (detailsResult?.status === 200) {
+        applyRecommendationDetails(detailsResult.body);
+      }
     } catch (error) {
       console.error('Error loading recommendations:', error);
     }
   };
 
+  const applyRecommendationDetails = (data) => {
+    setCurrentRec(data.recommendation);
+    setVotes(data.votes);
+    setDecision(data.decision);
+    
+    // Set first portfolio as default vote choice
+    if (data.recommendation?.portfolios) {
+      const portfolioNames = Object.keys(data.recommendation.portfolios);
+      if (portfolioNames.length > 0) {
+        setSelectedVote(portfolioNames[0]);
+      }
+    }
+  };
+
   const loadRecommendationDetails = async () => {
     try {
       const response = await api.getRecommendation(selectedRecId);
-      setCurrentRec(response.data.recommendation);
-      setVotes(response.data.votes);
-      setDecision(response.data.decision);
-      
-      // Set first portfolio as default vote choice
-      if (response.data.recommendation?.portfolios) {
-        const portfolioNames = Object.keys(response.data.recommendation.portfolios);
-        if (portfolioNames.length > 0) {
-          setSelectedVote(portfolioNames[0]);
-        }
-      }
+      applyRecommendationDetails(response.data);
     } catch (error) {
       console.error('Error loading recommendation details:', error);
     }
@@ -70,15 +94,14 @@ function BrokerDashboard() {
     try {
       await api.submitVote(selectedRecId, selectedVote);
       showModal('Vote Recorded!', 'Your vote has been successfully submitted.', 'success');
-      loadRecommendationDetails(); // Reload to show updated votes
-      loadRecommendations(); // Reload to update earnings if decision was made
+      loadRecommendations(); // Updated votes and earnings in one round trip
     } catch (error) {
       console.error('Error submitting vote:', error);
       showModal('Vote Failed', 'Error submitting vote. Please try again.', 'error');
     }
   };
 
-  const recIds = Object.keys(recommendations).sort().reverse();
+  const recIds = newestFirst(recommendations);
 
   return (
     <div>
@@ -81,19 +81,48 @@ function UserDashboard() {
     }
   }, []);
 
-  // Real-time polling for vote updates
+  // Real-time vote updates pushed by the server
   useEffect(() => {
     if (currentRecId) {
       // Load immediately
       loadRecommendationData();
       
-      // Then poll every 3 seconds for real-time updates
-      const pollInterval = setInterval(() => {
-        loadRecommendationData();
-      }, 3000);
+      // Long-poll with short holds: each waiting request ties up a server thread
+      let stopped = false;
+      let timer = null;
+      let since;
+      let version;
+      const poll = async () => {
+        let delay = 0;
+        try {
+          const response = await api.pollRecommendationEvents(currentRecId, since, version);
+          if (stopped) return;
+          const data = response.data;
+          since = data.cursor;
+          version = data.version;
+          data.events.forEach(({ event, data: change }) => {
+            if (event === 'vote') {
+              setVotes(change.votes || {});
+              setBrokerVotes(change.broker_votes || {});
+              setLastVoteUpdate(new Date());
+            }
+          });
+          // Changes the events have no details for (e.g. handled by another server worker)
+          if (data.changed) loadRecommendationData();
+          // The server was too busy to hold the request; wait as long as it asks
+          delay = data.retry_ms || 0;
+        } catch (error) {
+          delay = 3000;
+        }
+        if (!stopped) timer = setTimeout(poll, delay);
+      };
+      poll();
       
-      // Cleanup interval on unmount or when recId changes
-      return () => clearInterval(pollInterval);
+      // Stop polling on unmount or when recId changes
+      return () => {
+        stopped = true;
+        clearTimeout(timer);
+      };
     }
   }, [currentRecId]);
 
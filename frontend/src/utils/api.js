@@ -24,6 +24,13 @@ export const api = {
   generatePortfolios: (profile, market) => 
     axios.post(`${API_BASE_URL}/generate-portfolios`, { profile, market }),
   
+  // Queue portfolio generation on the worker pool
+  enqueuePortfolioJob: (profile, market) =>
+    axios.post(`${API_BASE_URL}/jobs/generate-portfolios`, { profile, market }),
+  
+  // Poll a generation job
+  getJob: (jobId) => axios.get(`${API_BASE_URL}/jobs/${jobId}`),
+  
   // Create recommendation
   createRecommendation: (nickname, profile, market, portfolios, summary) =>
     axios.post(`${API_BASE_URL}/create-recommendation`, { 
@@ -36,6 +43,12 @@ export const api = {
   // Get specific recommendation
   getRecommendation: (recId) => axios.get(`${API_BASE_URL}/recommendation/${recId}`),
   
+  // Long-poll for the next events on one recommendation (answers within `timeout` seconds)
+  pollRecommendationEvents: (recId, since, version, timeout = 10) =>
+    axios.get(`${API_BASE_URL}/recommendation/${recId}/events`, {
+      params: { transport: 'longpoll', since, version, timeout }
+    }),
+  
   // Submit vote
   submitVote: (recId, choice) =>
     axios.post(`${API_BASE_URL}/vote`, { rec_id: recId, choice }),
@@ -51,6 +64,23 @@ export const api = {
       expected_return: expectedReturn
     }),
   
+  // Sensitivity table: each argument may be a number or an array (one grid axis)
+  getWhatIf: (ethHoldings, ethPrice, expectedReturn, timeLimitDays) =>
+    axios.post(`${API_BASE_URL}/what-if`, {
+      eth_holdings: ethHoldings,
+      eth_price: ethPrice,
+      expected_return: expectedReturn,
+      time_limit_days: timeLimitDays
+    }),
+  
+  // Monte Carlo outcome bands for both portfolios of a recommendation
+  simulateRecommendation: (recId, timeLimitDays, paths = 10000, seed = null) =>
+    axios.post(`${API_BASE_URL}/simulate`, { rec_id: recId, time_limit_days: timeLimitDays, paths, seed }),
+  
+  // Daily compounded value curves (per asset and total) for both portfolios
+  getProjection: (recId, timeLimitDays) =>
+    axios.post(`${API_BASE_URL}/projection`, { rec_id: recId, time_limit_days: timeLimitDays }),
+  
   // Submit feedback
   submitFeedback: (recId, thumb, note) =>
     axios.post(`${API_BASE_URL}/feedback`, { rec_id: recId, thumb, note }),
@@ -58,7 +88,16 @@ export const api = {
   // Get broker-specific earnings
   getBrokerEarnings: () => axios.get(`${API_BASE_URL}/broker/earnings`),
   
+  // Newest recommendations the logged-in broker hasn't voted on
+  getBrokerFeed: (limit = 20) => axios.get(`${API_BASE_URL}/broker/feed`, { params: { limit } }),
+  
+  // Search recommendations: { q, risk, portfolio_type, username, since, limit, offset }
+  searchRecommendations: (params) => axios.get(`${API_BASE_URL}/recommendations/search`, { params }),
+  
   // Get broker profile stats
   getBrokerProfile: (brokerId) => axios.get(`${API_BASE_URL}/broker/profile/${brokerId}`),
+  
+  // Several GETs in one round trip; each item is a path ("/api/...") or { path, headers }
+  batch: (requests) => axios.post(`${API_BASE_URL}/batch`, { requests }),
 };
 
@@ -0,0 +1,52 @@
+"""
+Gunicorn settings for production serving (`python serve.py`)
+Every value can be overridden from the environment or .env
+"""
+import multiprocessing
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '5001')}"
+
+# Threaded workers: most request time is spent waiting on Claude, CoinGecko
+# and DefiLlama. Event watchers hold a thread while they wait, so the API caps
+# them at EVENTS_MAX_WATCHERS per worker (half the threads by default)
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", min(2 * multiprocessing.cpu_count() + 1, 8)))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+
+# Import the app (and run create_app(), which sets up the schema) once in the
+# master and fork workers from it. Without preload every worker calls
+# create_app(); init_db is idempotent. Code changes need a full restart rather than HUP.
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# Worker heartbeat timeout; long LLM calls and streams run in threads and don't block it
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+# On HUP or shutdown, workers get this long to finish in-flight requests
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+# Recycle workers periodically to bound memory growth; jitter avoids restarting them all at once
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "2000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "200"))
+
+# Metrics are recorded per worker; each writes them here so /api/metrics reports
+# every worker whichever one answers the scrape (see metrics.py)
+os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), f"etherfi-metrics-{os.getenv('PORT', '5001')}"))
+
+def on_starting(server):
+    # Counters from a previous run would never reset
+    import metrics
+    metrics.clear_dir()
+
+def worker_exit(server, worker):
+    # Write the last few seconds of a recycled or stopping worker
+    import metrics
+    metrics.flush()
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-") or None  # empty disables it
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
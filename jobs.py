@@ -0,0 +1,211 @@
+"""
+Background job queue for portfolio generation
+Runs slow LLM work on a bounded worker pool so API workers stay free
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+import database
+
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "4"))
+GENERATION_QUEUE_SIZE = int(os.getenv("GENERATION_QUEUE_SIZE", "32"))
+GENERATION_JOB_TIMEOUT = float(os.getenv("GENERATION_JOB_TIMEOUT", "90"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "600"))
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+class JobQueue:
+    """
+    Fixed-size worker pool fed by a bounded queue.
+
+    Jobs that wait or run longer than `timeout` seconds are reported as
+    timed out. Each job function is called with `deadline=` (epoch seconds,
+    `timeout` after submission) and must give up by then, which frees its
+    worker; a late result is discarded. Finished jobs are kept for
+    `result_ttl` seconds so clients can fetch them by id.
+
+    Jobs run in the process that took them, but every state change is also
+    written to the `generation_jobs` table, so a poll answered by another
+    server worker still finds the job.
+    """
+
+    def __init__(self, workers: int, max_queue: int, timeout: float, result_ttl: float):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.result_ttl = result_ttl
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = 0
+        self._counters = {
+            "submitted": 0,
+            "rejected": 0,
+            "completed": 0,
+            "failed": 0,
+            "timed_out": 0
+        }
+        self._runs = 0
+        self._wait_total = 0.0
+        self._run_total = 0.0
+
+    def _ensure_started(self):
+        # Threads are started lazily so a forking server spawns them per worker
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> str:
+        """Enqueue a job and return its id, or raise QueueFullError"""
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "status": "queued",
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None
+        }
+        with self._lock:
+            self._ensure_started()
+            self._evict_expired()
+            try:
+                self._queue.put_nowait((job_id, fn, args, kwargs))
+            except queue.Full:
+                self._counters["rejected"] += 1
+                raise QueueFullError(f"Job queue is full ({self.max_queue} pending)")
+            self._jobs[job_id] = job
+            self._counters["submitted"] += 1
+            self._persist(job)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a snapshot of the job, marking it timed out if overdue"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                if job["status"] in ("queued", "running") and time.time() - job["submitted_at"] > self.timeout:
+                    self._mark_timed_out(job)
+                return dict(job)
+        # Submitted to another worker; its owner keeps the row up to date
+        try:
+            job = database.get_job(job_id)
+        except sqlite3.Error as e:
+            print(f"Could not read job {job_id}: {e}")
+            return None
+        if job and job["status"] in ("queued", "running") and time.time() - job["submitted_at"] > self.timeout:
+            job["status"] = "timed_out"
+            job["error"] = f"Job exceeded {self.timeout:.0f}s timeout"
+        return job
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth, utilisation and outcome counters"""
+        with self._lock:
+            runs = self._runs
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "workers": self.workers,
+                "tracked_jobs": len(self._jobs),
+                "avg_wait_ms": round(self._wait_total / runs * 1000, 1) if runs else 0.0,
+                "avg_run_ms": round(self._run_total / runs * 1000, 1) if runs else 0.0,
+                **self._counters
+            }
+
+    def _mark_timed_out(self, job: Dict[str, Any]):
+        job["status"] = "timed_out"
+        job["error"] = f"Job exceeded {self.timeout:.0f}s timeout"
+        job["finished_at"] = time.time()
+        self._counters["timed_out"] += 1
+        self._persist(job)
+
+    def _persist(self, job: Dict[str, Any]):
+        # Called under self._lock, so a job's rows are written in order
+        try:
+            database.save_job(job)
+        except sqlite3.Error as e:
+            print(f"Could not save job {job['job_id']}: {e}")
+
+    def _evict_expired(self):
+        cutoff = time.time() - self.result_ttl
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["finished_at"] and job["finished_at"] < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+        try:
+            database.delete_jobs_before(cutoff, cutoff - self.timeout)
+        except sqlite3.Error as e:
+            print(f"Could not evict expired jobs: {e}")
+
+    def _worker(self):
+        while True:
+            job_id, fn, args, kwargs = self._queue.get()
+            try:
+                self._run(job_id, fn, args, kwargs)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id: str, fn: Callable[..., Any], args, kwargs):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or job["status"] != "queued":
+                return
+            started = time.time()
+            if started - job["submitted_at"] > self.timeout:
+                # Waited out its whole budget in the queue; don't spend LLM time on it
+                self._mark_timed_out(job)
+                return
+            job["status"] = "running"
+            job["started_at"] = started
+            self._running += 1
+            self._persist(job)
+
+        try:
+            # Python threads can't be killed, so the job has to stop itself at its deadline
+            result, error = fn(*args, deadline=job["submitted_at"] + self.timeout, **kwargs), None
+        except Exception as e:
+            result, error = None, str(e)
+
+        with self._lock:
+            self._running -= 1
+            finished = time.time()
+            self._runs += 1
+            self._wait_total += job["started_at"] - job["submitted_at"]
+            self._run_total += finished - job["started_at"]
+            if job["status"] == "timed_out":
+                return  # Client already saw the timeout; drop the late result
+            if finished - job["submitted_at"] > self.timeout:
+                self._mark_timed_out(job)
+                return
+            job["finished_at"] = finished
+            if error is None:
+                job["status"] = "done"
+                job["result"] = result
+                self._counters["completed"] += 1
+            else:
+                job["status"] = "failed"
+                job["error"] = error
+                self._counters["failed"] += 1
+                print(f"Generation job {job_id} failed: {error}")
+            self._persist(job)
+
+generation_queue = JobQueue(
+    workers=GENERATION_WORKERS,
+    max_queue=GENERATION_QUEUE_SIZE,
+    timeout=GENERATION_JOB_TIMEOUT,
+    result_ttl=JOB_RESULT_TTL
+)
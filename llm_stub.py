@@ -0,0 +1,156 @@
+"""
+In-process stand-in for the Anthropic client
+Replays canned completions (optionally chunked and delayed) so LLM code
+paths can be exercised without network access or an API key
+"""
+import json
+import time
+from types import SimpleNamespace
+from typing import Callable, Iterator, List, Optional
+
+STUB_SUMMARY = (
+    "Portfolio A leans into ether.fi staking and vaults for higher yield with more volatility. "
+    "Portfolio B spreads across stablecoins and equities for steadier returns. "
+    "Educational guidance only."
+)
+
+def default_responder(model: str, prompt: str) -> str:
+    """Answer portfolio prompts with valid JSON and anything else with a summary"""
+    if "Generate the JSON now" in prompt:
+        if "TRADITIONAL" in prompt:
+            portfolios = {
+                "Portfolio A — Crypto Tilt": {"eETH": 30, "BTC/Alts": 20, "US Stocks": 30, "Cash/FD": 20},
+                "Portfolio B — Balanced Traditional": {"eETH": 25, "BTC/Alts": 15, "US Stocks": 35, "Cash/FD": 25}
+            }
+        else:
+            portfolios = {
+                "Portfolio A — ether.fi Native": {
+                    "weETH Staking": 30, "Liquid Vaults": 20, "Aave Integration": 15,
+                    "Pendle Integration": 10, "Gearbox Integration": 5, "eBTC": 10, "eUSD Stablecoins": 10
+                },
+                "Portfolio B — Balanced Yield": {
+                    "weETH Staking": 25, "Liquid Vaults": 15, "Aave Integration": 20,
+                    "eUSD Stablecoins": 20, "US Stocks": 15, "ether.fi Cash": 5
+                }
+            }
+        return "```json\n" + json.dumps(portfolios, indent=2) + "\n```"
+    return STUB_SUMMARY
+
+def chunk_text(text: str, size: int) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+class StubNotFound(Exception):
+    """Mimics the SDK's 404 for a model the account can't use"""
+
+    def __init__(self, model: str):
+        super().__init__(f"Error code: 404 - not_found_error: model: {model}")
+
+class _StubStream:
+    def __init__(self, chunks: List[str], delay: float, usage):
+        self._chunks = chunks
+        self._delay = delay
+        self._usage = usage
+        self.closed = False
+        self.chunks_sent = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        self.closed = True
+
+    @property
+    def text_stream(self) -> Iterator[str]:
+        for chunk in self._chunks:
+            if self.closed:
+                return
+            if self._delay:
+                time.sleep(self._delay)
+            self.chunks_sent += 1
+            yield chunk
+
+    @property
+    def current_message_snapshot(self):
+        sent = "".join(self._chunks[:self.chunks_sent])
+        return SimpleNamespace(usage=SimpleNamespace(
+            input_tokens=self._usage.input_tokens,
+            output_tokens=max(1, len(sent) // 4)
+        ))
+
+    def get_final_message(self):
+        return SimpleNamespace(
+            content=[SimpleNamespace(text="".join(self._chunks))],
+            usage=self._usage
+        )
+
+class _StubMessages:
+    def __init__(self, owner: "StubAnthropic"):
+        self._owner = owner
+
+    def _complete(self, model: str, messages) -> str:
+        owner = self._owner
+        owner.calls.append(model)
+        if model in owner.missing_models:
+            raise StubNotFound(model)
+        if owner.latency:
+            time.sleep(owner.latency(model) if callable(owner.latency) else owner.latency)
+        prompt = messages[-1]["content"]
+        return owner.responder(model, prompt)
+
+    def _usage(self, messages, text: str):
+        prompt = messages[-1]["content"]
+        return SimpleNamespace(input_tokens=len(prompt) // 4, output_tokens=max(1, len(text) // 4))
+
+    def create(self, model: str, messages, **kwargs):
+        text = self._complete(model, messages)
+        return SimpleNamespace(
+            content=[SimpleNamespace(text=text)],
+            model=model,
+            usage=self._usage(messages, text)
+        )
+
+    def stream(self, model: str, messages, **kwargs) -> _StubStream:
+        text = self._complete(model, messages)
+        owner = self._owner
+        delay = owner.chunk_delay(model) if callable(owner.chunk_delay) else owner.chunk_delay
+        stream = _StubStream(chunk_text(text, owner.chunk_size), delay, self._usage(messages, text))
+        owner.streams.append(stream)
+        return stream
+
+class StubAnthropic:
+    """
+    Drop-in for anthropic.Anthropic in tests and offline benchmarks.
+
+    `responder(model, prompt)` returns the completion text, `missing_models`
+    raise a 404-style error, `latency` (seconds or callable per model) is
+    slept before answering and `chunk_size`/`chunk_delay` (seconds or
+    callable per model) shape streams.
+    Every requested model is appended to `calls` and every stream opened
+    to `streams`.
+    """
+
+    def __init__(self, responder: Optional[Callable[[str, str], str]] = None,
+                 missing_models=(), latency=0.0, chunk_size: int = 16, chunk_delay: float = 0.0):
+        self.responder = responder or default_responder
+        self.missing_models = set(missing_models)
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.calls: List[str] = []
+        self.streams: List[_StubStream] = []
+        self.messages = _StubMessages(self)
+
+def install(stub: StubAnthropic, api_key: str = "stub-key"):
+    """Route backend's Anthropic calls to `stub`; returns a function that undoes it"""
+    import backend
+    saved = (backend._get_client, backend.ANTHROPIC_API_KEY)
+    backend._get_client = lambda: stub
+    backend.ANTHROPIC_API_KEY = api_key
+
+    def uninstall():
+        backend._get_client, backend.ANTHROPIC_API_KEY = saved
+    return uninstall
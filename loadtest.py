@@ -0,0 +1,145 @@
+"""
+HTTP load test for api_server
+Hammers a mix of read and compute endpoints from concurrent keep-alive
+clients and reports throughput and latency percentiles. With --compare it
+starts the development server and the gunicorn server side by side on free
+ports (against a throwaway copy of the data) and prints both.
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# (method, path, json body); nothing here calls Claude or the market APIs
+SCENARIO = [
+    ("GET", "/api/health", None),
+    ("GET", "/api/recommendations", None),
+    ("POST", "/api/what-if", {"eth_holdings": 5.0, "eth_price": 3000.0,
+                              "expected_return": list(range(0, 40, 2)), "time_limit_days": list(range(30, 390, 30))}),
+    ("POST", "/api/generate-portfolios", {"mode": "instant", "profile": {"risk": "medium", "eth_holdings": 5.0},
+                                          "market": {"apy": 4.5, "tvl_b": 2.7, "eth_usd": 3000.0}}),
+]
+
+def run_load(base_url: str, concurrency: int, duration: float) -> Dict[str, Any]:
+    """Each client cycles through SCENARIO for `duration` seconds"""
+    latencies: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(offset: int):
+        session = requests.Session()
+        mine, failed = [], 0
+        i = offset
+        while time.perf_counter() < deadline:
+            method, path, body = SCENARIO[i % len(SCENARIO)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                response = session.request(method, base_url + path, json=body, timeout=30)
+                response.content
+                if response.status_code >= 400:
+                    failed += 1
+            except requests.RequestException:
+                failed += 1
+            mine.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    def pct(q):
+        return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 2) if latencies else None
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _wait_ready(base_url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(base_url + "/api/health", timeout=1).ok:
+                return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{base_url} did not come up")
+
+def _start(kind: str, port: int, workdir: str, workers: int, threads: int) -> subprocess.Popen:
+    # Rate limits off: this measures serving capacity, not admission control
+    env = dict(os.environ, PYTHONPATH=HERE, EVENT_LOG_LEVEL="WARNING", GUNICORN_ACCESS_LOG="", RATE_LIMIT_ENABLED="0")
+    if kind == "dev":
+        code = ("import api_server; "
+                f"api_server.create_app().run(debug=True, use_reloader=False, port={port}, host='127.0.0.1')")
+        cmd = [sys.executable, "-c", code]
+    else:
+        cmd = [sys.executable, os.path.join(HERE, "serve.py"), "--bind", f"127.0.0.1:{port}",
+               "--workers", str(workers), "--threads", str(threads)]
+    return subprocess.Popen(cmd, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def compare(concurrency: int, duration: float, workers: int, threads: int) -> Dict[str, Any]:
+    results = {}
+    for kind in ("dev", "gunicorn"):
+        workdir = tempfile.mkdtemp(prefix=f"loadtest-{kind}-")
+        if os.path.exists(os.path.join(HERE, "data", "store.json")):
+            shutil.copytree(os.path.join(HERE, "data"), os.path.join(workdir, "data"))
+        port = _free_port()
+        process = _start(kind, port, workdir, workers, threads)
+        try:
+            base_url = f"http://127.0.0.1:{port}"
+            _wait_ready(base_url)
+            run_load(base_url, concurrency, min(2.0, duration))  # warm-up
+            results[kind] = run_load(base_url, concurrency, duration)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the API")
+    parser.add_argument("--url", default="http://127.0.0.1:5001", help="Server to test (ignored with --compare)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent keep-alive clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per run")
+    parser.add_argument("--compare", action="store_true", help="Start the dev server and gunicorn and test both")
+    parser.add_argument("--workers", type=int, default=4, help="Gunicorn workers for --compare")
+    parser.add_argument("--threads", type=int, default=8, help="Gunicorn threads per worker for --compare")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        results = compare(args.concurrency, args.duration, args.workers, args.threads)
+    else:
+        results = {args.url: run_load(args.url.rstrip("/"), args.concurrency, args.duration)}
+    print(json.dumps(results, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
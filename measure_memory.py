@@ -0,0 +1,170 @@
+"""
+Memory measurements for the compact recommendation model
+Builds synthetic stores of N recommendations (with votes) shaped like the
+ones json.load gives load_store, and reports per size the bytes per
+recommendation held as JSON dicts vs packed by compact.pack_store. Bytes
+are summed with sys.getsizeof over everything a store references, each
+shared object once; the JSON form is measured a chunk at a time (nothing in
+it is shared between recommendations), so only the packed form of the
+largest size has to fit in memory.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from array import array
+from typing import Any, Dict, Iterator, List
+
+import compact
+
+# The portfolio layouts generate_two_portfolios asks Claude for
+PORTFOLIOS = {
+    "etherfi-native": {
+        "Portfolio A — ether.fi Native": ["weETH Staking", "Liquid Vaults", "Aave Integration", "Pendle Integration",
+                                          "Gearbox Integration", "eBTC", "eUSD Stablecoins"],
+        "Portfolio B — Balanced Yield": ["weETH Staking", "Liquid Vaults", "Aave Integration", "eUSD Stablecoins",
+                                         "US Stocks", "ether.fi Cash"],
+    },
+    "traditional": {
+        "Portfolio A — Crypto Tilt": ["eETH", "BTC/Alts", "US Stocks", "Cash/FD"],
+        "Portfolio B — Balanced Traditional": ["eETH", "BTC/Alts", "US Stocks", "Cash/FD"],
+    },
+}
+RISKS = ["low", "medium", "high"]
+GOALS = ["steady yield", "growth", "capital preservation", "retirement"]
+CHUNK = 10_000
+
+def _weights(rng: random.Random, assets: List[str]) -> Dict[str, int]:
+    cuts = sorted(rng.sample(range(1, 100), len(assets) - 1))
+    return {asset: high - low for asset, low, high in zip(assets, [0] + cuts, cuts + [100])}
+
+def synthetic_store(count: int, seed: int = 7) -> Iterator[Dict[str, Any]]:
+    """Store sections for `count` recommendations, CHUNK at a time, each through a JSON round trip"""
+    rng = random.Random(seed)
+    brokers = [(broker_id, f"broker{broker_id}") for broker_id in range(1, 51)]
+    for start in range(0, count, CHUNK):
+        chunk = {"recs": {}, "votes": {}, "broker_votes": {}}
+        for i in range(start, min(start + CHUNK, count)):
+            rec_id = f"{i:08x}"
+            username = f"user{rng.randrange(count // 10 + 1)}"
+            risk, portfolio_type = rng.choice(RISKS), rng.choice(list(PORTFOLIOS))
+            # The market is refetched every few minutes, so neighbouring recommendations see the same snapshot
+            market_rng = random.Random(i // 50)
+            chunk["recs"][rec_id] = {
+                "user_hash": f"{rng.getrandbits(64):016x}",
+                "user_id": rng.randrange(1, 5000),
+                "username": username,
+                "input": {
+                    "profile": {"eth_holdings": round(rng.uniform(0.1, 50), 3), "risk": risk,
+                                "goal": rng.choice(GOALS), "portfolio_type": portfolio_type},
+                    "market": {"apy": round(market_rng.uniform(2.5, 6.0), 2), "tvl_b": round(market_rng.uniform(2, 8), 2),
+                               "eth_usd": round(market_rng.uniform(2000, 4500), 2)}
+                },
+                "portfolios": {name: _weights(rng, assets) for name, assets in PORTFOLIOS[portfolio_type].items()},
+                "summary": f"{username} leans {risk} risk; Portfolio A favours staking yield while Portfolio B keeps "
+                           f"{rng.randrange(5, 40)}% in stablecoins for drawdowns. APY and TVL are as of "
+                           f"block {rng.randrange(18_000_000, 21_000_000)}. Educational guidance only.",
+                "created_at": f"2026-{1 + i * 12 // count:02d}-{1 + rng.randrange(28):02d}T"
+                              f"{rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}.{rng.randrange(10**6):06d}"
+            }
+            voters = rng.sample(brokers, rng.randrange(0, 4))
+            tally: Dict[str, int] = {}
+            for broker_id, broker_username in voters:
+                choice = rng.choice(["A", "B"])
+                tally[choice] = tally.get(choice, 0) + 1
+                chunk["broker_votes"].setdefault(rec_id, {})[str(broker_id)] = {
+                    "broker_id": broker_id, "broker_username": broker_username, "choice": choice
+                }
+            chunk["votes"][rec_id] = tally
+        yield json.loads(json.dumps(chunk))
+
+# Objects that can be referenced from more than one place; everything else has one owner
+_SHAREABLE = (str, tuple, compact.Weights, compact.BrokerVote)
+
+def _size(obj: Any, seen: set) -> int:
+    """Bytes of `obj` and everything it references, counting objects in `seen` (and cached ones) as free"""
+    total = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        kind = type(obj)
+        if obj is None or kind is bool or (kind is int and -5 <= obj <= 256) or (kind is str and len(obj) <= 1):
+            continue  # Singletons and the interpreter's small int / one-character caches
+        if kind in _SHAREABLE:
+            if id(obj) in seen:
+                continue
+            seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if kind is dict:
+            stack.extend(obj)
+            stack.extend(obj.values())
+        elif kind is list or kind is tuple:
+            stack.extend(obj)
+        elif kind is not array and hasattr(kind, "__slots__"):
+            stack.extend(getattr(obj, slot) for slot in kind.__slots__)
+    return total
+
+def _tables(counts: Dict[str, int]) -> int:
+    # The section dicts themselves (rec id -> value), the same in both forms
+    return sum(sys.getsizeof(dict.fromkeys(range(count))) for count in counts.values())
+
+def measure(count: int) -> Dict[str, Any]:
+    """Bytes per recommendation as JSON dicts and packed"""
+    counts = {"recs": 0, "votes": 0, "broker_votes": 0}
+    json_bytes = 0
+    started = time.perf_counter()
+    for chunk in synthetic_store(count):
+        # json.load shares dict keys within one document; a chunk stands in for it
+        seen: set = set()
+        for section, values in chunk.items():
+            counts[section] += len(values)
+            json_bytes += sum(_size(rec_id, seen) + _size(value, seen) for rec_id, value in values.items())
+    json_bytes += _tables(counts)
+    json_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    packer = compact.Packer()
+    packed = {section: {} for section in counts}
+    for chunk in synthetic_store(count):
+        # One packer for the whole load, as pack_store does
+        packed["recs"].update((packer.string(rec_id), packer.rec(rec)) for rec_id, rec in chunk["recs"].items())
+        for section in ("votes", "broker_votes"):
+            packed[section].update((packer.string(rec_id), packer.value(value)) for rec_id, value in chunk[section].items())
+    del packer
+    seen = set()
+    packed_bytes = _tables(counts) + sum(
+        _size(rec_id, seen) + _size(value, seen) for values in packed.values() for rec_id, value in values.items()
+    )
+    packed_seconds = time.perf_counter() - started
+
+    return {
+        "recs": count,
+        "json": {"bytes_per_rec": round(json_bytes / count), "total_mb": round(json_bytes / 2**20),
+                 "seconds": round(json_seconds, 1)},
+        "compact": {"bytes_per_rec": round(packed_bytes / count), "total_mb": round(packed_bytes / 2**20),
+                    "seconds": round(packed_seconds, 1)},
+        "ratio": round(json_bytes / packed_bytes, 2)
+    }
+
+def verify(count: int) -> bool:
+    """pack_store -> unpack_store gives back exactly the same JSON"""
+    for chunk in synthetic_store(count):
+        if json.dumps(compact.unpack_store(compact.pack_store(chunk))) != json.dumps(chunk):
+            return False
+    return True
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure bytes per recommendation as JSON dicts and packed")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000], help="Recommendation counts")
+    parser.add_argument("--verify", type=int, default=20_000, help="Check the round trip on this many first (0 to skip)")
+    args = parser.parse_args(argv)
+
+    if args.verify and not verify(args.verify):
+        print("Round trip changed the store")
+        return 1
+    print(json.dumps([measure(count) for count in args.sizes], indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
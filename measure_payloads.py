@@ -0,0 +1,92 @@
+"""
+Payload measurements for GET /api/recommendations
+Builds synthetic stores of N recommendations and reports, per size, the
+JSON encode time of the stock Flask provider vs CompactJSONProvider and the
+bytes on the wire (and compression time) raw, gzip and brotli.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import compression
+from compression import CompactJSONProvider, compress
+
+ASSETS = ["eETH", "weETH", "Stablecoins", "LRT²", "Liquid ETH Yield", "BTC Vault"]
+RISKS = ["low", "medium", "high"]
+
+def synthetic_recs(count: int, seed: int = 7) -> Dict[str, Any]:
+    """`count` recommendations shaped like the ones create_recommendation stores"""
+    rng = random.Random(seed)
+    recs = {}
+    for i in range(count):
+        portfolios = {}
+        for name in ("Portfolio A", "Portfolio B"):
+            weights = [rng.random() for _ in ASSETS[:4]]
+            total = sum(weights)
+            portfolios[name] = {asset: round(w / total * 100, 1) for asset, w in zip(rng.sample(ASSETS, 4), weights)}
+        username = f"user{rng.randrange(count // 10 + 1)}"
+        recs[f"{i:08x}"] = {
+            "user_hash": f"{rng.getrandbits(64):016x}",
+            "user_id": rng.randrange(1, 5000),
+            "username": username,
+            "input": {
+                "profile": {"risk": rng.choice(RISKS), "eth_holdings": round(rng.uniform(0.1, 50), 3),
+                            "time_limit_days": rng.choice([30, 90, 180, 365]), "expected_return": rng.randrange(2, 30)},
+                "market": {"apy": round(rng.uniform(2.5, 6.0), 2), "tvl_b": round(rng.uniform(2, 8), 2),
+                           "eth_usd": round(rng.uniform(2000, 4500), 2)}
+            },
+            "portfolios": portfolios,
+            "summary": f"{username} leans {rng.choice(RISKS)} risk; Portfolio A favours staking yield while "
+                       f"Portfolio B keeps {rng.randrange(5, 40)}% in stablecoins for drawdowns."
+        }
+    return recs
+
+def _best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def measure(count: int, repeat: int = 3) -> Dict[str, Any]:
+    recs = synthetic_recs(count)
+    app = Flask(__name__)
+    stock = DefaultJSONProvider(app)
+    compact = CompactJSONProvider(app)
+    with app.app_context():
+        stock_body = stock.response(recs).get_data()
+        compact_body = compact.response(recs).get_data()
+        result = {
+            "recs": count,
+            "encoder": "orjson" if compression.orjson else "json",
+            "encode_ms": {
+                "stock": round(_best_of(lambda: stock.response(recs).get_data(), repeat) * 1000, 1),
+                "compact": round(_best_of(lambda: compact.response(recs).get_data(), repeat) * 1000, 1),
+            },
+            "bytes": {"stock": len(stock_body), "compact": len(compact_body)},
+            "compress_ms": {}
+        }
+    encodings = ["gzip"] + (["br"] if compression.brotli else [])
+    for encoding in encodings:
+        result["bytes"][encoding] = len(compress(compact_body, encoding))
+        result["compress_ms"][encoding] = round(_best_of(lambda: compress(compact_body, encoding), repeat) * 1000, 1)
+    return result
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure /api/recommendations payload size and encode time")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000], help="Recommendation counts")
+    parser.add_argument("--repeat", type=int, default=3, help="Best of this many runs")
+    args = parser.parse_args(argv)
+
+    print(json.dumps([measure(count, args.repeat) for count in args.sizes], indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
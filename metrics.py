@@ -0,0 +1,414 @@
+"""
+In-process metrics registry and structured event logging
+Counters, gauges and histograms keyed by label values, readable as a JSON
+snapshot or in the Prometheus text format. Values live in the process that
+recorded them; with METRICS_DIR set (serve.py's gunicorn config sets it), each
+process also writes its values there and the Prometheus text sums them over
+every worker.
+"""
+import bisect
+import fcntl
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Tuple
+
+# Latency buckets in seconds, sized for LLM calls (hundreds of ms to a minute)
+LLM_LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60)
+# Sized for HTTP requests and the store/database/fetch work inside them
+REQUEST_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_lock = threading.Lock()
+
+class Counter:
+    """Monotonic counter per label tuple"""
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def total(self, **match) -> float:
+        with _lock:
+            return sum(value for key, value in self.values.items() if _matches(self.labels, key, match))
+
+    def snapshot(self) -> list:
+        with _lock:
+            return [{**dict(zip(self.labels, key)), "value": value} for key, value in self.values.items()]
+
+class Gauge:
+    """Value that goes up and down per label tuple (e.g. requests in flight)"""
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **match) -> float:
+        with _lock:
+            return sum(value for key, value in self.values.items() if _matches(self.labels, key, match))
+
+    def snapshot(self) -> list:
+        with _lock:
+            return [{**dict(zip(self.labels, key)), "value": value} for key, value in self.values.items()]
+
+class Histogram:
+    """Bucketed distribution per label tuple; percentiles are interpolated within buckets"""
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (), buckets=LLM_LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series: Dict[Tuple[str, ...], Dict[str, Any]] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with _lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def count(self, **match) -> int:
+        """Number of observations over every series matching the labels"""
+        with _lock:
+            return sum(series["count"] for key, series in self.series.items() if _matches(self.labels, key, match))
+
+    def percentile(self, q: float, **match) -> float:
+        """Estimate the q-th quantile (0-1) over every series matching the labels"""
+        with _lock:
+            counts = [0] * (len(self.buckets) + 1)
+            for key, series in self.series.items():
+                if _matches(self.labels, key, match):
+                    counts = [a + b for a, b in zip(counts, series["counts"])]
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def snapshot(self) -> list:
+        with _lock:
+            items = [(key, dict(series, counts=list(series["counts"]))) for key, series in self.series.items()]
+        result = []
+        for key, series in items:
+            labels = dict(zip(self.labels, key))
+            result.append({
+                **labels,
+                "count": series["count"],
+                "sum": round(series["sum"], 6),
+                "avg": round(series["sum"] / series["count"], 6) if series["count"] else 0.0,
+                "p50": round(self.percentile(0.5, **labels), 6),
+                "p95": round(self.percentile(0.95, **labels), 6),
+                "p99": round(self.percentile(0.99, **labels), 6),
+            })
+        return result
+
+def _matches(names: Tuple[str, ...], key: Tuple[str, ...], match: Dict[str, Any]) -> bool:
+    return all(key[names.index(label)] == str(value) for label, value in match.items())
+
+REGISTRY: Dict[str, Any] = {}
+
+def counter(name: str, help_text: str, labels: Iterable[str] = ()) -> Counter:
+    """Get or create a registered counter"""
+    with _lock:
+        if name not in REGISTRY:
+            REGISTRY[name] = Counter(name, help_text, labels)
+        return REGISTRY[name]
+
+def histogram(name: str, help_text: str, labels: Iterable[str] = (), buckets=LLM_LATENCY_BUCKETS) -> Histogram:
+    """Get or create a registered histogram"""
+    with _lock:
+        if name not in REGISTRY:
+            REGISTRY[name] = Histogram(name, help_text, labels, buckets)
+        return REGISTRY[name]
+
+def gauge(name: str, help_text: str, labels: Iterable[str] = ()) -> Gauge:
+    """Get or create a registered gauge"""
+    with _lock:
+        if name not in REGISTRY:
+            REGISTRY[name] = Gauge(name, help_text, labels)
+        return REGISTRY[name]
+
+def snapshot(prefix: str = "") -> Dict[str, Any]:
+    """JSON-friendly view of every metric whose name starts with prefix"""
+    with _lock:
+        metrics = [m for name, m in REGISTRY.items() if name.startswith(prefix)]
+    return {m.name: m.snapshot() for m in metrics}
+
+# ====================== SPANS ======================
+
+SPAN_SECONDS = histogram("span_seconds", "Time spent in store, database, market and LLM calls",
+                         ("span", "outcome"), REQUEST_LATENCY_BUCKETS)
+
+@contextmanager
+def span(name: str):
+    """Time the enclosed block into span_seconds{span=name}"""
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        SPAN_SECONDS.observe(time.perf_counter() - started, span=name, outcome=outcome)
+
+def timed(name: str):
+    """Decorator form of span()"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# ====================== PROMETHEUS TEXT FORMAT ======================
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Tuple[str, ...], key: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, key)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+def render_prometheus() -> str:
+    """Every registered metric in the Prometheus text exposition format (0.0.4), over every worker"""
+    dump = _dump()
+    if METRICS_DIR:
+        dump = _merge([dump] + _read_others())
+    lines = []
+    for name in sorted(dump):
+        m = dump[name]
+        lines.append(f"# HELP {name} {m['help']}")
+        lines.append(f"# TYPE {name} {m['kind']}")
+        labels = tuple(m["labels"])
+        if m["kind"] != "histogram":
+            for key, value in sorted(m["values"].items()):
+                lines.append(f"{name}{_labels(labels, key)} {_number(value)}")
+            continue
+        bounds = [_number(bound) for bound in m["buckets"]] + ["+Inf"]
+        for key, series in sorted(m["series"].items()):
+            cumulative = 0
+            for bound, count in zip(bounds, series["counts"]):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{name}_bucket{_labels(labels, key, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels, key)} {_number(series['sum'])}")
+            lines.append(f"{name}_count{_labels(labels, key)} {series['count']}")
+    return "\n".join(lines) + "\n"
+
+# ====================== MULTIPROCESS ======================
+# Under several gunicorn workers a scrape reaches one of them at random, so
+# each process writes its values to METRICS_DIR/<pid>.json every
+# METRICS_FLUSH_SECONDS and the Prometheus text adds up every file. Files of
+# workers that stopped (recycled after max_requests) are folded into
+# retired.json: their counters and histograms keep counting, their gauges go.
+# Only /api/metrics is merged; the JSON metrics endpoints are per worker.
+
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+# A file not rewritten for this long belongs to a worker that's gone
+_RETIRE_AFTER = max(3 * METRICS_FLUSH_SECONDS, 30)
+_RETIRED = "retired.json"
+
+def _dump() -> Dict[str, Any]:
+    """This process's metrics as plain data: {name: {kind, help, labels, buckets, values | series}}"""
+    dump = {}
+    with _lock:
+        for m in REGISTRY.values():
+            if isinstance(m, Histogram):
+                dump[m.name] = {"kind": "histogram", "help": m.help, "labels": list(m.labels),
+                                "buckets": list(m.buckets),
+                                "series": {key: dict(series, counts=list(series["counts"]))
+                                           for key, series in m.series.items()}}
+            else:
+                dump[m.name] = {"kind": "counter" if isinstance(m, Counter) else "gauge", "help": m.help,
+                                "labels": list(m.labels), "values": dict(m.values)}
+    return dump
+
+def _encode(dump: Dict[str, Any]) -> str:
+    # JSON keys can't be tuples; store each series as [labels, value]
+    return json.dumps({name: {**m, "values" if "values" in m else "series":
+                              [[list(key), value] for key, value in m.get("values", m.get("series", {})).items()]}
+                       for name, m in dump.items()})
+
+def _decode(text: str) -> Dict[str, Any]:
+    dump = json.loads(text)
+    for m in dump.values():
+        field = "values" if "values" in m else "series"
+        m[field] = {tuple(key): value for key, value in m[field]}
+    return dump
+
+def _merge(dumps) -> Dict[str, Any]:
+    """Sum dumps series by series (histograms bucket by bucket)"""
+    merged: Dict[str, Any] = {}
+    for dump in dumps:
+        for name, m in dump.items():
+            into = merged.get(name)
+            if into is None:
+                into = merged[name] = {**m, "values" if "values" in m else "series": {}}
+            if m["kind"] != "histogram":
+                for key, value in m["values"].items():
+                    into["values"][key] = into["values"].get(key, 0.0) + value
+                continue
+            if m["buckets"] != into["buckets"]:
+                continue  # Redefined between deploys; keep the first layout
+            for key, series in m["series"].items():
+                total = into["series"].get(key)
+                if total is None:
+                    into["series"][key] = dict(series, counts=list(series["counts"]))
+                    continue
+                total["counts"] = [a + b for a, b in zip(total["counts"], series["counts"])]
+                total["sum"] += series["sum"]
+                total["count"] += series["count"]
+    return merged
+
+def _without_gauges(dump: Dict[str, Any]) -> Dict[str, Any]:
+    return {name: m for name, m in dump.items() if m["kind"] != "gauge"}
+
+def _read(path: str) -> Dict[str, Any]:
+    try:
+        with open(path) as f:
+            return _decode(f.read())
+    except (FileNotFoundError, ValueError):
+        return {}  # Retired or half-written by an older version
+
+def _write(path: str, dump: Dict[str, Any]):
+    # Rename over the old file, so readers never see it half-written
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(_encode(dump))
+    os.replace(tmp, path)
+
+def _read_others() -> list:
+    """Dumps written by the other processes; gauges only from the ones still running"""
+    own = f"{os.getpid()}.json"
+    dumps = []
+    now = time.time()
+    for name in os.listdir(METRICS_DIR):
+        if name == own or not name.endswith(".json"):
+            continue
+        path = os.path.join(METRICS_DIR, name)
+        dump = _read(path)
+        try:
+            live = name != _RETIRED and now - os.path.getmtime(path) < _RETIRE_AFTER
+        except FileNotFoundError:
+            live = False
+        dumps.append(dump if live else _without_gauges(dump))
+    return dumps
+
+def flush():
+    """Write this process's metrics to METRICS_DIR and fold stopped workers' files into retired.json"""
+    if not METRICS_DIR:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    _write(os.path.join(METRICS_DIR, f"{os.getpid()}.json"), _dump())
+    now = time.time()
+    stale = []
+    for name in os.listdir(METRICS_DIR):
+        if name.endswith(".json") and name != _RETIRED:
+            path = os.path.join(METRICS_DIR, name)
+            try:
+                if now - os.path.getmtime(path) >= _RETIRE_AFTER:
+                    stale.append(path)
+            except FileNotFoundError:
+                pass
+    if not stale:
+        return
+    with open(os.path.join(METRICS_DIR, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        retired = os.path.join(METRICS_DIR, _RETIRED)
+        dumps = [_read(retired)]
+        for path in stale:
+            if os.path.exists(path):  # Another worker may have folded it while we waited
+                dumps.append(_without_gauges(_read(path)))
+        _write(retired, _merge(dumps))
+        for path in stale:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+def clear_dir():
+    """Remove every worker's file (at server start, so a new run starts from zero)"""
+    if METRICS_DIR and os.path.isdir(METRICS_DIR):
+        for name in os.listdir(METRICS_DIR):
+            os.remove(os.path.join(METRICS_DIR, name))
+
+def _flush_forever():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            flush()
+        except Exception as e:
+            print(f"Metrics flush failed: {e}")
+
+def _start_flusher():
+    threading.Thread(target=_flush_forever, name="metrics-flush", daemon=True).start()
+
+def _after_fork():
+    # What the parent recorded before forking is in the parent's own file; don't count it again
+    for m in REGISTRY.values():
+        if isinstance(m, Histogram):
+            m.series.clear()
+        else:
+            m.values.clear()
+    _lock.release()
+    # Threads don't survive fork, so every forked worker starts its own
+    _start_flusher()
+
+if METRICS_DIR:
+    _start_flusher()
+    # Holding the lock across fork, so the child never inherits it mid-update
+    os.register_at_fork(before=_lock.acquire, after_in_parent=_lock.release, after_in_child=_after_fork)
+
+# ====================== STRUCTURED EVENTS ======================
+
+event_logger = logging.getLogger("etherfi.events")
+if not event_logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    event_logger.addHandler(_handler)
+    event_logger.setLevel(os.getenv("EVENT_LOG_LEVEL", "INFO"))
+    event_logger.propagate = False
+
+def log_event(event: str, **fields):
+    """Emit one JSON log line: {"ts", "event", ...fields}"""
+    if event_logger.isEnabledFor(logging.INFO):
+        event_logger.info(json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, default=str))
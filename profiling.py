@@ -0,0 +1,152 @@
+"""
+On-demand request profiling
+Off unless PROFILE_ADMIN_TOKEN or PROFILE_SAMPLE_RATE is set. A request
+carrying `X-Profile: <PROFILE_ADMIN_TOKEN>`, or a PROFILE_SAMPLE_RATE fraction
+of all requests, runs under cProfile. Each profile is written to PROFILE_DIR
+as <id>.prof (open with pstats or snakeviz) next to <id>.json with its route,
+status, latency and slowest functions.
+"""
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import metrics
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Fraction of requests profiled without asking, e.g. 0.001
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Secret for the X-Profile request header and the admin endpoints; unset turns both off
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+# Newest profiles kept on disk; older ones are deleted as new ones are written
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))
+PROFILE_HEADER = "X-Profile"
+ADMIN_HEADER = "X-Admin-Token"
+TOP_FUNCTIONS = 15
+
+PROFILES_WRITTEN = metrics.counter("profiles_written_total", "Requests profiled", ("trigger",))
+PROFILES_SKIPPED = metrics.counter("profiles_skipped_total", "Profiles not taken because another was running")
+
+# One profile at a time per process: a second profiler would compete for the
+# interpreter's profiling hook, and concurrent profiles would skew each other
+_running = threading.Lock()
+_PROFILE_ID = re.compile(r"^[0-9TZ_a-zA-Z.-]+$")
+
+def enabled() -> bool:
+    """Cheap check done on every request before anything else here"""
+    return bool(PROFILE_ADMIN_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+def is_admin(token: Optional[str]) -> bool:
+    return bool(PROFILE_ADMIN_TOKEN) and bool(token) and hmac.compare_digest(token, PROFILE_ADMIN_TOKEN)
+
+def trigger(header: Optional[str]) -> str:
+    """Why this request should be profiled ("header" or "sample"), or "" """
+    if header and is_admin(header):
+        return "header"
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return "sample"
+    return ""
+
+class RequestProfile:
+    __slots__ = ("profiler", "trigger", "started")
+
+    def __init__(self, trigger: str):
+        self.profiler = cProfile.Profile()
+        self.trigger = trigger
+        self.started = time.perf_counter()
+
+def start(trigger: str) -> Optional[RequestProfile]:
+    """Start profiling the current thread, or None if a profile is already running"""
+    if not _running.acquire(blocking=False):
+        PROFILES_SKIPPED.inc()
+        return None
+    profile = RequestProfile(trigger)
+    profile.profiler.enable()
+    return profile
+
+def abandon(profile: RequestProfile):
+    """Stop without writing anything (the request failed before a response)"""
+    profile.profiler.disable()
+    _running.release()
+
+def _slug(route: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9]+", "-", route).strip("-") or "root"
+
+def _top_functions(profiler: cProfile.Profile) -> List[Dict[str, Any]]:
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({"function": f"{os.path.basename(filename)}:{line}({name})", "calls": calls,
+                     "own_ms": round(own * 1000, 2), "cumulative_ms": round(cumulative * 1000, 2)})
+    rows.sort(key=lambda row: row["cumulative_ms"], reverse=True)
+    return rows[:TOP_FUNCTIONS]
+
+def finish(profile: RequestProfile, method: str, route: str, status: int) -> str:
+    """Stop profiling and write the profile; returns its id"""
+    profile.profiler.disable()
+    _running.release()
+    duration_ms = round((time.perf_counter() - profile.started) * 1000, 1)
+    created = datetime.utcnow()
+    # Sorts by time, and says what it was at a glance in a directory listing
+    profile_id = f"{created.strftime('%Y%m%dT%H%M%S.%fZ')}_{method}_{_slug(route)}_{int(duration_ms)}ms"
+    meta = {
+        "id": profile_id,
+        "method": method,
+        "route": route,
+        "status": status,
+        "duration_ms": duration_ms,
+        "trigger": profile.trigger,
+        "created_at": created.isoformat() + "Z",
+        "top": _top_functions(profile.profiler)
+    }
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile.profiler.dump_stats(os.path.join(PROFILE_DIR, f"{profile_id}.prof"))
+    with open(os.path.join(PROFILE_DIR, f"{profile_id}.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    PROFILES_WRITTEN.inc(trigger=profile.trigger)
+    print(f"Profiled {method} {route}: {duration_ms} ms -> {profile_id}.prof")
+    _prune()
+    return profile_id
+
+def _ids() -> List[str]:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return sorted((name[:-5] for name in os.listdir(PROFILE_DIR) if name.endswith(".json")), reverse=True)
+
+def _prune():
+    for profile_id in _ids()[PROFILE_KEEP:]:
+        for suffix in (".json", ".prof"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, profile_id + suffix))
+            except FileNotFoundError:
+                pass  # Another worker pruned it first
+
+def list_profiles(limit: int = 50, route: str = None) -> List[Dict[str, Any]]:
+    """Newest profiles first (their .json metadata), optionally for one route"""
+    profiles = []
+    for profile_id in _ids():
+        if len(profiles) == limit:
+            break
+        try:
+            with open(os.path.join(PROFILE_DIR, f"{profile_id}.json")) as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            continue  # Pruned or half-written
+        if route is None or meta.get("route") == route:
+            profiles.append(meta)
+    return profiles
+
+def profile_path(profile_id: str) -> Optional[str]:
+    """Path of the .prof file for `profile_id`, or None if there's no such profile"""
+    if not _PROFILE_ID.match(profile_id) or ".." in profile_id:
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.prof")
+    return path if os.path.exists(path) else None
@@ -0,0 +1,64 @@
+"""
+Compounded daily value curves for portfolio allocations
+Each asset grows at its own expected rate from the allocation engine;
+curves are vectorized over days and assets and memoized per
+(allocation, rate inputs of the market snapshot, horizon)
+"""
+from functools import lru_cache
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+from allocation import RATE_FIELDS, market_assumptions
+
+MAX_HORIZON_DAYS = 3650
+PROJECTION_CACHE_SIZE = 1024
+
+def _freeze(market: Dict[str, Any]) -> Tuple:
+    # Only the fields the rates come from, so a new ETH price or TVL doesn't miss the cache
+    return tuple((field, market.get(field)) for field in RATE_FIELDS if isinstance(market.get(field), (int, float, str)))
+
+@lru_cache(maxsize=PROJECTION_CACHE_SIZE)
+def _growth_curves(allocation: Tuple, market: Tuple, horizon: int) -> Tuple[Tuple[str, ...], np.ndarray, np.ndarray]:
+    """(assets, annual rates, (assets, horizon + 1) value of each bucket per 1 unit invested)"""
+    assets = tuple(asset for asset, _ in allocation)
+    weights = np.array([float(weight) for _, weight in allocation])
+    weights = weights / weights.sum()
+    _, rates, _ = market_assumptions(dict(market), list(assets))
+    days = np.arange(horizon + 1)
+    curves = weights[:, None] * np.power(1.0 + rates[:, None], days[None, :] / 365.0)
+    curves.setflags(write=False)
+    rates.setflags(write=False)
+    return assets, rates, curves
+
+def project_portfolio(allocation: Dict[str, float], market: Dict[str, Any], eth_holdings: float,
+                      eth_price: float, time_limit_days: int) -> Dict[str, Any]:
+    """
+    Daily value of the position in each allocation bucket and in total,
+    from day 0 to `time_limit_days`, compounding each bucket at its own rate.
+    Raises ValueError for an empty allocation or an out-of-range horizon.
+    """
+    horizon = int(time_limit_days)
+    if not 0 <= horizon <= MAX_HORIZON_DAYS:
+        raise ValueError(f"time_limit_days must be between 0 and {MAX_HORIZON_DAYS}")
+    if not allocation or sum(float(w) for w in allocation.values()) <= 0:
+        raise ValueError("Allocation has no positive weights")
+
+    # Allocation keys keep their order so the curves come back in chart order
+    key = tuple((asset, float(weight)) for asset, weight in allocation.items())
+    assets, rates, curves = _growth_curves(key, _freeze(market), horizon)
+    initial_investment = round(float(eth_holdings) * float(eth_price), 2)
+    values = np.round(curves * initial_investment, 2)
+    total = np.round(values.sum(axis=0), 2)
+    return {
+        "initial_investment": initial_investment,
+        "days": list(range(horizon + 1)),
+        "total": total.tolist(),
+        "assets": {asset: values[i].tolist() for i, asset in enumerate(assets)},
+        "annual_rates_pct": {asset: round(float(rates[i]) * 100.0, 2) for i, asset in enumerate(assets)},
+        "final_value": float(total[-1]),
+        "profit": round(float(total[-1]) - initial_investment, 2),
+    }
+
+def cache_info():
+    return _growth_curves.cache_info()
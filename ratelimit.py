@@ -0,0 +1,162 @@
+"""
+Admission control for the API
+Token buckets per principal (signed-in account or client address) and per
+endpoint class, plus one global bucket per class, so a burst of LLM
+generations can't starve votes and polls. In-flight LLM requests are capped
+separately. Buckets and slots live in one process: under gunicorn every
+worker has its own, so the real limits are the workers times these.
+"""
+import math
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+import metrics
+
+# (refill per second, burst) for one principal and for everyone together;
+# override with RATE_LIMIT_<CLASS>_PRINCIPAL / RATE_LIMIT_<CLASS>_GLOBAL="rate/burst"
+DEFAULT_LIMITS = {
+    "llm":     {"principal": (0.1, 3),  "global": (2.0, 10)},     # Claude calls, seconds each
+    "market":  {"principal": (1.0, 5),  "global": (5.0, 10)},     # DefiLlama / CoinGecko round trips
+    "compute": {"principal": (2.0, 5),  "global": (10.0, 20)},    # numpy simulations and backtests
+    "write":   {"principal": (5.0, 20), "global": (100.0, 200)},  # whole-store rewrites
+    "read":    {"principal": (20.0, 60), "global": (500.0, 1000)},
+}
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+# Requests holding a Claude call at once in this process. Keep it below the
+# threads per worker (GUNICORN_THREADS, 8) so some are always free for cheap requests
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "4"))
+
+RATE_LIMITED = metrics.counter("rate_limited_total", "Requests turned away by admission control", ("endpoint_class", "scope"))
+LLM_IN_FLIGHT = metrics.gauge("llm_requests_in_flight", "Requests holding an LLM slot")
+
+def _parse_limit(value: str, default: Tuple[float, float]) -> Tuple[float, float]:
+    if not value:
+        return default
+    rate, _, burst = value.partition("/")
+    return float(rate), float(burst or rate)
+
+def load_limits() -> Dict[str, Dict[str, Tuple[float, float]]]:
+    """DEFAULT_LIMITS with any environment overrides applied"""
+    return {
+        name: {
+            scope: _parse_limit(os.getenv(f"RATE_LIMIT_{name.upper()}_{scope.upper()}", ""), default)
+            for scope, default in scopes.items()
+        }
+        for name, scopes in DEFAULT_LIMITS.items()
+    }
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float, cost: float = 1) -> float:
+        """Spend `cost` tokens; 0 if there were enough, else seconds until there will be"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def refund(self, cost: float = 1):
+        self.tokens = min(self.burst, self.tokens + cost)
+
+    def idle(self, now: float) -> bool:
+        # Full again, so dropping it is the same as keeping it
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+class RateLimiter:
+    """Per-principal and global token buckets for each endpoint class"""
+
+    def __init__(self, limits: Dict[str, Dict[str, Tuple[float, float]]] = None, enabled: bool = RATE_LIMIT_ENABLED):
+        self.limits = limits or load_limits()
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._last_sweep = time.monotonic()
+
+    def check(self, endpoint_class: str, principal: str, cost: float = 1, refund: bool = True) -> float:
+        """
+        Admit a request of `endpoint_class` from `principal` costing `cost`
+        tokens: 0 if admitted, else the seconds to wait before retrying. With
+        `refund`, a request refused by the global bucket gives its principal
+        tokens back; pass False for principals that could be anyone.
+        """
+        if not self.enabled or endpoint_class not in self.limits:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            own = self._bucket(endpoint_class, principal, "principal", now)
+            wait = own.take(now, cost)
+            if wait:
+                RATE_LIMITED.inc(endpoint_class=endpoint_class, scope="principal")
+                return wait
+            wait = self._bucket(endpoint_class, "*", "global", now).take(now, cost)
+            if wait:
+                if refund:
+                    own.refund(cost)
+                RATE_LIMITED.inc(endpoint_class=endpoint_class, scope="global")
+                return wait
+            self._sweep(now)
+            return 0.0
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def max_cost(self, endpoint_class: str) -> float:
+        """Most tokens one request of `endpoint_class` can ever be admitted for"""
+        limits = self.limits.get(endpoint_class)
+        return min(limits["principal"][1], limits["global"][1]) if limits and self.enabled else math.inf
+
+    def _bucket(self, endpoint_class: str, principal: str, scope: str, now: float) -> TokenBucket:
+        key = (endpoint_class, principal)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            rate, burst = self.limits[endpoint_class][scope]
+            bucket = self._buckets[key] = TokenBucket(rate, burst, now)
+        return bucket
+
+    def _sweep(self, now: float):
+        # Called with the lock held, at most once a minute
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        for key in [key for key, bucket in self._buckets.items() if bucket.idle(now)]:
+            del self._buckets[key]
+
+class ConcurrencyCap:
+    """Non-blocking cap on LLM work in flight; callers that don't get a slot are turned away"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            LLM_IN_FLIGHT.inc()
+            return True
+
+    def release(self):
+        with self._lock:
+            if self.in_flight:
+                self.in_flight -= 1
+                LLM_IN_FLIGHT.dec()
+
+def retry_after_header(seconds: float) -> str:
+    """Retry-After takes whole seconds; never tell a client to retry immediately"""
+    return str(max(1, math.ceil(seconds)))
+
+limiter = RateLimiter()
+llm_slots = ConcurrencyCap(LLM_MAX_IN_FLIGHT)
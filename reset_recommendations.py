@@ -1,23 +1,37 @@
 """
 Reset recommendations data to start fresh with user tracking
 """
-import json
 import os
 
-def reset_store():
-    """Reset store.json to empty state"""
-    store_path = os.path.join(os.path.dirname(__file__), 'data', 'store.json')
+from utils import file_lock, write_json_atomic
+
+def reset_store(store_path: str = None):
+    """
+    Reset store.json to empty state. Decision sequence numbers keep counting
+    in auth.db, so new decisions still settle past the old watermark.
+    """
+    store_path = store_path or os.path.join(os.path.dirname(__file__), 'data', 'store.json')
     
     fresh_store = {
         "users": {},
         "recs": {},
         "votes": {},
         "decisions": {},
-        "feedback": {}
+        "feedback": {},
+        "rec_order": [],
+        "broker_voted": {}
     }
     
-    with open(store_path, 'w') as f:
-        json.dump(fresh_store, f, indent=2)
+    # The same lock as the server's store writes, so none of them is lost halfway
+    with file_lock(store_path):
+        write_json_atomic(store_path, fresh_store)
+    
+    # Invalidate cached recommendation lists (old ETags)
+    import database
+    database.init_db()
+    database.bump_versions(["recs"])
+    import search
+    search.clear_index()
     
     print("✅ Store reset successfully!")
     print("📝 All old recommendations cleared")
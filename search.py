@@ -0,0 +1,237 @@
+"""
+Recommendation search
+An inverted index over each recommendation's username, goal and LLM summary,
+kept in SQLite next to the other shared state and updated one recommendation
+at a time as they're created. Each posting carries its precomputed BM25 term
+weight and is read best first, so a query touches at most SEARCH_SCAN_LIMIT
+postings per word (plus the filter indexes) and never the JSON store: its
+cost doesn't grow with the number of recommendations. Risk, portfolio type,
+username and creation time are exact filters.
+"""
+import argparse
+import heapq
+import math
+import os
+import re
+import sys
+from typing import Any, Dict, List, Optional
+
+import database
+import metrics
+
+# A match in the username counts for more than one in the goal, and that more than the summary
+FIELD_WEIGHTS = {"username": 3.0, "goal": 2.0, "summary": 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+SEARCH_MAX_LIMIT = 100
+MAX_QUERY_TERMS = 10
+# Postings read per query word, best weight first. A word in more recommendations
+# than this ranks only its best ones, and results are paged no further
+SEARCH_SCAN_LIMIT = int(os.getenv("SEARCH_SCAN_LIMIT", "1000"))
+# Too common to narrow anything down
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or that the this to was while will with".split()
+)
+_WORD = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words of `text` without stopwords, in order (repeats kept)"""
+    return [word for word in _WORD.findall((text or "").lower()) if word not in STOPWORDS]
+
+def _document(rec_id: str, rec: Dict[str, Any]) -> Dict[str, Any]:
+    profile = (rec.get("input") or {}).get("profile") or {}
+    username = rec.get("username") or ""
+    return {
+        "rec_id": rec_id,
+        "username": username,
+        "username_key": username.strip().lower(),
+        "risk": (profile.get("risk") or "").lower() or None,
+        "portfolio_type": (profile.get("portfolio_type") or "").lower() or None,
+        "goal": profile.get("goal") or "",
+        "summary": rec.get("summary") or "",
+        "created_at": rec.get("created_at"),
+    }
+
+def _add_stats(cursor, docs: int, length: int):
+    cursor.executemany('''
+        INSERT INTO search_stats (name, value) VALUES (?, ?)
+        ON CONFLICT (name) DO UPDATE SET value = value + excluded.value
+    ''', [("docs", docs), ("length", length)])
+
+def _add_doc_freq(cursor, terms, delta: int):
+    cursor.executemany('''
+        INSERT INTO search_terms (term, df) VALUES (?, ?)
+        ON CONFLICT (term) DO UPDATE SET df = df + excluded.df
+    ''', [(term, delta) for term in terms])
+
+def _unindex(cursor, rec_id: str):
+    cursor.execute('SELECT length FROM search_docs WHERE rec_id = ?', (rec_id,))
+    previous = cursor.fetchone()
+    if not previous:
+        return
+    cursor.execute('SELECT term FROM search_postings WHERE rec_id = ?', (rec_id,))
+    _add_doc_freq(cursor, [row['term'] for row in cursor.fetchall()], -1)
+    cursor.execute('DELETE FROM search_postings WHERE rec_id = ?', (rec_id,))
+    cursor.execute('DELETE FROM search_docs WHERE rec_id = ?', (rec_id,))
+    _add_stats(cursor, -1, -previous['length'])
+
+def _index(cursor, rec_id: str, rec: Dict[str, Any]):
+    doc = _document(rec_id, rec)
+    # Field-weighted term frequency, and the unweighted length BM25 normalizes by
+    weighted: Dict[str, float] = {}
+    length = 0
+    for field, weight in FIELD_WEIGHTS.items():
+        for term in tokenize(doc[field]):
+            weighted[term] = weighted.get(term, 0.0) + weight
+            length += 1
+
+    _unindex(cursor, rec_id)
+    cursor.execute("SELECT name, value FROM search_stats")
+    stats = {row['name']: row['value'] for row in cursor.fetchall()}
+    # The average as of indexing time; close enough once there are a few hundred recommendations
+    avg_length = (stats.get("length", 0) + length) / (stats.get("docs", 0) + 1) or 1.0
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+
+    cursor.execute('''
+        INSERT INTO search_docs
+            (rec_id, username, username_key, risk, portfolio_type, goal, summary, created_at, length)
+        VALUES (:rec_id, :username, :username_key, :risk, :portfolio_type, :goal, :summary, :created_at, :length)
+    ''', {**doc, "length": length})
+    cursor.executemany(
+        'INSERT INTO search_postings (term, rec_id, impact) VALUES (?, ?, ?)',
+        [(term, rec_id, tf * (BM25_K1 + 1) / (tf + norm)) for term, tf in weighted.items()]
+    )
+    _add_doc_freq(cursor, weighted, 1)
+    _add_stats(cursor, 1, length)
+
+def index_recommendations(recs: Dict[str, Dict[str, Any]]):
+    """Add (or re-index) recommendations {rec_id: rec} in one transaction"""
+    if not recs:
+        return
+    conn = database.get_db()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        for rec_id, rec in recs.items():
+            _index(cursor, rec_id, rec)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def index_recommendation(rec_id: str, rec: Dict[str, Any]):
+    """Add one recommendation to the index (or refresh it); call after saving it"""
+    index_recommendations({rec_id: rec})
+
+def index_missing(recs: Dict[str, Dict[str, Any]]) -> int:
+    """Index the recommendations not in the index yet (e.g. from before it existed); returns how many"""
+    conn = database.get_db()
+    indexed = {row['rec_id'] for row in conn.execute('SELECT rec_id FROM search_docs')}
+    conn.close()
+    missing = {rec_id: rec for rec_id, rec in recs.items() if rec_id not in indexed}
+    index_recommendations(missing)
+    return len(missing)
+
+def clear_index():
+    """Drop every indexed recommendation (when the store is reset)"""
+    conn = database.get_db()
+    for table in ("search_postings", "search_terms", "search_docs", "search_stats"):
+        conn.execute(f'DELETE FROM {table}')
+    conn.commit()
+    conn.close()
+
+def _filters(risk, portfolio_type, username, since):
+    clauses, params = [], []
+    for column, values in (("risk", risk), ("portfolio_type", portfolio_type), ("username_key", username)):
+        values = [value.strip().lower() for value in values or [] if value.strip()]
+        if values:
+            clauses.append(f"d.{column} IN ({','.join('?' * len(values))})")
+            params.extend(values)
+    if since:
+        clauses.append("d.created_at >= ?")
+        params.append(since)
+    return clauses, params
+
+def _hit(row, score: Optional[float] = None) -> Dict[str, Any]:
+    hit = {key: row[key] for key in ("rec_id", "username", "risk", "portfolio_type", "goal", "summary", "created_at")}
+    if score is not None:
+        hit["score"] = round(score, 4)
+    return hit
+
+@metrics.timed("search")
+def search(query: str = "", risk: List[str] = None, portfolio_type: List[str] = None,
+           username: List[str] = None, since: str = None, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+    """
+    Recommendations matching every filter (each a list of accepted values) and,
+    when `query` has any words, at least one of them, best BM25 score first.
+    Without words the matches come newest first. Returns {results, has_more}.
+    """
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    offset = max(0, offset)
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    clauses, params = _filters(risk, portfolio_type, username, since)
+    conn = database.get_db()
+    try:
+        if not terms:
+            where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+            rows = conn.execute(
+                f'SELECT * FROM search_docs d {where} ORDER BY d.created_at DESC LIMIT ? OFFSET ?',
+                params + [limit + 1, offset]
+            ).fetchall()
+            return {"results": [_hit(row) for row in rows[:limit]], "has_more": len(rows) > limit}
+
+        total_docs = conn.execute("SELECT value FROM search_stats WHERE name = 'docs'").fetchone()
+        total_docs = total_docs['value'] if total_docs else 0
+        doc_freq = {row['term']: row['df'] for row in conn.execute(
+            f'SELECT term, df FROM search_terms WHERE term IN ({",".join("?" * len(terms))})', terms
+        )}
+        filters = "".join(" AND " + clause for clause in clauses)
+        scores: Dict[str, float] = {}
+        created: Dict[str, str] = {}
+        for term in terms:
+            if not doc_freq.get(term):
+                continue
+            # Document frequency over the whole index, so filters don't change what a word is worth
+            idf = math.log(1 + (total_docs - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            for row in conn.execute(f'''
+                SELECT p.rec_id, p.impact, d.created_at
+                FROM search_postings p JOIN search_docs d ON d.rec_id = p.rec_id
+                WHERE p.term = ?{filters}
+                ORDER BY p.impact DESC LIMIT ?
+            ''', [term] + params + [SEARCH_SCAN_LIMIT]):
+                scores[row['rec_id']] = scores.get(row['rec_id'], 0.0) + idf * row['impact']
+                created[row['rec_id']] = row['created_at'] or ""
+
+        # Best score first, ties to the newer recommendation; only the pages up to this one are ordered
+        ranked = heapq.nlargest(offset + limit + 1, scores, key=lambda rec_id: (scores[rec_id], created[rec_id]))
+        page = ranked[offset:offset + limit]
+        found = {row['rec_id']: row for row in conn.execute(
+            f'SELECT * FROM search_docs WHERE rec_id IN ({",".join("?" * len(page))})', page
+        )} if page else {}
+        return {
+            "results": [_hit(found[rec_id], scores[rec_id]) for rec_id in page],
+            "has_more": len(ranked) > offset + limit
+        }
+    finally:
+        conn.close()
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build or query the recommendation search index")
+    parser.add_argument("--rebuild", action="store_true", help="Drop the index and re-index the whole store")
+    parser.add_argument("query", nargs="?", default="", help="Words to search for")
+    args = parser.parse_args(argv)
+
+    database.init_db()
+    if args.rebuild:
+        from utils import load_store
+        clear_index()
+        print(f"Indexed {index_missing(load_store().get('recs', {}))} recommendations")
+    if args.query:
+        for hit in search(args.query)["results"]:
+            print(f"{hit['score']:8.3f}  {hit['rec_id']}  {hit['username']}  {hit['summary'][:80]}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
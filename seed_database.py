@@ -3,18 +3,28 @@ Seed the database with test users and brokers
 """
 import database
 
+# Test users
+SEED_USERS = [
+    {"username": "alice", "email": "alice@defi.com", "password": "alice123", "eth_holdings": 10.0},
+    {"username": "bob", "email": "bob@defi.com", "password": "bob123", "eth_holdings": 25.5},
+    {"username": "charlie", "email": "charlie@defi.com", "password": "charlie123", "eth_holdings": 5.0},
+    {"username": "diana", "email": "diana@defi.com", "password": "diana123", "eth_holdings": 50.0},
+    {"username": "eve", "email": "eve@defi.com", "password": "eve123", "eth_holdings": 15.75},
+]
+
+# Test brokers
+SEED_BROKERS = [
+    {"username": "broker_john", "email": "john@broker.com", "password": "john123"},
+    {"username": "broker_sarah", "email": "sarah@broker.com", "password": "sarah123"},
+    {"username": "broker_mike", "email": "mike@broker.com", "password": "mike123"},
+    {"username": "broker_lisa", "email": "lisa@broker.com", "password": "lisa123"},
+]
+
 def seed_data():
     """Create test users and brokers"""
     print("🌱 Seeding database with test data...\n")
     
-    # Create test users
-    users = [
-        {"username": "alice", "email": "alice@defi.com", "password": "alice123", "eth_holdings": 10.0},
-        {"username": "bob", "email": "bob@defi.com", "password": "bob123", "eth_holdings": 25.5},
-        {"username": "charlie", "email": "charlie@defi.com", "password": "charlie123", "eth_holdings": 5.0},
-        {"username": "diana", "email": "diana@defi.com", "password": "diana123", "eth_holdings": 50.0},
-        {"username": "eve", "email": "eve@defi.com", "password": "eve123", "eth_holdings": 15.75},
-    ]
+    users = SEED_USERS
     
     print("👤 Creating test users...")
     for user_data in users:
@@ -29,13 +39,7 @@ def seed_data():
         else:
             print(f"   ⚠️  User {user_data['username']} already exists")
     
-    # Create test brokers
-    brokers = [
-        {"username": "broker_john", "email": "john@broker.com", "password": "john123"},
-        {"username": "broker_sarah", "email": "sarah@broker.com", "password": "sarah123"},
-        {"username": "broker_mike", "email": "mike@broker.com", "password": "mike123"},
-        {"username": "broker_lisa", "email": "lisa@broker.com", "password": "lisa123"},
-    ]
+    brokers = SEED_BROKERS
     
     print("\n🧑‍💼 Creating test brokers...")
     for broker_data in brokers:
@@ -0,0 +1,23 @@
+"""
+Production entry point: runs api_server under gunicorn with gunicorn.conf.py
+Extra arguments are passed to gunicorn, e.g. `python serve.py --workers 4`
+Graceful reload: `kill -HUP <master pid>`; graceful stop: `kill -TERM <master pid>`
+"""
+import os
+import sys
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py")
+
+def main(argv=None) -> int:
+    try:
+        from gunicorn.app.wsgiapp import run
+    except ImportError:
+        print("gunicorn is not installed: pip install -r requirements_api.txt", file=sys.stderr)
+        return 1
+    # Like `python api_server.py`, data/store.json is resolved against the current directory
+    sys.argv = ["gunicorn", "--config", CONFIG_PATH, "--pythonpath", os.path.dirname(CONFIG_PATH),
+                *(argv if argv is not None else sys.argv[1:]), "api_server:create_app()"]
+    return run()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Batched settlement of broker earnings
+Moves each broker's reward_split share of newly recorded decisions into the
+brokers table, in batches, one transaction per batch. A watermark over
+decision sequence numbers makes re-runs idempotent; both the sequence and
+the watermark live in SQLite.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List
+
+import database
+from utils import load_store
+
+SETTLEMENT_BATCH_SIZE = int(os.getenv("SETTLEMENT_BATCH_SIZE", "500"))
+# Seconds the worker waits after a nudge so bursts of decisions settle together
+SETTLEMENT_DELAY = float(os.getenv("SETTLEMENT_DELAY", "2"))
+
+def mark_for_settlement(store: Dict[str, Any], rec_id: str):
+    """
+    Give the decision on `rec_id` the next sequence number so the next
+    settlement run picks it up. Call for a new or changed decision and when
+    a broker votes on an already decided recommendation.
+    """
+    decision = store.get("decisions", {}).get(rec_id)
+    if decision is None:
+        return
+    # Allocated next to the watermark, so a reset store can't reuse settled numbers
+    seq = database.next_decision_seq(store.get("decision_seq", 0))
+    store["decision_seq"] = seq
+    decision["seq"] = seq
+
+def _ledger_entries(store: Dict[str, Any], rec_id: str, decision: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # Every broker who voted on the recommendation earns the broker share
+    amount = decision.get("reward_split", {}).get("broker") or 0.0
+    username = store.get("recs", {}).get(rec_id, {}).get("username", "Anonymous")
+    entries = []
+    for broker_key in store.get("broker_votes", {}).get(rec_id, {}):
+        try:
+            broker_id = int(broker_key)
+        except ValueError:
+            continue  # Anonymous votes ("None") have nobody to pay
+        entries.append({
+            "broker_id": broker_id,
+            "rec_id": rec_id,
+            "amount": float(amount),
+            "decision": decision.get("decision"),
+            "username": username,
+            "decision_seq": decision.get("seq", 0)
+        })
+    return entries
+
+def settle_pending(store: Dict[str, Any] = None, batch_size: int = SETTLEMENT_BATCH_SIZE) -> Dict[str, Any]:
+    """
+    Settle every decision above the watermark, oldest first, `batch_size`
+    decisions per transaction. Decisions recorded before sequencing existed
+    count as sequence 0 and are settled by the first run.
+    """
+    store = store if store is not None else load_store()
+    decisions = store.get("decisions", {})
+    watermark = database.get_settlement_watermark()
+    pending = sorted(
+        ((decision.get("seq", 0), rec_id, decision) for rec_id, decision in decisions.items()
+         if decision.get("seq", 0) > watermark),
+        key=lambda item: item[0]
+    )
+
+    summary = {"decisions": 0, "entries": 0, "batches": 0, "brokers": {}, "watermark": watermark}
+    start = 0
+    while start < len(pending):
+        end = min(start + max(1, batch_size), len(pending))
+        # Never split equal sequence numbers (legacy 0s) across the watermark
+        while end < len(pending) and pending[end][0] == pending[end - 1][0]:
+            end += 1
+        batch = pending[start:end]
+        start = end
+        entries = [entry for _, rec_id, decision in batch for entry in _ledger_entries(store, rec_id, decision)]
+        new_watermark = batch[-1][0]
+        increments = database.apply_settlement(entries, new_watermark, watermark)
+        if increments is None:
+            print("Settlement watermark moved underneath us; another settler is running")
+            break
+        watermark = new_watermark
+        summary["decisions"] += len(batch)
+        summary["entries"] += len(entries)
+        summary["batches"] += 1
+        for broker_id, amount in increments.items():
+            summary["brokers"][broker_id] = round(summary["brokers"].get(broker_id, 0.0) + amount, 2)
+    summary["watermark"] = watermark
+    return summary
+
+class SettlementWorker:
+    """Background thread that settles shortly after being nudged"""
+
+    def __init__(self, delay: float = SETTLEMENT_DELAY):
+        self.delay = delay
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.last_run: Dict[str, Any] = {}
+
+    def nudge(self):
+        """Ask for a settlement run; calls within `delay` seconds share one run"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="settlement", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.delay)
+            self._wake.clear()
+            try:
+                self.last_run = settle_pending()
+            except Exception as e:
+                print(f"Settlement run failed: {e}")
+
+settlement_worker = SettlementWorker()
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Settle broker earnings for newly recorded decisions")
+    parser.add_argument("--batch-size", type=int, default=SETTLEMENT_BATCH_SIZE, help="Decisions per transaction")
+    args = parser.parse_args(argv)
+
+    database.init_db()
+    summary = settle_pending(batch_size=args.batch_size)
+    print(f"Settled {summary['decisions']} decisions ({summary['entries']} broker entries) "
+          f"in {summary['batches']} batches; watermark {summary['watermark']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+Monte Carlo outcome simulator for generated portfolios
+Draws seeded, correlated per-asset returns over the holding period and
+reports percentile bands, probability of loss and the expected reward split
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+from allocation import market_assumptions
+from whatif import reward_split_batch, round_cents
+
+DEFAULT_PATHS = 10_000
+MAX_PATHS = 1_000_000
+# Paths per independently seeded chunk; results don't depend on how chunks are spread over processes
+CHUNK_PATHS = 25_000
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+# 0 runs every chunk in the calling process
+SIMULATION_PROCESSES = int(os.getenv("SIMULATION_PROCESSES", "0"))
+
+_pool = None
+
+def _get_pool(processes: int) -> ProcessPoolExecutor:
+    # One long-lived pool; spawning processes per request would cost more than the simulation
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=processes)
+    return _pool
+
+def _simulate_chunk(seed: np.random.SeedSequence, paths: int, weights: np.ndarray, drift: np.ndarray,
+                    chol: np.ndarray) -> np.ndarray:
+    """Growth factor of a buy-and-hold portfolio for `paths` correlated GBM draws"""
+    rng = np.random.default_rng(seed)
+    shocks = rng.standard_normal((paths, len(weights))) @ chol.T
+    return np.exp(drift + shocks) @ weights
+
+def simulate_growth(allocation: Dict[str, float], market: Dict[str, Any], days: int,
+                    paths: int = DEFAULT_PATHS, seed: int = None, processes: int = None) -> np.ndarray:
+    """
+    Terminal value of 1 unit invested in `allocation` ({asset: pct}) after
+    `days`, for each of `paths` scenarios. Each asset follows a geometric
+    Brownian motion with the engine's expected returns and covariance, so
+    only the terminal draw is needed. Same seed, same answer, whatever
+    `processes` is.
+    """
+    assets = list(allocation)
+    weights = np.array([float(allocation[asset]) for asset in assets])
+    if not len(assets) or weights.sum() <= 0:
+        raise ValueError("Allocation has no positive weights")
+    weights = weights / weights.sum()
+    _, mu, cov = market_assumptions(market, assets)
+    years = max(int(days), 0) / 365.0
+    drift = (mu - 0.5 * np.diag(cov)) * years
+    chol = np.linalg.cholesky(cov * years) if years else np.zeros_like(cov)
+
+    sizes = [CHUNK_PATHS] * (paths // CHUNK_PATHS) + ([paths % CHUNK_PATHS] if paths % CHUNK_PATHS else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    processes = SIMULATION_PROCESSES if processes is None else processes
+    if processes > 1 and len(sizes) > 1:
+        pool = _get_pool(processes)
+        chunks = pool.map(_simulate_chunk, seeds, sizes, *([x] * len(sizes) for x in (weights, drift, chol)))
+    else:
+        chunks = (_simulate_chunk(s, n, weights, drift, chol) for s, n in zip(seeds, sizes))
+    return np.concatenate(list(chunks))
+
+def simulate_portfolio(allocation: Dict[str, float], market: Dict[str, Any], eth_holdings: float,
+                       eth_price: float, time_limit_days: int, paths: int = DEFAULT_PATHS, seed: int = None,
+                       percentiles: Sequence[float] = DEFAULT_PERCENTILES, processes: int = None) -> Dict[str, Any]:
+    """Outcome distribution for one portfolio, in the units of calculate_profit and reward_split"""
+    paths = int(paths)
+    if not 1 <= paths <= MAX_PATHS:
+        raise ValueError(f"paths must be between 1 and {MAX_PATHS}")
+    initial_investment = round(float(eth_holdings) * float(eth_price), 2)
+    growth = simulate_growth(allocation, market, time_limit_days, paths, seed, processes)
+    final_values = round_cents(initial_investment * growth)
+    profits = round_cents(final_values - initial_investment)
+    split = reward_split_batch(profits)
+    levels: List[float] = list(percentiles)
+
+    return {
+        "paths": paths,
+        "seed": seed,
+        "time_period_days": int(time_limit_days),
+        "initial_investment": initial_investment,
+        "final_value": _bands(final_values, levels),
+        "profit": _bands(profits, levels),
+        "expected_profit": round(float(profits.mean()), 2),
+        "probability_of_loss": round(float((profits < 0).mean()), 4),
+        "expected_split": {share: round(float(split[share].mean()), 2) for share in ("user", "broker", "platform")},
+    }
+
+def _bands(values: np.ndarray, levels: List[float]) -> Dict[str, float]:
+    return {f"p{level:g}": round(float(v), 2) for level, v in zip(levels, np.percentile(values, levels))}
@@ -0,0 +1,195 @@
+"""
+Incremental parser for the two-portfolio JSON Claude streams back
+Validates the schema as characters arrive so a bad completion is rejected
+early, and reports the result the moment the top-level object closes
+"""
+import json
+from typing import Any, Dict, Iterable, Optional
+
+from assets import ASSET_PARAMS
+
+KNOWN_ASSETS = frozenset(ASSET_PARAMS)
+# Prose the model may write before the opening brace ("Here is the JSON:")
+MAX_PREAMBLE_CHARS = 400
+MIN_ASSETS = 3
+# Weights outside this band are rejected; inside it they are rescaled to 100
+MIN_TOTAL, MAX_TOTAL = 80.0, 120.0
+
+class PortfolioStreamError(ValueError):
+    """The streamed completion can no longer become a valid portfolio object"""
+
+class StreamingPortfolioParser:
+    """
+    Feed completion text in arbitrary chunks; `feed` returns the validated
+    portfolios once the outer object is closed, otherwise None. Raises
+    PortfolioStreamError as soon as the text breaks the expected shape:
+    {"<portfolio>": {"<known asset>": <number>, ...}, "<portfolio>": {...}}
+    """
+
+    def __init__(self, known_assets=KNOWN_ASSETS, portfolios: int = 2):
+        self.known_assets = known_assets
+        self.portfolios = portfolios
+        self.result: Optional[Dict[str, Any]] = None
+        self._text = []
+        self._seen = 0
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string = []
+        self._expect_key = False
+        self._key = None
+        self._number = None
+        self._portfolio_count = 0
+        self._asset_count = 0
+        self._total = 0.0
+
+    @property
+    def done(self) -> bool:
+        return self.result is not None
+
+    @property
+    def chars_seen(self) -> int:
+        return self._seen
+
+    def feed(self, chunk: str) -> Optional[Dict[str, Any]]:
+        if self.done:
+            return self.result
+        for ch in chunk:
+            self._text.append(ch)
+            self._seen += 1
+            self._step(ch)
+            if self.done:
+                break
+        return self.result
+
+    def close(self) -> Dict[str, Any]:
+        """Call at end of stream; raises if the object never closed"""
+        if not self.done:
+            raise PortfolioStreamError("Completion ended before the portfolio object closed")
+        return self.result
+
+    def _fail(self, reason: str):
+        raise PortfolioStreamError(reason)
+
+    def _step(self, ch: str):
+        if self._start is None:
+            if ch == "{":
+                self._start = self._seen - 1
+                self._depth = 1
+                self._expect_key = True
+            elif self._seen > MAX_PREAMBLE_CHARS:
+                self._fail("No JSON object in the first %d characters" % MAX_PREAMBLE_CHARS)
+            return
+
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                try:
+                    value = json.loads('"' + "".join(self._string) + '"')
+                except json.JSONDecodeError:
+                    self._fail("Malformed string")
+                self._end_string(value)
+                return
+            self._string.append(ch)
+            return
+
+        if self._number is not None:
+            if ch in "0123456789.eE+-":
+                self._number.append(ch)
+                return
+            self._end_number()
+
+        if ch.isspace() or ch == ",":
+            if ch == "," and self._depth >= 1:
+                self._expect_key = True
+            return
+        if ch == ":":
+            self._expect_key = False
+            return
+        if ch == '"':
+            self._in_string = True
+            self._string = []
+            return
+        if ch == "{":
+            if self._depth != 1 or self._key is None:
+                self._fail("Unexpected nested object")
+            self._depth = 2
+            self._expect_key = True
+            self._asset_count = 0
+            self._total = 0.0
+            self._key = None
+            return
+        if ch == "}":
+            self._close_object()
+            return
+        if self._depth == 2 and not self._expect_key and (ch.isdigit() or ch in "-."):
+            self._number = [ch]
+            return
+        self._fail(f"Unexpected {ch!r} at depth {self._depth}")
+
+    def _end_string(self, value: str):
+        if not self._expect_key:
+            self._fail(f"String value {value!r} where a number or object was expected")
+        if self._depth == 1:
+            self._portfolio_count += 1
+            if self._portfolio_count > self.portfolios:
+                self._fail(f"More than {self.portfolios} portfolios")
+        elif value not in self.known_assets:
+            self._fail(f"Unknown asset {value!r}")
+        self._key = value
+
+    def _end_number(self):
+        text = "".join(self._number)
+        self._number = None
+        try:
+            weight = float(text)
+        except ValueError:
+            self._fail(f"Invalid weight {text!r}")
+        if weight < 0 or weight > 100:
+            self._fail(f"Weight {text} out of range")
+        self._asset_count += 1
+        self._total += weight
+        if self._total > MAX_TOTAL:
+            self._fail(f"Weights already sum to {self._total:g}")
+        self._key = None
+
+    def _close_object(self):
+        if self._depth == 2:
+            if self._asset_count < MIN_ASSETS:
+                self._fail(f"Portfolio has fewer than {MIN_ASSETS} assets")
+            if self._total < MIN_TOTAL:
+                self._fail(f"Weights sum to {self._total:g}")
+            self._depth = 1
+            self._key = None
+            return
+        if self._portfolio_count != self.portfolios:
+            self._fail(f"Expected {self.portfolios} portfolios, got {self._portfolio_count}")
+        self._depth = 0
+        text = "".join(self._text[self._start:])
+        try:
+            self.result = _normalize(json.loads(text))
+        except json.JSONDecodeError as e:
+            self._fail(f"Malformed JSON: {e}")
+
+def _normalize(portfolios: Dict[str, Any]) -> Dict[str, Any]:
+    """Rescale allocations that don't sum to ~100, as the one-shot parser always has"""
+    for allocation in portfolios.values():
+        total = sum(allocation.values())
+        if not (95 <= total <= 105):  # Allow small rounding errors
+            factor = 100.0 / total
+            for asset in allocation:
+                allocation[asset] = round(allocation[asset] * factor)
+    return portfolios
+
+def parse_stream(chunks: Iterable[str]) -> Dict[str, Any]:
+    """Consume chunks until the object closes; stops reading as soon as it does"""
+    parser = StreamingPortfolioParser()
+    for chunk in chunks:
+        if parser.feed(chunk):
+            return parser.result
+    return parser.close()
@@ -0,0 +1,79 @@
+"""
+Tests for the mean-variance allocation engine
+"""
+import numpy as np
+import pytest
+
+import allocation
+
+MARKET = {"apy": 4.5, "tvl_b": 2.7, "eth_usd": 3000.0}
+RISKS = ["low", "medium", "high"]
+PORTFOLIO_TYPES = list(allocation.PORTFOLIO_TEMPLATES)
+SAFE_ASSETS = {"Cash/FD", "eUSD Stablecoins", "ether.fi Cash"}
+
+def _risk_and_return(weights, market=MARKET):
+    _, mu, cov = allocation.market_assumptions(market, list(weights))
+    w = np.array(list(weights.values())) / 100.0
+    return float(w @ cov @ w), float(mu @ w)
+
+@pytest.mark.parametrize("portfolio_type", PORTFOLIO_TYPES)
+def test_weights_are_whole_percents_within_bounds(portfolio_type):
+    result = allocation.allocate_all_risk_levels({"portfolio_type": portfolio_type, "eth_holdings": 5.0}, MARKET)
+    
+    for risk in RISKS:
+        for name, weights in result[risk].items():
+            bounds = allocation.PORTFOLIO_TEMPLATES[portfolio_type][name]["bounds"]
+            assert list(weights) == list(bounds)
+            assert sum(weights.values()) == 100
+            for asset, pct in weights.items():
+                assert isinstance(pct, int) and pct >= 0
+                low, high = bounds[asset]
+                assert low * 100 - 1 <= pct <= high * 100 + 1
+
+def test_rounding_keeps_rows_at_one_hundred():
+    rng = np.random.default_rng(3)
+    weights = rng.dirichlet(np.ones(7), size=200)
+    
+    percents = allocation._to_percentages(weights)
+    
+    assert (percents.sum(axis=1) == 100).all()
+    assert (percents >= 0).all()
+    assert (np.abs(percents - weights * 100) < 1).all()
+
+@pytest.mark.parametrize("portfolio_type", PORTFOLIO_TYPES)
+def test_more_risk_means_more_volatility_return_and_less_cash(portfolio_type):
+    result = allocation.allocate_all_risk_levels({"portfolio_type": portfolio_type, "eth_holdings": 5.0}, MARKET)
+    
+    for name in allocation.PORTFOLIO_TEMPLATES[portfolio_type]:
+        ladder = [result[risk][name] for risk in RISKS]
+        variances, returns = zip(*(_risk_and_return(weights) for weights in ladder))
+        safe = [sum(pct for asset, pct in weights.items() if asset in SAFE_ASSETS) for weights in ladder]
+        assert list(variances) == sorted(variances)
+        assert list(returns) == sorted(returns)
+        assert safe == sorted(safe, reverse=True)
+        assert ladder[0] != ladder[-1]
+
+@pytest.mark.parametrize("market", [{}, {"apy": None, "eth_usd": None}, {"tvl_b": 2.7}])
+def test_degenerate_markets_fall_back_to_default_assumptions(market):
+    profile = {"risk": "medium", "eth_holdings": 5.0, "portfolio_type": "traditional"}
+    
+    portfolios = allocation.allocate_portfolios(profile, market)
+    
+    assert portfolios == allocation.allocate_portfolios(profile, {"apy": 4.5, "eth_usd": 3000.0})
+    assert all(sum(weights.values()) == 100 for weights in portfolios.values())
+
+def test_only_the_requested_risk_level_is_solved(monkeypatch):
+    solved = []
+    solve = allocation.solve_mean_variance
+    
+    def recording(mu, cov, aversion, lo, hi, **kwargs):
+        solved.append(len(aversion))
+        return solve(mu, cov, aversion, lo, hi, **kwargs)
+    
+    monkeypatch.setattr(allocation, "solve_mean_variance", recording)
+    portfolios = allocation.allocate_portfolios({"risk": "high", "portfolio_type": "etherfi-native"}, MARKET)
+    
+    assert solved == [2]  # One problem per portfolio, for "high" only
+    assert portfolios == allocation.allocate_all_risk_levels({"portfolio_type": "etherfi-native"}, MARKET)["high"]
+    # Unknown risk levels get the medium portfolios
+    assert allocation.allocate_portfolios({"risk": "yolo"}, MARKET) == allocation.allocate_portfolios({"risk": "medium"}, MARKET)
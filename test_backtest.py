@@ -0,0 +1,179 @@
+"""
+Tests for the vectorized, incremental backtester
+"""
+import os
+from datetime import date, timedelta
+
+import pytest
+
+import backtest
+
+START = date(2025, 1, 1)
+NATIVE = {"A": {"eETH": 100}, "B": {"Cash/FD": 100}}
+
+def _history(days, eth_growth=0.001):
+    return [{"date": (START + timedelta(days=i)).isoformat(), "eth_usd": 3000.0 * (1 + eth_growth) ** i, "apy": 3.65}
+            for i in range(days)]
+
+def _store(seq=1, chosen="A", days=30):
+    return {
+        "recs": {"r1": {"portfolios": NATIVE}},
+        "decisions": {"r1": {
+            "decision": chosen, "time_limit_days": days, "seq": seq,
+            "timestamp": START.isoformat() + "T12:00:00",
+            "profit_info": {"initial_investment": 10000.0, "profit": 50.0}
+        }},
+        "broker_votes": {"r1": {"7": {"broker_username": "alice", "choice": "A"},
+                                "8": {"broker_username": "bob", "choice": "B"}}}
+    }
+
+def test_realized_returns_follow_the_history():
+    results = backtest.backtest(_store(), _history(60))
+    
+    rec = results["recs"]["r1"]
+    eth = 1.001 ** 30 - 1 + 30 * 0.0001
+    assert rec["complete"]
+    assert rec["returns_pct"]["A"] == pytest.approx(eth * 100, abs=1e-3)
+    assert rec["returns_pct"]["B"] == pytest.approx(3.5 * 30 / 365, abs=1e-3)
+    assert rec["best"] == "A" and rec["chosen_was_best"]
+    assert rec["realized_profit"] == pytest.approx(10000 * eth, abs=0.01)
+    assert results["brokers"]["7"]["hit_rate"] == 1.0
+    assert results["brokers"]["8"]["hit_rate"] == 0.0
+
+def test_only_new_or_unfinished_decisions_are_rescored():
+    first = backtest.backtest(_store(), _history(10))
+    assert not first["recs"]["r1"]["complete"] and first["brokers"] == {}
+    
+    second = backtest.backtest(_store(), _history(60), first)
+    assert second["rescored"] == 1 and second["recs"]["r1"]["complete"]
+    assert backtest.backtest(_store(), _history(60), second)["rescored"] == 0
+    
+    changed = backtest.backtest(_store(seq=2, chosen="B"), _history(60), second)
+    assert changed["rescored"] == 1 and not changed["recs"]["r1"]["chosen_was_best"]
+
+def test_missing_prices_are_forward_filled():
+    history = _history(40)
+    for row in history[5:35]:
+        del row["eth_usd"]
+    
+    rec = backtest.backtest(_store(), history)["recs"]["r1"]
+    
+    assert rec["returns_pct"]["A"] == pytest.approx((1.001 ** 4 - 1 + 30 * 0.0001) * 100, abs=1e-3)
+
+def test_yield_accrues_over_the_days_between_rows():
+    daily = backtest.backtest(_store(), _history(60))["recs"]["r1"]
+    # Market data only fetched every fifth day
+    sparse = backtest.backtest(_store(), _history(60)[::5])["recs"]["r1"]
+    
+    assert sparse["complete"]
+    assert sparse["returns_pct"]["B"] == pytest.approx(daily["returns_pct"]["B"], abs=1e-6)
+    assert sparse["returns_pct"]["A"] == pytest.approx(daily["returns_pct"]["A"], abs=1e-6)
+    # No row on the end date: measured to the last one before it, and complete once a later one exists
+    uneven = [row for i, row in enumerate(_history(60)) if i not in (29, 30, 31)]
+    rec = backtest.backtest(_store(), uneven)["recs"]["r1"]
+    assert rec["complete"]
+    assert rec["returns_pct"]["B"] == pytest.approx(3.5 * 28 / 365, abs=1e-3)
+
+def test_market_snapshots_upsert_one_row_per_day(tmp_path, monkeypatch):
+    monkeypatch.setattr(backtest, "MARKET_SNAPSHOT_SECONDS", 0)
+    path = str(tmp_path / "history.json")
+    backtest.record_market_snapshot({"eth_usd": 3000.0, "apy": 4.0}, path, day="2025-01-01")
+    backtest.record_market_snapshot({"eth_usd": 3100.0}, path, day="2025-01-01")
+    backtest.record_market_snapshot({"eth_usd": 3200.0}, path, day="2025-01-02")
+    
+    assert backtest.load_market_history(path) == [
+        {"date": "2025-01-01", "eth_usd": 3100.0, "apy": 4.0},
+        {"date": "2025-01-02", "eth_usd": 3200.0}
+    ]
+
+def test_market_snapshots_refresh_at_most_once_an_interval(tmp_path):
+    path = str(tmp_path / "history.json")
+    assert backtest.record_market_snapshot({"eth_usd": 3000.0}, path, day="2025-01-01")
+    # Just written: a new price waits, a field the row lacks goes in
+    assert not backtest.record_market_snapshot({"eth_usd": 3100.0}, path, day="2025-01-01")
+    assert backtest.record_market_snapshot({"eth_usd": 3100.0, "btc_usd": 60000.0}, path, day="2025-01-01")
+    assert backtest.load_market_history(path) == [{"date": "2025-01-01", "eth_usd": 3000.0, "btc_usd": 60000.0}]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+def test_failed_factor_fetches_are_tried_once_a_day(tmp_path):
+    path = str(tmp_path / "history.json")
+    assert backtest.factors_to_fetch(("btc_usd", "spx"), path, day="2025-01-01") == ["btc_usd", "spx"]
+    # The fetch failed and nothing was recorded
+    assert backtest.factors_to_fetch(("btc_usd", "spx"), path, day="2025-01-01") == []
+    assert backtest.factors_to_fetch(("btc_usd", "spx"), path, day="2025-01-02") == ["btc_usd", "spx"]
+
+def test_windows_without_prices_for_their_factors_are_incomplete():
+    store = _store()
+    store["recs"]["r1"]["portfolios"] = {"A": {"US Stocks": 100}, "B": {"BTC/Alts": 100}}
+    
+    rec = backtest.backtest(store, _history(60))["recs"]["r1"]
+    
+    # No BTC or S&P prices recorded: not a 0% return, just not scorable yet
+    assert not rec["complete"]
+    
+    history = _history(60)
+    for i, row in enumerate(history):
+        row["btc_usd"] = 60000.0 * 1.002 ** i
+        row["spx"] = 5000.0 * 1.0005 ** i
+    rec = backtest.backtest(store, history)["recs"]["r1"]
+    
+    assert rec["complete"]
+    assert rec["returns_pct"]["B"] == pytest.approx(1.10 * (1.002 ** 30 - 1) * 100, abs=1e-3)  # BTC/Alts loads 1.1 on BTC
+    assert rec["returns_pct"]["A"] == pytest.approx((1.0005 ** 30 - 1) * 100, abs=1e-3)
+    assert rec["best"] == "B"
+
+def test_factor_first_seen_after_the_start_is_incomplete():
+    store = _store()
+    store["recs"]["r1"]["portfolios"] = {"A": {"eETH": 100}, "B": {"BTC/Alts": 100}}
+    history = _history(60)
+    for row in history[10:]:
+        row["btc_usd"] = 60000.0
+    
+    assert not backtest.backtest(store, history)["recs"]["r1"]["complete"]
+
+def test_ties_have_no_best_portfolio():
+    store = _store()
+    store["recs"]["r1"]["portfolios"] = {"A": {"Cash/FD": 100}, "B": {"Cash/FD": 100}}
+    
+    results = backtest.backtest(store, _history(60))
+    
+    rec = results["recs"]["r1"]
+    assert rec["complete"] and rec["best"] is None and rec["chosen_was_best"] is None
+    assert results["brokers"] == {}
+
+def test_endpoint_keeps_results_in_memory(client, monkeypatch):
+    monkeypatch.setattr(backtest, "_latest", {})
+    backtest.record_market_snapshot({"eth_usd": 3000.0, "apy": 4.0})
+    
+    response = client.get('/api/backtest')
+    
+    assert response.status_code == 200 and response.get_json()["recs"] == {}
+    assert not os.path.exists(backtest.BACKTEST_PATH)
+
+def test_market_data_records_btc_and_equity_prices_once_a_day(client, monkeypatch):
+    import api_server
+    calls = []
+    monkeypatch.setattr(api_server, "fetch_etherfi", lambda **kwargs: {"apy": 4.5, "tvl_b": 2.7})
+    monkeypatch.setattr(api_server, "fetch_eth_price_usd", lambda **kwargs: 3000.0)
+    monkeypatch.setattr(api_server, "fetch_factor_prices",
+                        lambda: calls.append(1) or {"btc_usd": 60000.0, "spx": 5000.0})
+    
+    client.get('/api/market-data')
+    client.get('/api/market-data')
+    
+    [row] = backtest.load_market_history()
+    assert row["btc_usd"] == 60000.0 and row["spx"] == 5000.0 and row["eth_usd"] == 3000.0
+    assert len(calls) == 1
+
+def test_failed_market_fetches_are_not_recorded(client, monkeypatch):
+    import api_server
+    monkeypatch.setattr(api_server, "fetch_etherfi", lambda fallback=True: None)
+    monkeypatch.setattr(api_server, "fetch_eth_price_usd", lambda fallback=True: 3100.0)
+    monkeypatch.setattr(api_server, "fetch_factor_prices", lambda: {"btc_usd": None, "spx": None})
+    
+    data = client.get('/api/market-data').get_json()
+    
+    # The dashboard still gets the stand-in, the history doesn't
+    assert data["etherfi"] == api_server.FALLBACK_ETHERFI
+    [row] = backtest.load_market_history()
+    assert row["eth_usd"] == 3100.0 and "apy" not in row
@@ -0,0 +1,144 @@
+"""
+Tests for batch portfolio generation against the LLM stub
+"""
+import json
+import threading
+import time
+
+import api_server
+import batch
+import llm_stub
+import ratelimit
+
+MARKET = {"apy": 4.5, "tvl_b": 2.7, "eth_usd": 3000.0}
+
+def test_identical_profiles_are_generated_once(stub_llm):
+    profile = {"risk": "low", "eth_holdings": 2.0, "portfolio_type": "traditional"}
+    items = [{"id": i, "profile": dict(profile)} for i in range(3)]
+    
+    results = list(batch.generate_batch(items, MARKET))
+    
+    assert sorted(r["index"] for r in results) == [0, 1, 2]
+    assert sum(r["deduplicated"] for r in results) == 2
+    assert len(stub_llm.calls) == 2  # one portfolio call + one summary call
+    assert all(r["source"] == "llm" for r in results)
+
+def test_upstream_concurrency_is_bounded(stub_llm):
+    lock = threading.Lock()
+    state = {"in_flight": 0, "peak": 0}
+    
+    def slow_responder(model, prompt):
+        with lock:
+            state["in_flight"] += 1
+            state["peak"] = max(state["peak"], state["in_flight"])
+        time.sleep(0.02)
+        with lock:
+            state["in_flight"] -= 1
+        return llm_stub.default_responder(model, prompt)
+    
+    stub_llm.responder = slow_responder
+    items = batch.segment_items([{"username": f"u{i}", "eth_holdings": float(i)} for i in range(4)])
+    
+    results = list(batch.generate_batch(items, MARKET, concurrency=3))
+    
+    assert len(results) == len(items) == 24
+    assert state["peak"] == 3
+
+def test_failed_item_falls_back_to_engine(stub_llm):
+    items = [
+        {"id": "ok", "profile": {"risk": "medium", "eth_holdings": 1.0}},
+        {"id": "bad", "profile": {"risk": "medium", "eth_holdings": 1.0}, "market": {"apy": 4.5, "tvl_b": 2.7}},
+    ]
+    
+    results = {r["id"]: r for r in batch.generate_batch(items, MARKET)}
+    
+    assert results["ok"]["source"] == "llm"
+    assert results["bad"]["source"] == "fallback"
+    assert "error" in results["bad"]
+    assert sum(results["bad"]["portfolios"]["Portfolio B — Balanced Yield"].values()) == 100
+
+def test_llm_failure_is_reported_as_fallback(stub_llm):
+    def failing(model, prompt):
+        if "Generate the JSON now" in prompt:
+            raise RuntimeError("overloaded_error")
+        return llm_stub.default_responder(model, prompt)
+    
+    stub_llm.responder = failing
+    items = [{"id": "x", "profile": {"risk": "low", "eth_holdings": 1.0, "portfolio_type": "traditional"}}]
+    
+    [result] = batch.generate_batch(items, MARKET)
+    
+    # generate_with_summary fell back to the engine by itself, without raising
+    assert result["source"] == "fallback"
+    assert "error" not in result
+    assert result["summary"] == llm_stub.STUB_SUMMARY
+    assert sum(result["portfolios"]["Portfolio A — Crypto Tilt"].values()) == 100
+
+def _user(client):
+    data = client.post('/api/auth/signup/user', json={
+        "username": "segment", "email": "segment@example.com", "password": "pw", "eth_holdings": 1.0
+    }).get_json()
+    return {"Authorization": f"Bearer {data['token']}"}
+
+def test_batch_endpoint_streams_json_lines(client, stub_llm):
+    items = [{"id": "a", "profile": {"risk": "high", "eth_holdings": 3.0}}]
+    
+    response = client.post('/api/generate-portfolios/batch', json={"items": items, "market": MARKET},
+                           headers=_user(client))
+    
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert response.mimetype == "application/x-ndjson"
+    assert lines[0]["id"] == "a" and len(lines[0]["portfolios"]) == 2
+    assert lines[-1] == {"done": True, "count": 1, "fallbacks": 0}
+
+def test_batch_endpoint_needs_a_session(client, stub_llm):
+    items = [{"id": "a", "profile": {"risk": "high", "eth_holdings": 3.0}}]
+    
+    for headers in ({}, {"Authorization": "Bearer made-up"}):
+        response = client.post('/api/generate-portfolios/batch', json={"items": items}, headers=headers)
+        assert response.status_code == 401
+    assert stub_llm.calls == []
+
+def test_batch_endpoint_rejects_bad_input(client):
+    headers = _user(client)
+    url = '/api/generate-portfolios/batch'
+    items = [{"id": "a", "profile": {}}]
+    
+    assert client.post(url, json={"items": []}, headers=headers).status_code == 400
+    assert client.post(url, json={"items": items, "concurrency": "lots"}, headers=headers).status_code == 400
+    too_many = [{"id": i, "profile": {}} for i in range(batch.BATCH_MAX_ITEMS + 1)]
+    assert client.post(url, json={"items": too_many}, headers=headers).status_code == 400
+
+def test_batch_endpoint_charges_every_generation(client, stub_llm, monkeypatch):
+    monkeypatch.setattr(ratelimit.limiter, "limits", {**ratelimit.limiter.limits,
+                                                      "llm": {"principal": (0.001, 4), "global": (0.001, 100)}})
+    headers = _user(client)
+    url = '/api/generate-portfolios/batch'
+    items = [{"id": i, "profile": {"risk": risk, "eth_holdings": 1.0}} for i, risk in enumerate(("low", "high"))]
+    
+    # More generations than the bucket ever holds can't be admitted
+    six = [{"id": i, "profile": {"risk": "low", "eth_holdings": float(i)}} for i in range(6)]
+    assert client.post(url, json={"items": six, "market": MARKET}, headers=headers).status_code == 400
+    # Duplicates are generated once, so they cost nothing extra: 2 of the 3 tokens left
+    assert client.post(url, json={"items": items + items, "market": MARKET}, headers=headers).status_code == 200
+    assert client.post(url, json={"items": items, "market": MARKET}, headers=headers).status_code == 429
+
+def test_batch_endpoint_runs_no_more_generations_than_llm_slots(client, stub_llm, monkeypatch):
+    monkeypatch.setattr(ratelimit.llm_slots, "limit", 3)
+    assert ratelimit.llm_slots.try_acquire()  # Someone else's generation in flight
+    seen = []
+    monkeypatch.setattr(api_server, "generate_batch", lambda items, market, concurrency: seen.append(concurrency) or [])
+    
+    try:
+        response = client.post('/api/generate-portfolios/batch', headers=_user(client), json={
+            "items": [{"id": i, "profile": {"risk": "low", "eth_holdings": float(i)}} for i in range(3)],
+            "market": MARKET, "concurrency": 16
+        })
+        assert response.status_code == 200, response.get_json()
+        response.get_data()
+        response.close()
+        # Its own slot plus the one left free
+        assert seen == [2]
+    finally:
+        ratelimit.llm_slots.release()
+    assert ratelimit.llm_slots.in_flight == 0
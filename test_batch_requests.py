@@ -0,0 +1,84 @@
+"""
+Tests for /api/batch: several GETs on one session lookup and one store read
+"""
+import api_server
+import metrics
+import ratelimit
+
+def _broker(client, name):
+    data = client.post('/api/auth/signup/broker', json={
+        "username": name, "email": f"{name}@example.com", "password": "pw"
+    }).get_json()
+    return {"Authorization": f"Bearer {data['token']}"}
+
+def _rec(client):
+    return client.post('/api/create-recommendation', json={"nickname": "u", "portfolios": {}}).get_json()["rec_id"]
+
+def test_dashboard_load_is_one_store_read_and_one_session_lookup(client):
+    headers = _broker(client, "alice")
+    rec_id = _rec(client)
+    client.post('/api/vote', json={"rec_id": rec_id, "choice": "A"}, headers=headers)
+    loads = metrics.SPAN_SECONDS.count(span="load_store")
+    sessions = metrics.SPAN_SECONDS.count(span="validate_session")
+
+    response = client.post('/api/batch', headers=headers, json={"requests": [
+        "/api/recommendations", "/api/broker/earnings", f"/api/recommendation/{rec_id}",
+        "/api/auth/validate", "/api/broker/profile/1"
+    ]})
+
+    results = response.get_json()["responses"]
+    assert [r["status"] for r in results] == [200] * 5
+    assert rec_id in results[0]["body"]
+    assert results[2]["body"]["votes"] == {"A": 1}
+    assert results[3]["body"]["user"]["username"] == "alice"
+    assert metrics.SPAN_SECONDS.count(span="load_store") == loads + 1
+    assert metrics.SPAN_SECONDS.count(span="validate_session") == sessions + 1
+    # Results match what the individual endpoints return
+    assert results[2]["body"] == client.get(f'/api/recommendation/{rec_id}').get_json()
+
+def test_sub_requests_carry_their_own_conditional_headers(client, monkeypatch):
+    rec_id = _rec(client)
+    etag = client.get(f'/api/recommendation/{rec_id}').headers["ETag"]
+
+    def no_store():
+        raise AssertionError("store loaded for a 304")
+    monkeypatch.setattr(api_server, "load_store", no_store)
+    response = client.post('/api/batch', json={"requests": [
+        {"path": f"/api/recommendation/{rec_id}", "headers": {"If-None-Match": etag}}
+    ]})
+
+    result = response.get_json()["responses"][0]
+    assert result == {"path": f"/api/recommendation/{rec_id}", "status": 304, "etag": etag}
+
+def test_bad_sub_requests_fail_alone(client):
+    rec_id = _rec(client)
+    response = client.post('/api/batch', json={"requests": [
+        "/api/nope", "https://example.com/", f"/api/recommendation/{rec_id}/events", "/api/recommendation/missing",
+        "/api/recommendations"
+    ]})
+
+    assert response.status_code == 200
+    assert [r["status"] for r in response.get_json()["responses"]] == [404, 400, 400, 404, 200]
+    assert api_server.REQUESTS_IN_FLIGHT.value(route="/api/batch") == 0
+
+def test_batch_size_is_bounded(client):
+    assert client.post('/api/batch', json={"requests": []}).status_code == 400
+    too_many = ["/api/health"] * (api_server.BATCH_MAX_REQUESTS + 1)
+    assert client.post('/api/batch', json={"requests": too_many}).status_code == 400
+
+def test_limited_endpoints_cant_be_batched_around_their_limits(client, monkeypatch):
+    called = []
+    monkeypatch.setattr(api_server, "fetch_etherfi", lambda **kwargs: called.append("market") or {})
+    monkeypatch.setattr("backtest.latest_results", lambda *a, **k: called.append("backtest") or {})
+    response = client.post('/api/batch', json={"requests": ["/api/market-data", "/api/backtest"] * 3})
+
+    assert [r["status"] for r in response.get_json()["responses"]] == [400] * 6
+    assert called == []
+
+def test_each_sub_request_spends_a_read_token(client, monkeypatch):
+    monkeypatch.setattr(ratelimit.limiter, "limits", {**ratelimit.limiter.limits, "read": {"principal": (0.001, 3),
+                                                                                           "global": (0.001, 100)}})
+    response = client.post('/api/batch', json={"requests": ["/api/recommendations"] * 4})
+
+    # The batch itself paid for the first; two more tokens, then the bucket is empty
+    assert [r["status"] for r in response.get_json()["responses"]] == [200, 200, 200, 429]
@@ -0,0 +1,37 @@
+"""
+Tests for the offline benchmark suite
+"""
+import os
+
+import benchmark
+import database
+
+def test_every_scenario_runs_offline_without_errors():
+    cwd, db_path = os.getcwd(), database.DB_PATH
+    results = benchmark.run_benchmark(sizes=[30], requests=3, seconds=0.1)
+
+    scenarios = results["30"]
+    assert {"login", "validate", "poll_recommendation", "vote", "decision", "broker_profile"} <= set(scenarios)
+    for name, result in scenarios.items():
+        assert result["errors"] == 0, name
+        assert result["requests"] >= 3
+        assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+    # The throwaway store and database are gone and nothing leaked into the caller
+    assert os.getcwd() == cwd and database.DB_PATH == db_path
+
+def test_regressions_flag_slower_or_failing_endpoints(tmp_path):
+    path = str(tmp_path / "baseline.json")
+    row = {"requests": 10, "errors": 0, "rps": 100.0, "p50_ms": 10.0, "p95_ms": 12.0, "p99_ms": 15.0}
+    benchmark.save_baseline({"1000": {"vote": row, "login": row}}, path)
+    current = {"1000": {
+        "vote": dict(row, p50_ms=16.0, rps=60.0),
+        "login": dict(row, p50_ms=14.0, errors=1),
+        "validate": dict(row, p50_ms=99.0)  # Not in the baseline yet
+    }}
+
+    found = benchmark.regressions(current, benchmark.load_baseline(path), tolerance=0.5)
+
+    assert len(found) == 3
+    assert any(line.startswith("vote @ 1000 recs: p50") for line in found)
+    assert any(line.startswith("vote @ 1000 recs: 60.0 req/s") for line in found)
+    assert any(line.startswith("login @ 1000 recs: 1 errors") for line in found)
@@ -0,0 +1,62 @@
+"""
+Tests for creation order and the per-broker unvoted feed
+"""
+from utils import load_store, save_store
+
+def _broker(client, name):
+    data = client.post('/api/auth/signup/broker', json={
+        "username": name, "email": f"{name}@example.com", "password": "pw"
+    }).get_json()
+    return {"Authorization": f"Bearer {data['token']}"}
+
+def _rec(client, nickname="u"):
+    return client.post('/api/create-recommendation', json={"nickname": nickname, "portfolios": {}}).get_json()["rec_id"]
+
+def test_feed_is_newest_first_without_my_votes(client):
+    alice, bob = _broker(client, "alice"), _broker(client, "bob")
+    recs = [_rec(client, f"u{i}") for i in range(5)]
+    client.post('/api/vote', json={"rec_id": recs[4], "choice": "A"}, headers=alice)
+    client.post('/api/vote', json={"rec_id": recs[2], "choice": "A"}, headers=alice)
+    client.post('/api/vote', json={"rec_id": recs[3], "choice": "A"}, headers=bob)
+
+    feed = client.get('/api/broker/feed?limit=2', headers=alice).get_json()
+    assert [r["rec_id"] for r in feed["recommendations"]] == [recs[3], recs[1]]
+    assert feed["has_more"] is True
+    assert feed["recommendations"][0]["username"] == "u3" and feed["recommendations"][0]["created_at"]
+
+    feed = client.get('/api/broker/feed', headers=alice).get_json()
+    assert [r["rec_id"] for r in feed["recommendations"]] == [recs[3], recs[1], recs[0]]
+    assert feed["has_more"] is False
+
+    store = load_store()
+    assert store["rec_order"] == recs
+    assert sorted(store["broker_voted"]["1"]) == sorted([recs[4], recs[2]])
+
+def test_feed_needs_a_broker_and_revalidates(client):
+    assert client.get('/api/broker/feed').status_code == 401
+    alice, bob = _broker(client, "alice"), _broker(client, "bob")
+    rec_id = _rec(client)
+    first = client.get('/api/broker/feed', headers=alice)
+    etag = first.headers["ETag"]
+
+    # Someone else's vote doesn't change my feed; my own vote does
+    client.post('/api/vote', json={"rec_id": rec_id, "choice": "A"}, headers=bob)
+    assert client.get('/api/broker/feed', headers={**alice, "If-None-Match": etag}).status_code == 304
+    client.post('/api/vote', json={"rec_id": rec_id, "choice": "A"}, headers=alice)
+    changed = client.get('/api/broker/feed', headers={**alice, "If-None-Match": etag})
+    assert changed.status_code == 200 and changed.get_json()["recommendations"] == []
+
+def test_stores_without_the_index_are_migrated(client):
+    alice = _broker(client, "alice")
+    legacy = {"users": {}, "recs": {rid: {"username": rid, "portfolios": {}} for rid in ("zz", "aa", "mm")},
+              "votes": {}, "broker_votes": {"aa": {"1": {"broker_id": 1, "choice": "A"}}},
+              "decisions": {}, "feedback": {}}
+    save_store(legacy)
+
+    feed = client.get('/api/broker/feed', headers=alice).get_json()
+    assert [r["rec_id"] for r in feed["recommendations"]] == ["mm", "zz"]
+
+    new_id = _rec(client)
+    store = load_store()
+    assert store["rec_order"] == ["zz", "aa", "mm", new_id]
+    assert store["broker_voted"] == {"1": ["aa"]}
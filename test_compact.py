@@ -0,0 +1,60 @@
+"""
+Tests for the compact recommendation model
+"""
+import json
+import sys
+from array import array
+
+import compact
+import measure_memory
+
+def test_store_round_trip_is_exact():
+    store = next(measure_memory.synthetic_store(500))
+    store["rec_order"] = list(store["recs"])
+    store["decisions"] = {"00000001": {"choice": "A"}}
+    odd = {
+        "username": "bob",
+        "input": {"profile": {"risk": "low", "n": 1, "x": 1.0, "t": True, "z": -0.0, "tags": ["a", 2]}},
+        "portfolios": {"P": {"eETH": 40, "BTC/Alts": 60.5}},
+        "big": 2 ** 60,
+        "user_id": None
+    }
+    store["recs"]["odd"] = odd
+    store["votes"]["odd"] = {}
+
+    packed = compact.pack_store(store)
+    assert json.dumps(compact.unpack_store(packed)) == json.dumps(store)
+    assert json.dumps(compact.unpack(packed["recs"]["odd"])) == json.dumps(odd)
+
+def test_values_are_slotted_and_shared():
+    rec = {"username": "alice", "portfolios": {"Portfolio A": {"eETH": 50, "Cash/FD": 50}},
+           "input": {"market": {"apy": 3.2, "eth_usd": 3000.0}}}
+    packer = compact.Packer()
+    first = packer.rec(json.loads(json.dumps(rec)))
+    second = packer.rec(json.loads(json.dumps(rec)))
+
+    allocation = first.portfolios.values[0]
+    assert isinstance(allocation, compact.Weights) and isinstance(allocation.values, array)
+    assert allocation.values.typecode == "d" and allocation.int_mask == 0b11
+    # Same allocation and market snapshot: one object; asset names are the interned literals
+    assert second.portfolios.values[0] is allocation
+    assert second.input.values[0] is first.input.values[0]
+    assert allocation.names[0] is sys.intern("eETH")
+    assert not hasattr(first, "__dict__") and not hasattr(allocation, "__dict__")
+
+def test_broker_votes_pack_to_shared_votes():
+    votes = {"r1": {"3": {"broker_id": 3, "broker_username": "b3", "choice": "A"}},
+             "r2": {"3": {"broker_id": 3, "broker_username": "b3", "choice": "A"},
+                    "4": {"broker_id": True, "broker_username": "b3", "choice": "A"}}}
+    packed = compact.pack_store({"recs": {}, "broker_votes": votes})["broker_votes"]
+    vote = packed["r1"].values[0]
+    assert isinstance(vote, compact.BrokerVote) and packed["r2"].values[0] is vote
+    # Equal but not the same JSON: True must not turn into 1
+    assert packed["r2"].values[1] is not vote
+    assert compact.unpack(packed["r2"]) == votes["r2"]
+
+def test_memory_benchmark_shows_a_saving():
+    assert measure_memory.verify(2000)
+    result = measure_memory.measure(2000)
+    assert result["compact"]["bytes_per_rec"] < result["json"]["bytes_per_rec"]
+    assert result["ratio"] > 1.5
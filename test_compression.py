@@ -0,0 +1,60 @@
+"""
+Tests for negotiated response compression and the compact JSON provider
+"""
+import gzip
+import json
+
+import pytest
+
+import compression
+
+def _recs(client, count):
+    long_summary = "Portfolio A leans on staking yield; Portfolio B holds stablecoins. " * 5
+    for i in range(count):
+        client.post('/api/create-recommendation', json={"nickname": f"u{i}", "portfolios": {}, "summary": long_summary})
+
+def test_large_responses_are_gzipped_when_accepted(client):
+    _recs(client, 10)
+    plain = client.get('/api/recommendations')
+    zipped = client.get('/api/recommendations', headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in plain.headers
+    assert zipped.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in zipped.headers["Vary"]
+    assert int(zipped.headers["Content-Length"]) == len(zipped.data) < len(plain.data)
+    assert json.loads(gzip.decompress(zipped.data)) == plain.get_json()
+
+def test_brotli_is_preferred_and_small_bodies_stay_plain(client):
+    # brotli is optional; without it the API only offers gzip
+    brotli = pytest.importorskip("brotli")
+    _recs(client, 10)
+    response = client.get('/api/recommendations', headers={"Accept-Encoding": "gzip, br"})
+    assert response.headers["Content-Encoding"] == "br"
+    assert json.loads(brotli.decompress(response.data)) == client.get('/api/recommendations').get_json()
+
+    health = client.get('/api/health', headers={"Accept-Encoding": "gzip, br"})
+    assert "Content-Encoding" not in health.headers
+
+def test_compressed_etag_revalidates_to_304(client):
+    _recs(client, 10)
+    first = client.get('/api/recommendations', headers={"Accept-Encoding": "gzip"})
+    etag = first.headers["ETag"]
+    assert etag.endswith('-gzip"')
+
+    second = client.get('/api/recommendations', headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.headers["ETag"] == etag
+
+def test_compact_provider_output_matches_stdlib(client):
+    payload = {"b": 1.5, "a": [1, 2, {"ü": None}], 3: "x"}
+    with client.application.app_context():
+        body = client.application.json.response(payload).get_data()
+    assert b" " not in body
+    assert json.loads(body) == json.loads(json.dumps(payload))
+
+@pytest.mark.parametrize("orjson", [None, compression.orjson])
+def test_stdlib_fallback_without_orjson(client, monkeypatch, orjson):
+    monkeypatch.setattr(compression, "orjson", orjson)
+    with client.application.app_context():
+        body = client.application.json.dumps({"x": [1, 2]})
+    assert body == '{"x":[1,2]}'
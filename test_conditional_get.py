@@ -0,0 +1,73 @@
+"""
+Tests for ETags and 304s on the polled endpoints
+"""
+import api_server
+import settlement
+
+def _no_store():
+    raise AssertionError("store loaded for a 304")
+
+def _rec(client):
+    return client.post('/api/create-recommendation', json={"nickname": "u", "portfolios": {}}).get_json()["rec_id"]
+
+def _revalidate(client, url, etag, **kwargs):
+    headers = dict(kwargs.pop("headers", {}), **{"If-None-Match": etag})
+    return client.get(url, headers=headers, **kwargs)
+
+def test_unchanged_recommendation_is_304_without_loading_the_store(client, monkeypatch):
+    rec_id = _rec(client)
+    first = client.get(f'/api/recommendation/{rec_id}')
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and first.headers["Cache-Control"] == "no-cache"
+    
+    monkeypatch.setattr(api_server, "load_store", _no_store)
+    second = _revalidate(client, f'/api/recommendation/{rec_id}', etag)
+    
+    assert second.status_code == 304
+    assert second.data == b""
+    assert second.headers["ETag"] == etag
+
+def test_vote_decision_and_feedback_change_the_etag(client):
+    rec_id = _rec(client)
+    url = f'/api/recommendation/{rec_id}'
+    writes = [
+        ('/api/vote', {"rec_id": rec_id, "choice": "A"}),
+        ('/api/decision', {"rec_id": rec_id, "decision": "A"}),
+        ('/api/feedback', {"rec_id": rec_id, "thumb": "up"}),
+    ]
+    etag = client.get(url).headers["ETag"]
+    for path, body in writes:
+        client.post(path, json=body)
+        response = _revalidate(client, url, etag)
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+    assert _revalidate(client, url, etag).status_code == 304
+
+def test_list_etag_only_changes_when_a_recommendation_is_created(client):
+    rec_id = _rec(client)
+    etag = client.get('/api/recommendations').headers["ETag"]
+    client.post('/api/vote', json={"rec_id": rec_id, "choice": "A"})
+    assert _revalidate(client, '/api/recommendations', etag).status_code == 304
+    
+    _rec(client)
+    assert _revalidate(client, '/api/recommendations', etag).status_code == 200
+
+def test_broker_stats_revalidate_until_settlement(client):
+    data = client.post('/api/auth/signup/broker', json={
+        "username": "alice", "email": "alice@example.com", "password": "pw"
+    }).get_json()
+    headers = {"Authorization": f"Bearer {data['token']}"}
+    profile_url = f"/api/broker/profile/{data['user']['id']}"
+    rec_id = _rec(client)
+    client.post('/api/vote', json={"rec_id": rec_id, "choice": "A"}, headers=headers)
+    client.post('/api/decision', json={"rec_id": rec_id, "decision": "A", "time_limit_days": 365})
+    
+    earnings = client.get('/api/broker/earnings', headers=headers)
+    profile = client.get(profile_url)
+    assert _revalidate(client, '/api/broker/earnings', earnings.headers["ETag"], headers=headers).status_code == 304
+    assert _revalidate(client, profile_url, profile.headers["ETag"]).status_code == 304
+    
+    settlement.settle_pending()
+    
+    assert _revalidate(client, '/api/broker/earnings', earnings.headers["ETag"], headers=headers).status_code == 200
+    assert _revalidate(client, profile_url, profile.headers["ETag"]).status_code == 200
@@ -0,0 +1,112 @@
+"""
+Tests for pushed recommendation updates (pub/sub, SSE and long-poll)
+"""
+import threading
+import time
+
+import api_server
+from events import EventBus
+
+def _rec(client):
+    return client.post('/api/create-recommendation', json={"nickname": "u", "portfolios": {}}).get_json()["rec_id"]
+
+def test_watchers_only_wake_for_their_topic():
+    bus = EventBus()
+    woke = []
+    
+    def watch(topic):
+        woke.append((topic, bus.wait(topic, 0, timeout=2.0)))
+    
+    threads = [threading.Thread(target=watch, args=(t,)) for t in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    bus.publish("a", "vote", {"n": 1})
+    threads[0].join(1.0)
+    
+    assert [topic for topic, _ in woke] == ["a"]
+    assert woke[0][1][0][1:] == ("vote", {"n": 1})
+    assert bus.stats()["watchers"] == 1
+    bus.publish("b", "vote", {})
+    threads[1].join(1.0)
+
+def test_long_poll_returns_the_vote_as_it_happens(client):
+    rec_id = _rec(client)
+    url = f'/api/recommendation/{rec_id}/events?transport=longpoll'
+    first = client.get(url + '&timeout=0').get_json()
+    assert first["events"] == [] and not first["changed"]
+    
+    timer = threading.Timer(0.1, lambda: api_server.app.test_client().post(
+        '/api/vote', json={"rec_id": rec_id, "choice": "A"}))
+    timer.start()
+    started = time.monotonic()
+    data = client.get(url + f'&timeout=5&since={first["cursor"]}&version={first["version"]}').get_json()
+    
+    assert time.monotonic() - started < 2
+    assert data["events"][0]["event"] == "vote"
+    assert data["events"][0]["data"]["votes"] == {"A": 1}
+    assert not data["changed"]
+
+def test_long_poll_flags_changes_it_has_no_events_for(client):
+    rec_id = _rec(client)
+    first = client.get(f'/api/recommendation/{rec_id}/events?transport=longpoll&timeout=0').get_json()
+    api_server.database.bump_versions([f"rec:{rec_id}"])  # a write served by another worker
+    api_server.version_monitor.check()
+    
+    data = client.get(f'/api/recommendation/{rec_id}/events?transport=longpoll&timeout=0'
+                      f'&since={first["cursor"]}&version={first["version"]}').get_json()
+    assert data["changed"]
+    
+    foreign = client.get(f'/api/recommendation/{rec_id}/events?transport=longpoll&since=other:5').get_json()
+    assert foreign["changed"]
+
+def test_sse_stream_pushes_only_the_changes(client, monkeypatch):
+    monkeypatch.setattr(api_server, "EVENTS_STREAM_SECONDS", 0.5)
+    rec_id = _rec(client)
+    free = api_server._watch_slots._value
+    response = client.get(f'/api/recommendation/{rec_id}/events', buffered=False)
+    chunks = iter(response.response)
+    assert b": watching" in next(chunks)
+    
+    client.post('/api/vote', json={"rec_id": rec_id, "choice": "B"})
+    client.post('/api/feedback', json={"rec_id": rec_id, "thumb": "up", "note": "nice"})
+    body = b"".join(chunks).decode()
+    
+    assert response.mimetype == "text/event-stream"
+    assert "event: vote" in body and '"B": 1' in body
+    assert "event: feedback" in body and '"note": "nice"' in body
+    assert "event: changed" not in body
+    response.close()
+    assert api_server._watch_slots._value == free  # the stream's thread is given back
+
+def test_version_monitor_announces_foreign_writes_once(client):
+    rec_id = _rec(client)
+    topic = f"rec:{rec_id}"
+    first = client.get(f'/api/recommendation/{rec_id}/events?transport=longpoll&timeout=0').get_json()
+    client.post('/api/vote', json={"rec_id": rec_id, "choice": "A"})  # our own write: already on the bus
+    api_server.version_monitor.check()
+    assert [e[1] for e in api_server.bus.since(topic, 0)] == ["vote"]
+    
+    api_server.database.bump_versions([topic])
+    api_server.version_monitor.check()
+    api_server.version_monitor.check()
+    events = api_server.bus.since(topic, 0)
+    assert [e[1] for e in events] == ["vote", "changed"]
+    assert events[-1][2]["version"] > first["version"]
+
+def test_watchers_over_the_cap_are_not_held(client, monkeypatch):
+    monkeypatch.setattr(api_server, "_watch_slots", threading.BoundedSemaphore(1))
+    assert api_server._watch_slots.acquire(blocking=False)  # the one slot is taken
+    rec_id = _rec(client)
+    
+    started = time.monotonic()
+    data = client.get(f'/api/recommendation/{rec_id}/events?transport=longpoll&timeout=5').get_json()
+    assert time.monotonic() - started < 1
+    assert data["events"] == [] and data["retry_ms"] > 0
+    
+    response = client.get(f'/api/recommendation/{rec_id}/events')
+    assert response.status_code == 503 and response.headers["Retry-After"]
+    
+    api_server._watch_slots.release()
+    response = client.get(f'/api/recommendation/{rec_id}/events?transport=longpoll&timeout=0')
+    assert "retry_ms" not in response.get_json()
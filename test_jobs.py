@@ -0,0 +1,111 @@
+"""
+Tests for the generation job queue endpoints against the LLM stub
+"""
+import threading
+import time
+
+import pytest
+
+import api_server
+import jobs
+import llm_stub
+
+PROFILE = {"risk": "medium", "eth_holdings": 2.0, "portfolio_type": "traditional"}
+MARKET = {"apy": 4.5, "tvl_b": 2.7, "eth_usd": 3000.0}
+
+@pytest.fixture
+def job_queue(monkeypatch):
+    """A small queue of its own, so tests can fill it and time jobs out"""
+    def make(workers=1, max_queue=4, timeout=30.0):
+        queue = jobs.JobQueue(workers=workers, max_queue=max_queue, timeout=timeout, result_ttl=60)
+        monkeypatch.setattr(api_server, "generation_queue", queue)
+        return queue
+    return make
+
+def _enqueue(client):
+    return client.post('/api/jobs/generate-portfolios', json={"profile": PROFILE, "market": MARKET})
+
+def _wait_for(client, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f'/api/jobs/{job_id}').get_json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+def _until(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+def test_job_runs_to_completion(client, stub_llm, job_queue):
+    job_queue()
+    response = _enqueue(client)
+    assert response.status_code == 202
+    
+    job = _wait_for(client, response.get_json()["job_id"])
+    
+    assert job["status"] == "done"
+    assert job["result"]["summary"] == llm_stub.STUB_SUMMARY
+    assert "Portfolio A — Crypto Tilt" in job["result"]["portfolios"]
+    assert client.get('/api/jobs/metrics').get_json()["completed"] == 1
+
+def test_full_queue_is_rejected_with_retry_after(client, stub_llm, job_queue):
+    queue = job_queue(workers=1, max_queue=1)
+    gate = threading.Event()
+    stub_llm.latency = lambda model: gate.wait(5) and 0
+    
+    running = _enqueue(client).get_json()["job_id"]
+    _until(lambda: queue.metrics()["running"] == 1)
+    queued = _enqueue(client)
+    rejected = _enqueue(client)
+    
+    assert queued.status_code == 202
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"] == "5"
+    assert queue.metrics()["rejected"] == 1
+    
+    gate.set()
+    assert _wait_for(client, running)["status"] == "done"
+    assert _wait_for(client, queued.get_json()["job_id"])["status"] == "done"
+
+def test_timed_out_job_frees_its_worker(client, stub_llm, job_queue):
+    queue = job_queue(workers=1, timeout=0.3)
+    # About two seconds of trickling chunks per call, well past the timeout
+    stub_llm.chunk_size = 4
+    stub_llm.chunk_delay = 0.02
+    
+    started = time.time()
+    job = _wait_for(client, _enqueue(client).get_json()["job_id"])
+    assert job["status"] == "timed_out"
+    
+    # The call itself is cut off at the deadline rather than left running
+    _until(lambda: queue.metrics()["running"] == 0, timeout=1.0)
+    assert time.time() - started < 1.5
+    assert stub_llm.streams[0].chunks_sent < len(stub_llm.streams[0]._chunks)
+    # Out of time: the primary (and maybe its hedge), but no fallthrough models and no summary call
+    assert len(stub_llm.calls) <= 2
+    
+    stub_llm.chunk_delay = 0
+    assert _wait_for(client, _enqueue(client).get_json()["job_id"])["status"] == "done"
+    assert queue.metrics()["timed_out"] == 1
+
+def test_job_can_be_polled_from_another_worker(client, stub_llm, job_queue):
+    owner = job_queue()
+    gate = threading.Event()
+    stub_llm.latency = lambda model: gate.wait(5) and 0
+    job_id = _enqueue(client).get_json()["job_id"]
+    _until(lambda: owner.metrics()["running"] == 1)
+    
+    # A second queue stands in for a gunicorn worker that never saw the POST
+    job_queue()
+    assert client.get(f'/api/jobs/{job_id}').get_json()["status"] == "running"
+    
+    gate.set()
+    _until(lambda: owner.metrics()["completed"] == 1)
+    job = client.get(f'/api/jobs/{job_id}').get_json()
+    assert job["status"] == "done"
+    assert job["result"]["summary"] == llm_stub.STUB_SUMMARY
+    assert client.get('/api/jobs/unknown').status_code == 404
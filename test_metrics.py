@@ -0,0 +1,118 @@
+"""
+Tests for request timing middleware and the Prometheus /api/metrics endpoint
+"""
+import os
+
+import api_server
+import metrics
+
+def _sample(text, line_prefix):
+    """Value of the first exposition line starting with `line_prefix`"""
+    for line in text.splitlines():
+        if line.startswith(line_prefix):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+def test_requests_are_timed_per_route_template(client):
+    rec_id = client.post('/api/create-recommendation', json={"nickname": "u", "portfolios": {}}).get_json()["rec_id"]
+    before = api_server.REQUEST_LATENCY.count(route="/api/recommendation/<rec_id>")
+    client.get(f'/api/recommendation/{rec_id}')
+    client.get('/api/recommendation/missing')
+
+    assert api_server.REQUEST_LATENCY.count(route="/api/recommendation/<rec_id>") == before + 2
+    assert api_server.REQUEST_STATUS.total(route="/api/recommendation/<rec_id>", status=404) >= 1
+    assert api_server.REQUESTS_IN_FLIGHT.value(route="/api/recommendation/<rec_id>") == 0
+
+def test_store_and_session_spans_are_recorded(client):
+    loads = metrics.SPAN_SECONDS.count(span="load_store")
+    saves = metrics.SPAN_SECONDS.count(span="save_store")
+    sessions = metrics.SPAN_SECONDS.count(span="validate_session")
+    client.post('/api/create-recommendation', json={"nickname": "u", "portfolios": {}},
+                headers={"Authorization": "Bearer not-a-token"})
+
+    assert metrics.SPAN_SECONDS.count(span="load_store") == loads + 1
+    assert metrics.SPAN_SECONDS.count(span="save_store") == saves + 1
+    assert metrics.SPAN_SECONDS.count(span="validate_session") == sessions + 1
+
+def test_metrics_endpoint_renders_prometheus_text(client):
+    client.get('/api/health')
+    response = client.get('/api/metrics')
+    text = response.get_data(as_text=True)
+
+    assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE http_request_duration_seconds histogram" in text
+    assert "# TYPE http_requests_in_flight gauge" in text
+    prefix = 'http_request_duration_seconds_bucket{method="GET",route="/api/health",le="+Inf"}'
+    count = 'http_request_duration_seconds_count{method="GET",route="/api/health"}'
+    assert _sample(text, prefix) == _sample(text, count) >= 1
+    # The scrape itself is in flight while it renders
+    assert _sample(text, 'http_requests_in_flight{route="/api/metrics"}') == 1
+
+def test_label_values_are_escaped():
+    c = metrics.counter("test_escape_total", "Escaping", ("path",))
+    c.inc(path='a"b\\c\nd')
+    assert 'test_escape_total{path="a\\"b\\\\c\\nd"} 1' in metrics.render_prometheus()
+
+def _llm_total(snapshot, name, field="value", **labels):
+    """Sum of `field` over the series of `name` in a /api/metrics/llm body matching `labels`"""
+    return sum(series[field] for series in snapshot.get(name, [])
+               if all(series.get(label) == value for label, value in labels.items()))
+
+def test_llm_metrics_count_successes_and_failures(client, stub_llm):
+    import backend
+    profile = {"risk": "low", "eth_holdings": 1.0, "portfolio_type": "traditional"}
+    market = {"apy": 4.5, "tvl_b": 2.7, "eth_usd": 3000.0}
+    primary = backend.ROUTING["portfolios"]["primary"]
+    before = client.get('/api/metrics/llm').get_json()
+
+    backend.generate_with_summary(profile, market)
+    ok = client.get('/api/metrics/llm').get_json()
+
+    def delta(snapshot, name, field="value", **labels):
+        return _llm_total(snapshot, name, field, **labels) - _llm_total(before, name, field, **labels)
+
+    assert delta(ok, "llm_request_seconds", "count", task="portfolios", model=primary, outcome="ok") == 1
+    assert delta(ok, "llm_request_seconds", "count", task="summary", outcome="ok") == 1
+    assert delta(ok, "llm_input_tokens_total", task="portfolios", model=primary) > 0
+    assert delta(ok, "llm_output_tokens_total", task="summary") > 0
+    assert delta(ok, "llm_results_total", task="portfolios", source="llm") == 1
+    assert delta(ok, "llm_results_total", task="summary", source="llm") == 1
+
+    def failing(model, prompt):
+        raise RuntimeError("overloaded_error")
+    stub_llm.responder = failing
+    backend.generate_with_summary(profile, market)
+    failed = client.get('/api/metrics/llm').get_json()
+    before = ok
+
+    # Every portfolio model was tried and failed, then the engine answered
+    assert delta(failed, "llm_request_seconds", "count", task="portfolios", outcome="error") == len(backend.PORTFOLIO_MODELS)
+    assert delta(failed, "llm_model_fallthrough_total", task="portfolios", reason="error") == len(backend.PORTFOLIO_MODELS)
+    assert delta(failed, "llm_request_seconds", "count", task="summary", outcome="error") >= 1
+    assert delta(failed, "llm_results_total", task="portfolios", source="fallback", reason="all_models_failed") == 1
+    assert delta(failed, "llm_results_total", task="summary", source="default", reason="error") == 1
+    assert delta(failed, "llm_request_seconds", "count", outcome="ok") == 0
+    assert failed["fallback_rate"]["portfolios"] > ok["fallback_rate"]["portfolios"]
+
+def test_prometheus_text_adds_up_every_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "METRICS_DIR", str(tmp_path))
+    requests = metrics.counter("test_worker_requests_total", "Requests", ("route",))
+    busy = metrics.gauge("test_worker_busy", "Busy threads")
+    requests.inc(route="/a")
+    busy.inc()
+    metrics.flush()
+    # Pretend the file is another worker's, then record more here
+    (tmp_path / f"{os.getpid()}.json").rename(tmp_path / "1.json")
+    requests.inc(route="/a")
+
+    text = metrics.render_prometheus()
+    assert _sample(text, 'test_worker_requests_total{route="/a"}') == 3
+    assert _sample(text, "test_worker_busy ") == 2
+
+    # The other worker stops: its counts stay, its gauge goes
+    os.utime(tmp_path / "1.json", (0, 0))
+    metrics.flush()
+    assert not (tmp_path / "1.json").exists()
+    text = metrics.render_prometheus()
+    assert _sample(text, 'test_worker_requests_total{route="/a"}') == 3
+    assert _sample(text, "test_worker_busy ") == 1
@@ -0,0 +1,62 @@
+"""
+Tests for opt-in request profiling
+"""
+import pstats
+
+import pytest
+
+import profiling
+
+@pytest.fixture
+def profiled(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILE_ADMIN_TOKEN", "s3cret")
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path / "profiles"))
+    return client
+
+def test_off_by_default(client, tmp_path):
+    response = client.get('/api/recommendations', headers={"X-Profile": ""})
+    assert "X-Profile-Id" not in response.headers
+    assert client.get('/api/admin/profiles', headers={"X-Admin-Token": ""}).status_code == 403
+    assert not (tmp_path / "profiles").exists()
+
+def test_admin_header_profiles_one_request(profiled, tmp_path):
+    assert "X-Profile-Id" not in profiled.get('/api/recommendations').headers
+    assert "X-Profile-Id" not in profiled.get('/api/recommendations', headers={"X-Profile": "wrong"}).headers
+
+    response = profiled.get('/api/recommendation/abc', headers={"X-Profile": "s3cret"})
+    profile_id = response.headers["X-Profile-Id"]
+    assert "_GET_api-recommendation-rec-id_" in profile_id and profile_id.endswith("ms")
+    stats = pstats.Stats(str(tmp_path / "profiles" / f"{profile_id}.prof"))
+    assert any(name == "get_recommendation" for _, _, name in stats.stats)
+
+    assert profiled.get('/api/admin/profiles', headers={"X-Admin-Token": "wrong"}).status_code == 403
+    listed = profiled.get('/api/admin/profiles', headers={"X-Admin-Token": "s3cret"}).get_json()["profiles"]
+    assert len(listed) == 1
+    meta = listed[0]
+    assert meta["id"] == profile_id and meta["route"] == "/api/recommendation/<rec_id>"
+    assert meta["status"] == 404 and meta["trigger"] == "header" and meta["duration_ms"] >= 0
+    assert meta["top"] and {"function", "calls", "own_ms", "cumulative_ms"} <= set(meta["top"][0])
+
+    download = profiled.get(f'/api/admin/profiles/{profile_id}', headers={"X-Admin-Token": "s3cret"})
+    assert download.status_code == 200 and download.data == (tmp_path / "profiles" / f"{profile_id}.prof").read_bytes()
+    assert profiled.get('/api/admin/profiles/..%2Fauth', headers={"X-Admin-Token": "s3cret"}).status_code == 404
+
+def test_sampling_and_pruning(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(profiling, "PROFILE_KEEP", 2)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path / "profiles"))
+    ids = [client.get('/api/health').headers["X-Profile-Id"] for _ in range(3)]
+
+    assert [meta["id"] for meta in profiling.list_profiles()] == ids[:0:-1]
+    assert profiling.list_profiles(route="/api/recommendations") == []
+    assert sorted(p.name for p in (tmp_path / "profiles").iterdir()) == sorted(
+        f"{profile_id}{suffix}" for profile_id in ids[1:] for suffix in (".json", ".prof"))
+
+def test_one_profile_at_a_time(profiled):
+    running = profiling.start("header")
+    try:
+        response = profiled.get('/api/health', headers={"X-Profile": "s3cret"})
+        assert response.status_code == 200 and "X-Profile-Id" not in response.headers
+    finally:
+        profiling.abandon(running)
+    assert "X-Profile-Id" in profiled.get('/api/health', headers={"X-Profile": "s3cret"}).headers
@@ -0,0 +1,47 @@
+"""
+Tests for compounded per-asset projection curves
+"""
+import pytest
+
+import projection
+from allocation import market_assumptions
+
+ALLOCATION = {"eETH": 30, "BTC/Alts": 20, "US Stocks": 30, "Cash/FD": 20}
+MARKET = {"apy": 4.5, "tvl_b": 2.7, "eth_usd": 3000.0}
+
+def test_each_bucket_compounds_at_its_own_rate():
+    result = projection.project_portfolio(ALLOCATION, MARKET, 5.0, 3000.0, 365)
+    
+    _, rates, _ = market_assumptions(MARKET, list(ALLOCATION))
+    assert len(result["total"]) == 366 and result["total"][0] == 15000.0
+    for (asset, weight), rate in zip(ALLOCATION.items(), rates):
+        assert result["assets"][asset][-1] == pytest.approx(15000.0 * weight / 100 * (1 + rate), abs=0.01)
+    assert result["final_value"] == pytest.approx(sum(curve[-1] for curve in result["assets"].values()), abs=0.05)
+    assert result["total"] == sorted(result["total"])
+
+def test_curves_are_cached_per_allocation_market_and_horizon():
+    projection._growth_curves.cache_clear()
+    projection.project_portfolio(ALLOCATION, MARKET, 5.0, 3000.0, 90)
+    projection.project_portfolio(dict(reversed(list(ALLOCATION.items()))), MARKET, 1.0, 2500.0, 90)
+    assert projection.cache_info().hits == 0  # key order is part of the allocation
+    projection.project_portfolio(ALLOCATION, MARKET, 2.0, 3100.0, 90)
+    assert projection.cache_info().hits == 1
+    projection.project_portfolio(ALLOCATION, dict(MARKET, apy=5.0), 2.0, 3100.0, 90)
+    assert projection.cache_info().misses == 3
+    # Price and TVL ticks don't change the rates, so they share the curves
+    projection.project_portfolio(ALLOCATION, dict(MARKET, eth_usd=3150.5, tvl_b=2.9), 2.0, 3150.5, 90)
+    assert projection.cache_info().hits == 2
+
+def test_endpoint_projects_posted_portfolios(client):
+    response = client.post('/api/projection', json={
+        "portfolios": {"A": ALLOCATION}, "market": MARKET, "eth_holdings": 1.0, "time_limit_days": 30
+    })
+    
+    result = response.get_json()["results"]["A"]
+    assert result["days"][-1] == 30
+    assert set(result["assets"]) == set(ALLOCATION)
+
+def test_endpoint_rejects_out_of_range_horizon(client):
+    response = client.post('/api/projection', json={"portfolios": {"A": ALLOCATION}, "time_limit_days": 100000})
+    
+    assert response.status_code == 400
@@ -0,0 +1,73 @@
+"""
+Tests for token-bucket rate limiting and the LLM concurrency cap
+"""
+import ratelimit
+
+PROFILE = {"risk": "medium", "eth_holdings": 5.0}
+MARKET = {"apy": 4.5, "tvl_b": 2.7, "eth_usd": 3000.0}
+
+def _generate(client, token=None, mode=None):
+    body = {"profile": PROFILE, "market": MARKET, **({"mode": mode} if mode else {})}
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    return client.post('/api/generate-portfolios', json=body, headers=headers)
+
+def _signup(client, username):
+    return client.post('/api/auth/signup/user', json={
+        "username": username, "email": f"{username}@example.com", "password": "pw", "eth_holdings": 1.0
+    }).get_json()["token"]
+
+def test_llm_burst_gets_429_without_touching_cheap_endpoints(client, stub_llm):
+    alice, bob = _signup(client, "alice"), _signup(client, "bob")
+    burst = int(ratelimit.limiter.limits["llm"]["principal"][1])
+    assert all(_generate(client, alice).status_code == 200 for _ in range(burst))
+
+    limited = _generate(client, alice)
+    assert limited.status_code == 429
+    assert int(limited.headers["Retry-After"]) >= 1
+    assert limited.get_json()["retry_after"] > 0
+    # Other principals, other classes and instant (engine-only) generation are unaffected
+    assert _generate(client, bob).status_code == 200
+    assert _generate(client, alice, mode="instant").status_code == 200
+    rec_id = client.post('/api/create-recommendation', json={"nickname": "u", "portfolios": {}}).get_json()["rec_id"]
+    assert client.post('/api/vote', json={"rec_id": rec_id, "choice": "A"}).status_code == 200
+
+def test_global_bucket_refunds_the_principal():
+    limiter = ratelimit.RateLimiter({"llm": {"principal": (0.001, 2), "global": (0.001, 1)}}, enabled=True)
+    assert limiter.check("llm", "alice") == 0
+    assert limiter.check("llm", "bob") > 0  # Global budget spent
+    limiter._buckets[("llm", "*")].tokens = 1
+    # Bob's refused request didn't cost him his own token
+    assert limiter.check("llm", "bob") == 0
+    assert limiter._buckets[("llm", "bob")].tokens == 1
+
+def test_made_up_tokens_share_the_address_bucket(client, stub_llm):
+    burst = int(ratelimit.limiter.limits["llm"]["principal"][1])
+    assert all(_generate(client, f"fake-{i}").status_code == 200 for i in range(burst))
+    # A new token per request is still the same client
+    assert _generate(client, "fake-next").status_code == 429
+    assert _generate(client).status_code == 429
+
+def test_only_accounts_are_refunded_by_the_global_bucket():
+    limiter = ratelimit.RateLimiter({"llm": {"principal": (0.001, 2), "global": (0.001, 1)}}, enabled=True)
+    assert limiter.check("llm", "user:1") == 0
+    assert limiter.check("llm", "ip:10.0.0.2", refund=False) > 0
+    assert limiter._buckets[("llm", "ip:10.0.0.2")].tokens == 1
+
+def test_llm_slots_cap_concurrent_generations(client, stub_llm, monkeypatch):
+    monkeypatch.setattr(ratelimit.llm_slots, "limit", 1)
+    assert ratelimit.llm_slots.try_acquire()  # Someone else's generation in flight
+    try:
+        busy = _generate(client)
+        assert busy.status_code == 503 and busy.headers["Retry-After"] == "1"
+    finally:
+        ratelimit.llm_slots.release()
+    assert _generate(client).status_code == 200
+    assert ratelimit.llm_slots.in_flight == 0
+
+def test_health_and_metrics_are_never_limited(client, monkeypatch):
+    monkeypatch.setattr(ratelimit.limiter, "limits", {name: {"principal": (0.001, 1), "global": (0.001, 1)}
+                                                      for name in ratelimit.DEFAULT_LIMITS})
+    assert client.get('/api/recommendations').status_code == 200
+    assert client.get('/api/recommendations').status_code == 429
+    assert all(client.get('/api/health').status_code == 200 for _ in range(5))
+    assert all(client.get('/api/metrics').status_code == 200 for _ in range(5))
@@ -0,0 +1,128 @@
+"""
+Tests for SLO-based model routing and hedged LLM requests
+"""
+import time
+
+import pytest
+
+import backend
+import llm_stub
+
+PROFILE = {"risk": "medium", "eth_holdings": 5.0, "portfolio_type": "traditional"}
+MARKET = {"apy": 4.5, "tvl_b": 2.7, "eth_usd": 3000.0}
+
+@pytest.fixture
+def fast_deadlines(monkeypatch):
+    """Hedge after 50 ms with a fresh budget"""
+    for task in backend.ROUTING:
+        monkeypatch.setitem(backend.ROUTING, task, dict(backend.ROUTING[task], default_deadline=0.05))
+    monkeypatch.setattr(backend, "_hedge_budget", {"routed": 0, "hedged": 0})
+    monkeypatch.setattr(backend, "LLM_HEDGE_MIN_SAMPLES", 10**9)
+
+def test_slow_primary_is_hedged_and_abandoned(stub_llm, fast_deadlines):
+    route = backend.ROUTING["portfolios"]
+    stub_llm.latency = lambda model: 0.5 if model == route["primary"] else 0.0
+    won = backend.LLM_HEDGES.total(task="portfolios", outcome="hedge_won")
+    
+    started = time.perf_counter()
+    portfolios = backend.generate_two_portfolios(PROFILE, MARKET)
+    
+    assert time.perf_counter() - started < 0.4
+    assert set(portfolios) == {"Portfolio A — Crypto Tilt", "Portfolio B — Balanced Traditional"}
+    assert stub_llm.calls == [route["primary"], route["hedge"]]
+    assert backend.LLM_HEDGES.total(task="portfolios", outcome="hedge_won") == won + 1
+    
+    # The losing primary's stream is closed as soon as it opens instead of generating anything
+    deadline = time.time() + 2
+    while len(stub_llm.streams) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    loser = stub_llm.streams[1]
+    assert loser.closed and loser.chunks_sent == 0
+
+def test_losing_stream_is_closed_mid_stream(stub_llm, fast_deadlines):
+    route = backend.ROUTING["portfolios"]
+    # The primary trickles its answer over seconds; the hedge answers at once
+    stub_llm.chunk_delay = lambda model: 0.1 if model == route["primary"] else 0.0
+    cancelled = backend.LLM_LATENCY.count(task="portfolios", model=route["primary"], outcome="cancelled")
+    invalid = backend.LLM_PARSE_FAILURES.total(model=route["primary"])
+    
+    backend.generate_two_portfolios(PROFILE, MARKET)
+    
+    primary = stub_llm.streams[0]
+    assert primary.closed and primary.chunks_sent < 3
+    # Its pool thread gives up after the chunk it was waiting on, not at the end of the answer
+    deadline = time.time() + 0.5
+    while backend.LLM_LATENCY.count(task="portfolios", model=route["primary"], outcome="cancelled") == cancelled:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    # A cut-off answer from a cancelled attempt isn't counted as invalid output
+    assert backend.LLM_PARSE_FAILURES.total(model=route["primary"]) == invalid
+
+def test_hedged_over_primary_counts_toward_the_deadline(stub_llm, fast_deadlines, monkeypatch):
+    monkeypatch.setattr(backend, "LLM_PRIMARY_LATENCY", backend.metrics.Histogram("test_primary", "", ("task", "model")))
+    route = backend.ROUTING["summary"]
+    stub_llm.latency = lambda model: 0.3 if model == route["primary"] else 0.0
+    
+    backend.llm_summary(PROFILE, MARKET, {})
+    
+    # Cancelled, but recorded at no less than the 50 ms it was given
+    series = backend.LLM_PRIMARY_LATENCY.series[("summary", route["primary"])]
+    assert series["count"] == 1 and series["sum"] >= 0.05
+
+def test_non_retryable_primary_error_is_not_hedged(stub_llm, fast_deadlines):
+    class AuthError(Exception):
+        status_code = 401
+    
+    def unauthorized(model, prompt):
+        raise AuthError("authentication_error")
+    
+    stub_llm.responder = unauthorized
+    portfolios = backend.generate_two_portfolios(PROFILE, MARKET)
+    summary = backend.llm_summary(PROFILE, MARKET, portfolios)
+    
+    # One try each, then the engine and the default text
+    assert stub_llm.calls == [backend.ROUTING["portfolios"]["primary"], backend.ROUTING["summary"]["primary"]]
+    assert summary == backend._default_summary(PROFILE, MARKET)
+
+def test_retryable_primary_error_is_hedged(stub_llm, fast_deadlines):
+    class Overloaded(Exception):
+        status_code = 529
+    
+    route = backend.ROUTING["portfolios"]
+    
+    def overloaded(model, prompt):
+        if model == route["primary"]:
+            raise Overloaded("overloaded_error")
+        return llm_stub.default_responder(model, prompt)
+    
+    stub_llm.responder = overloaded
+    portfolios = backend.generate_two_portfolios(PROFILE, MARKET)
+    
+    assert stub_llm.calls == [route["primary"], route["hedge"]]
+    assert set(portfolios) == {"Portfolio A — Crypto Tilt", "Portfolio B — Balanced Traditional"}
+
+def test_fast_primary_is_not_hedged(stub_llm, fast_deadlines):
+    summary = backend.llm_summary(PROFILE, MARKET, {})
+    
+    assert summary
+    assert stub_llm.calls == [backend.ROUTING["summary"]["primary"]]
+
+def test_hedges_are_capped_by_budget(stub_llm, fast_deadlines, monkeypatch):
+    monkeypatch.setattr(backend, "LLM_HEDGE_BUDGET", 0.0)
+    monkeypatch.setattr(backend, "LLM_HEDGE_BURST", 0)
+    route = backend.ROUTING["summary"]
+    stub_llm.latency = lambda model: 0.15 if model == route["primary"] else 0.0
+    
+    backend.llm_summary(PROFILE, MARKET, {})
+    
+    assert stub_llm.calls == [route["primary"]]
+
+def test_deadline_tracks_observed_latency(monkeypatch):
+    monkeypatch.setattr(backend, "LLM_HEDGE_MIN_SAMPLES", 0)
+    monkeypatch.setattr(backend, "LLM_PRIMARY_LATENCY", backend.metrics.Histogram("test_primary", "", ("task", "model")))
+    primary = backend.ROUTING["summary"]["primary"]
+    for _ in range(100):
+        backend.LLM_PRIMARY_LATENCY.observe(0.4, task="summary", model=primary)
+    
+    assert 0.25 <= backend.hedge_deadline("summary") <= 0.5
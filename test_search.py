@@ -0,0 +1,69 @@
+"""
+Tests for the recommendation search index
+"""
+import api_server
+import search
+from utils import save_store
+
+def _rec(client, nickname, risk="medium", portfolio_type="etherfi-native", goal="steady yield", summary=""):
+    profile = {"risk": risk, "portfolio_type": portfolio_type, "goal": goal}
+    return client.post('/api/create-recommendation', json={
+        "nickname": nickname, "profile": profile, "portfolios": {}, "summary": summary
+    }).get_json()["rec_id"]
+
+def _ids(response):
+    return [hit["rec_id"] for hit in response.get_json()["results"]]
+
+def test_text_search_is_ranked(client):
+    weak = _rec(client, "alice", summary="Mostly stablecoins with a little staking on the side")
+    strong = _rec(client, "bob", goal="staking income", summary="Staking first: weETH staking and restaking")
+    carol = _rec(client, "carol", summary="Cash and US stocks only")
+
+    response = client.get('/api/recommendations/search?q=staking')
+    assert _ids(response) == [strong, weak]
+    hits = response.get_json()["results"]
+    assert hits[0]["score"] > hits[1]["score"] > 0
+    assert hits[0]["username"] == "bob" and hits[0]["goal"] == "staking income"
+
+    # A username match outweighs the same word in a summary
+    dave = _rec(client, "dave", summary="carol suggested this mix")
+    assert _ids(client.get('/api/recommendations/search?q=carol')) == [carol, dave]
+
+def test_filters_combine_with_and(client):
+    low = _rec(client, "alice", risk="low", portfolio_type="traditional", summary="bonds and cash")
+    _rec(client, "bob", risk="high", portfolio_type="traditional", summary="bonds and btc")
+    mid = _rec(client, "Alice", risk="medium", summary="bonds via Aave")
+
+    assert _ids(client.get('/api/recommendations/search?risk=low,medium')) == [mid, low]
+    assert _ids(client.get('/api/recommendations/search?q=bonds&portfolio_type=traditional&risk=low')) == [low]
+    assert _ids(client.get('/api/recommendations/search?username=alice&risk=medium')) == [mid]
+    assert _ids(client.get('/api/recommendations/search?q=aave&risk=low&risk=medium')) == [mid]
+    assert client.get('/api/recommendations/search?q=nothing').get_json() == {"results": [], "has_more": False}
+
+def test_paging_and_revalidation(client):
+    recs = [_rec(client, f"u{i}", summary="restaking vault") for i in range(5)]
+    first = client.get('/api/recommendations/search?q=restaking&limit=2')
+    assert first.get_json()["has_more"] is True
+    last = client.get('/api/recommendations/search?q=restaking&limit=2&offset=4').get_json()
+    assert last["has_more"] is False and len(last["results"]) == 1
+    # Equal scores: newest first
+    assert _ids(first) == recs[:-3:-1]
+
+    etag = first.headers["ETag"]
+    assert client.get('/api/recommendations/search?q=restaking&limit=2', headers={"If-None-Match": etag}).status_code == 304
+    _rec(client, "late")
+    assert client.get('/api/recommendations/search?q=restaking&limit=2', headers={"If-None-Match": etag}).status_code == 200
+
+def test_reindexing_and_backfill(client):
+    rec = {"username": "old", "input": {"profile": {"risk": "low"}}, "summary": "legacy staking plan"}
+    save_store({"users": {}, "recs": {"legacy": rec}, "votes": {}, "broker_votes": {}, "decisions": {}, "feedback": {}})
+    # Booting doesn't read the store; the migration indexes what's missing
+    api_server.create_app()
+    assert search.search("staking")["results"] == []
+    assert search.main(["--rebuild"]) == 0
+    assert search.index_missing({"legacy": rec}) == 0
+    assert [hit["rec_id"] for hit in search.search("staking")["results"]] == ["legacy"]
+
+    search.index_recommendation("legacy", {**rec, "summary": "now all cash"})
+    assert search.search("staking")["results"] == []
+    assert [hit["rec_id"] for hit in search.search("cash", risk=["low"])["results"]] == ["legacy"]
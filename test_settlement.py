@@ -0,0 +1,109 @@
+"""
+Tests for batched, idempotent settlement of broker earnings
+"""
+import threading
+
+import database
+import settlement
+from utils import load_store
+
+DECISION = {"decision": "Portfolio A", "time_limit_days": 365, "eth_holdings": 5.0, "eth_price": 3000.0,
+            "expected_return": 8.0}
+
+def _broker(client, name):
+    data = client.post('/api/auth/signup/broker', json={
+        "username": name, "email": f"{name}@example.com", "password": "pw"
+    }).get_json()
+    return data["user"]["id"], {"Authorization": f"Bearer {data['token']}"}
+
+def _rec(client):
+    return client.post('/api/create-recommendation', json={"nickname": "u", "portfolios": {}}).get_json()["rec_id"]
+
+def test_decisions_settle_in_batches_and_only_once(client):
+    broker_id, headers = _broker(client, "alice")
+    recs = [_rec(client) for _ in range(5)]
+    for rec_id in recs:
+        client.post('/api/vote', json={"rec_id": rec_id, "choice": "Portfolio A"}, headers=headers)
+        client.post('/api/decision', json={"rec_id": rec_id, **DECISION})
+    
+    summary = settlement.settle_pending(batch_size=2)
+    
+    # $15,000 at 8% for a year is $1,200 profit; the broker share is 3%
+    assert summary["decisions"] == 5 and summary["batches"] == 3
+    assert database.get_broker_by_id(broker_id)["total_earnings"] == 180.0
+    assert settlement.settle_pending()["decisions"] == 0
+    assert database.get_broker_by_id(broker_id)["total_earnings"] == 180.0
+    
+    earnings = client.get('/api/broker/earnings', headers=headers).get_json()
+    assert earnings["total_earnings"] == 180.0
+    assert earnings["recommendations_count"] == 5
+
+def test_changed_decision_and_late_vote_are_resettled(client):
+    alice, alice_headers = _broker(client, "alice")
+    bob, bob_headers = _broker(client, "bob")
+    rec_id = _rec(client)
+    client.post('/api/vote', json={"rec_id": rec_id, "choice": "Portfolio A"}, headers=alice_headers)
+    client.post('/api/decision', json={"rec_id": rec_id, **DECISION})
+    settlement.settle_pending()
+    
+    client.post('/api/decision', json={"rec_id": rec_id, **dict(DECISION, time_limit_days=730)})
+    client.post('/api/vote', json={"rec_id": rec_id, "choice": "Portfolio B"}, headers=bob_headers)
+    settlement.settle_pending()
+    
+    assert database.get_broker_by_id(alice)["total_earnings"] == 72.0
+    assert database.get_broker_by_id(bob)["total_earnings"] == 72.0
+
+def test_decisions_without_sequence_numbers_are_settled_once(client):
+    broker_id, headers = _broker(client, "alice")
+    recs = [_rec(client) for _ in range(3)]
+    for rec_id in recs:
+        client.post('/api/vote', json={"rec_id": rec_id, "choice": "Portfolio A"}, headers=headers)
+        client.post('/api/decision', json={"rec_id": rec_id, **DECISION})
+    store = load_store()
+    for decision in store["decisions"].values():
+        del decision["seq"]
+    
+    assert settlement.settle_pending(store, batch_size=1)["batches"] == 1
+    assert settlement.settle_pending(store)["decisions"] == 0
+    assert database.get_broker_by_id(broker_id)["total_earnings"] == 108.0
+
+def test_decisions_after_a_store_reset_still_settle(client):
+    import reset_recommendations
+    from utils import STORE_PATH
+    broker_id, headers = _broker(client, "alice")
+    for _ in range(3):
+        rec_id = _rec(client)
+        client.post('/api/vote', json={"rec_id": rec_id, "choice": "Portfolio A"}, headers=headers)
+        client.post('/api/decision', json={"rec_id": rec_id, **DECISION})
+    assert settlement.settle_pending()["watermark"] == 3
+    
+    reset_recommendations.reset_store(STORE_PATH)
+    rec_id = _rec(client)
+    client.post('/api/vote', json={"rec_id": rec_id, "choice": "Portfolio A"}, headers=headers)
+    client.post('/api/decision', json={"rec_id": rec_id, **DECISION})
+    
+    # The store's counter started over, but the sequence number didn't
+    assert load_store()["decisions"][rec_id]["seq"] == 4
+    assert settlement.settle_pending()["decisions"] == 1
+    assert database.get_broker_by_id(broker_id)["total_earnings"] == 144.0
+
+def test_concurrent_store_writes_keep_every_vote(client):
+    import api_server
+    rec_id = _rec(client)
+    statuses = []
+
+    def vote():
+        statuses.append(api_server.app.test_client().post('/api/vote', json={"rec_id": rec_id, "choice": "A"}).status_code)
+
+    def read():
+        statuses.append(api_server.app.test_client().get(f'/api/recommendation/{rec_id}').status_code)
+
+    threads = [threading.Thread(target=vote if i % 2 else read) for i in range(24)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # No vote lost to another writer, no reader saw half a file
+    assert set(statuses) == {200}
+    assert load_store()["votes"][rec_id] == {"A": 12}
@@ -0,0 +1,45 @@
+"""
+Tests for the Monte Carlo outcome simulator
+"""
+import math
+
+import pytest
+
+from simulation import simulate_growth, simulate_portfolio
+
+ALLOCATION = {"eETH": 30, "BTC/Alts": 20, "US Stocks": 30, "Cash/FD": 20}
+MARKET = {"apy": 4.5, "tvl_b": 2.7, "eth_usd": 3000.0}
+
+def test_same_seed_same_result_across_processes():
+    serial = simulate_growth(ALLOCATION, MARKET, 90, paths=60_000, seed=42, processes=0)
+    pooled = simulate_growth(ALLOCATION, MARKET, 90, paths=60_000, seed=42, processes=2)
+    
+    assert (serial == pooled).all()
+    assert not (serial == simulate_growth(ALLOCATION, MARKET, 90, paths=60_000, seed=43)).all()
+
+def test_bands_are_ordered_and_loss_probability_is_sane():
+    result = simulate_portfolio(ALLOCATION, MARKET, 5.0, 3000.0, 180, paths=20_000, seed=1)
+    
+    bands = list(result["final_value"].values())
+    assert bands == sorted(bands)
+    assert 0.0 < result["probability_of_loss"] < 1.0
+    assert result["initial_investment"] == 15000.0
+    assert result["expected_split"]["broker"] == pytest.approx(result["expected_profit"] * 0.03, abs=0.02)
+
+def test_cash_only_portfolio_has_no_loss():
+    result = simulate_portfolio({"Cash/FD": 100}, MARKET, 1.0, 3000.0, 365, paths=5_000, seed=3)
+    
+    assert result["probability_of_loss"] == 0.0
+    assert result["profit"]["p50"] == pytest.approx(3000.0 * (math.exp(0.035) - 1), rel=0.01)
+
+def test_endpoint_simulates_each_portfolio_of_a_recommendation(client):
+    portfolios = {"A": ALLOCATION, "B": {"eETH": 10, "US Stocks": 40, "Cash/FD": 50}}
+    rec_id = client.post('/api/create-recommendation', json={
+        "nickname": "sim", "profile": {"eth_holdings": 2.0}, "market": MARKET, "portfolios": portfolios
+    }).get_json()["rec_id"]
+    
+    data = client.post('/api/simulate', json={"rec_id": rec_id, "time_limit_days": 30, "paths": 2000, "seed": 5}).get_json()
+    
+    assert set(data["results"]) == {"A", "B"}
+    assert data["results"]["A"]["initial_investment"] == 6000.0
+    assert data["results"]["B"]["probability_of_loss"] < data["results"]["A"]["probability_of_loss"]
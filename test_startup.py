@@ -0,0 +1,32 @@
+"""
+Tests for cold start: lazy heavy imports and the app factory
+"""
+import os
+import subprocess
+import sys
+
+import benchmark
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def test_importing_the_app_skips_anthropic_requests_and_numpy(tmp_path):
+    code = ("import sys, api_server; "
+            "print(','.join(m for m in ('anthropic', 'requests', 'numpy') if m in sys.modules))")
+    output = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=dict(os.environ, PYTHONPATH=HERE),
+                            capture_output=True, text=True, check=True).stdout
+    assert output.strip() == ""
+    # Importing doesn't create the database either; create_app() does
+    assert not (tmp_path / "auth.db").exists()
+
+def test_lazy_routes_still_work(client):
+    response = client.post('/api/what-if', json={"eth_holdings": 1.0, "eth_price": 3000.0, "expected_return": 10.0,
+                                                 "time_limit_days": 365})
+    assert response.status_code == 200
+    response = client.post('/api/generate-portfolios', json={"mode": "instant", "profile": {"risk": "low", "eth_holdings": 5.0},
+                                                               "market": {"apy": 4.5, "tvl_b": 2.7, "eth_usd": 3000.0}})
+    assert response.status_code == 200 and len(response.get_json()["portfolios"]) == 2
+
+def test_startup_benchmark_reports_each_phase():
+    results = benchmark.measure_startup(runs=1)
+    assert set(results) == {"process", "import_api_server", "create_app", "first_request"}
+    assert results["import_api_server"]["p50_ms"] < results["process"]["p50_ms"]
@@ -0,0 +1,61 @@
+"""
+Tests for the incremental portfolio JSON parser and its early cut-off
+"""
+import pytest
+
+import backend
+import llm_stub
+from stream_parser import StreamingPortfolioParser, PortfolioStreamError, parse_stream
+
+PROFILE = {"risk": "medium", "eth_holdings": 5.0, "portfolio_type": "traditional"}
+MARKET = {"apy": 4.5, "tvl_b": 2.7, "eth_usd": 3000.0}
+VALID = ('{"A": {"eETH": 30, "BTC/Alts": 20, "US Stocks": 30, "Cash/FD": 20}, '
+         '"B": {"eETH": 25, "BTC/Alts": 15, "US Stocks": 35, "Cash/FD": 25}}')
+
+def test_parses_fenced_json_across_arbitrary_chunks():
+    text = "Here you go:\n```json\n" + VALID + "\n```\nNotes follow."
+    for size in (1, 3, 17, len(text)):
+        assert parse_stream(llm_stub.chunk_text(text, size))["B"]["Cash/FD"] == 25
+
+def test_stops_reading_once_object_closes():
+    parser = StreamingPortfolioParser()
+    assert parser.feed(VALID[:-1]) is None
+    assert parser.feed("}" + " and a long explanation" * 100) is not None
+    assert parser.done
+
+@pytest.mark.parametrize("text, reason", [
+    ('{"A": {"eETH": 30, "Dogecoin": 70', "Unknown asset"),
+    ('{"A": {"eETH": "thirty"', "String value"),
+    ('{"A": {"eETH": 90, "BTC/Alts": 90,', "already sum"),
+    ('{"A": {"eETH": 30, "BTC/Alts": 20}', "fewer than"),
+    ("I'm sorry, I can't help with that. " * 20, "No JSON object"),
+])
+def test_rejects_invalid_output_before_it_completes(text, reason):
+    with pytest.raises(PortfolioStreamError, match=reason):
+        StreamingPortfolioParser().feed(text)
+
+def test_small_rounding_drift_is_rescaled():
+    result = parse_stream(['{"A": {"eETH": 30, "BTC/Alts": 30, "US Stocks": 30}, '
+                           '"B": {"eETH": 50, "BTC/Alts": 30, "US Stocks": 30}}'])
+    assert result["A"] == {"eETH": 33, "BTC/Alts": 33, "US Stocks": 33}
+    assert result["B"] == {"eETH": 45, "BTC/Alts": 27, "US Stocks": 27}
+
+def test_generation_cancels_stream_after_json(stub_llm):
+    stub_llm.chunk_size = 10
+    stub_llm.responder = lambda model, prompt: VALID + " Rationale: " + "lorem ipsum " * 200
+    
+    portfolios = backend.generate_two_portfolios(PROFILE, MARKET)
+    
+    stream = stub_llm.streams[0]
+    assert portfolios["A"]["eETH"] == 30
+    assert stream.closed
+    assert stream.chunks_sent == len(VALID) // 10 + 1
+
+def test_invalid_output_moves_to_next_model(stub_llm):
+    first = backend.PORTFOLIO_MODELS[0]
+    stub_llm.responder = lambda model, prompt: '{"A": {"Dogecoin": 100' if model == first else VALID
+    
+    portfolios = backend.generate_two_portfolios(PROFILE, MARKET)
+    
+    assert portfolios["B"]["US Stocks"] == 35
+    assert stub_llm.calls == backend.PORTFOLIO_MODELS[:2]
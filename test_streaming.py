@@ -0,0 +1,73 @@
+"""
+Tests for the server-sent-events generation endpoint, driven by the LLM stub
+"""
+import json
+
+import backend
+import llm_stub
+
+PROFILE = {"risk": "medium", "eth_holdings": 5.0, "goal": "steady yield", "portfolio_type": "etherfi-native"}
+MARKET = {"apy": 4.5, "tvl_b": 2.7, "eth_usd": 3000.0}
+
+def parse_sse(body: str):
+    """Split an SSE body into (event, data) pairs, skipping comments"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = [line for line in block.split("\n") if not line.startswith(":")]
+        if not lines:
+            continue
+        fields = dict(line.split(": ", 1) for line in lines)
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+def test_stream_emits_portfolios_then_summary_chunks(client, stub_llm):
+    stub_llm.chunk_size = 8
+    response = client.post('/api/generate-portfolios/stream', json={"profile": PROFILE, "market": MARKET})
+    
+    assert response.mimetype == "text/event-stream"
+    events = parse_sse(response.get_data(as_text=True))
+    names = [name for name, _ in events]
+    assert names[0] == "portfolios"
+    assert names[-1] == "done"
+    assert set(names[1:-1]) == {"summary"}
+    assert len(names) - 2 == len(llm_stub.chunk_text(llm_stub.STUB_SUMMARY, 8))
+    
+    portfolios = events[0][1]
+    assert set(portfolios) == {"Portfolio A — ether.fi Native", "Portfolio B — Balanced Yield"}
+    streamed = "".join(data["text"] for name, data in events if name == "summary")
+    assert streamed == llm_stub.STUB_SUMMARY
+    assert events[-1][1]["summary"] == streamed
+
+def test_stream_first_chunk_arrives_before_completion(client, stub_llm):
+    response = client.post('/api/generate-portfolios/stream', json={"profile": PROFILE, "market": MARKET},
+                           buffered=False)
+    chunks = response.response
+    assert next(iter(chunks)).startswith(b": stream opened")
+    response.close()
+
+def test_stream_records_time_to_first_chunk(stub_llm):
+    model = backend._route_order("summary", backend.SUMMARY_MODELS)[0]
+    before = backend.LLM_FIRST_CHUNK.count(task="summary", model=model)
+    stub_llm.latency = 0.05
+    
+    chunks = backend.stream_llm_summary(PROFILE, MARKET, {})
+    next(chunks)
+    
+    assert backend.LLM_FIRST_CHUNK.count(task="summary", model=model) == before + 1
+    assert backend.LLM_FIRST_CHUNK.percentile(1.0, task="summary", model=model) >= 0.05
+    list(chunks)
+    assert backend.LLM_FIRST_CHUNK.count(task="summary", model=model) == before + 1
+
+def test_stream_skips_missing_models(stub_llm):
+    order = backend._route_order("summary", backend.SUMMARY_MODELS)
+    stub_llm.missing_models = {order[0]}
+    text = "".join(backend.stream_llm_summary(PROFILE, MARKET, {}))
+    
+    assert text == llm_stub.STUB_SUMMARY
+    assert stub_llm.calls == order[:2]
+
+def test_stream_falls_back_to_default_text_without_api_key(monkeypatch):
+    monkeypatch.setattr(backend, "ANTHROPIC_API_KEY", None)
+    chunks = list(backend.stream_llm_summary(PROFILE, MARKET, {}))
+    
+    assert chunks == [backend.llm_summary(PROFILE, MARKET, {})]
@@ -0,0 +1,53 @@
+"""
+Tests for the vectorized what-if engine against the scalar profit/split functions
+"""
+import random
+
+import numpy as np
+
+from backend import calculate_profit, reward_split
+from whatif import reward_split_batch, what_if
+
+def test_grid_matches_scalar_functions_to_the_cent():
+    holdings, prices, returns, days = [0.5, 5.0, 12.345], [2999.99, 3000.0], [-12.5, 0.0, 8.0, 33.3], [1, 30, 365]
+    result = what_if(holdings, prices, returns, days)
+    
+    assert result["shape"] == [3, 2, 4, 3]
+    for i, h in enumerate(holdings):
+        for j, p in enumerate(prices):
+            for k, r in enumerate(returns):
+                for m, d in enumerate(days):
+                    profit = calculate_profit(h, p, r, d)
+                    split = reward_split(profit["profit"])
+                    assert result["profit"][i, j, k, m] == profit["profit"]
+                    assert result["final_value"][i, j, k, m] == profit["final_value"]
+                    for share in ("user", "broker", "platform"):
+                        assert result["reward_split"][share][i, j, k, m] == split[share]
+
+def test_split_rounding_matches_at_half_cents():
+    rng = random.Random(7)
+    totals = [c / 100.0 + 0.005 for c in range(5000)] + [round(rng.uniform(-500, 5000), 3) for _ in range(5000)]
+    batch = reward_split_batch(np.array(totals))
+    
+    for i, total in enumerate(totals):
+        split = reward_split(total)
+        assert [batch[share][i] for share in ("user", "broker", "platform")] == \
+            [split["user"], split["broker"], split["platform"]]
+
+def test_endpoint_returns_nested_grid(client):
+    response = client.post('/api/what-if', json={
+        "eth_holdings": 5.0, "eth_price": 3000.0,
+        "expected_return": [4, 8, 12], "time_limit_days": [30, 90]
+    })
+    
+    data = response.get_json()
+    assert data["shape"] == [1, 1, 3, 2]
+    assert data["profit"][0][0][1][0] == calculate_profit(5.0, 3000.0, 8, 30)["profit"]
+
+def test_endpoint_rejects_oversized_grids(client):
+    axis = list(range(100))
+    response = client.post('/api/what-if', json={
+        "eth_holdings": axis, "eth_price": axis, "expected_return": axis, "time_limit_days": [30]
+    })
+    
+    assert response.status_code == 400
@@ -2,12 +2,22 @@
 Utility functions for DeFi Oracle system
 """
 import json
+import fcntl
 import hashlib
 import uuid
 import os
+from contextlib import contextmanager
+
+import metrics
 
 STORE_PATH = 'data/store.json'
 
+# Several gunicorn workers (and their threads) write the store. It is always
+# replaced whole through a temp file, so readers never see half of it, and
+# every load -> change -> save_store runs inside store_lock(), so concurrent
+# writers don't lose each other's updates.
+
+@metrics.timed("load_store")
 def load_store():
     """Load the JSON store file"""
     if not os.path.exists(STORE_PATH):
@@ -21,20 +31,69 @@ def load_store():
             "broker_votes": {},
             "decisions": {},
             "feedback": {},
-            "market": {}
+            "market": {},
+            "rec_order": [],
+            "broker_voted": {}
         }
-        with open(STORE_PATH, 'w') as f:
+        tmp = f"{STORE_PATH}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, 'w') as f:
             json.dump(default_store, f, indent=2)
-        return default_store
+        try:
+            # Only if nobody saved a store meanwhile; never replaces one
+            os.link(tmp, STORE_PATH)
+            return default_store
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp)
     
     with open(STORE_PATH, 'r') as f:
         return json.load(f)
 
+@metrics.timed("save_store")
 def save_store(store):
-    """Save the store to JSON file"""
-    os.makedirs('data', exist_ok=True)
-    with open(STORE_PATH, 'w') as f:
-        json.dump(store, f, indent=2)
+    """Save the store to JSON file (call inside store_lock() with the store it loaded)"""
+    write_json_atomic(STORE_PATH, store)
+
+def store_lock():
+    """Hold around a whole load_store -> change -> save_store; excludes other threads and workers"""
+    return file_lock(STORE_PATH)
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on <path>.lock for the with block, across processes"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(f"{path}.lock", 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def write_json_atomic(path, data):
+    """Write JSON through a temp file renamed over `path`, so readers never see half of it"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+def ensure_rec_index(store):
+    """
+    Fill in store["rec_order"] (rec ids, oldest first) and store["broker_voted"]
+    (broker id -> rec ids voted on) for stores written before they existed
+    """
+    recs = store.get("recs", {})
+    if len(store.get("rec_order", [])) != len(recs):
+        # Dicts keep insertion order, so recs without created_at are already oldest first
+        store["rec_order"] = sorted(recs, key=lambda rec_id: recs[rec_id].get("created_at") or "")
+    if "broker_voted" not in store:
+        voted = {}
+        for rec_id, votes in store.get("broker_votes", {}).items():
+            for broker_key in votes:
+                voted.setdefault(broker_key, []).append(rec_id)
+        store["broker_voted"] = voted
+    return store
 
 def anon_hash(username):
     """Create anonymous hash from username"""
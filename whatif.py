@@ -0,0 +1,99 @@
+"""
+Vectorized what-if engine for profit and reward splits
+Evaluates calculate_profit and reward_split over whole arrays or grids of
+scenarios at once, rounding to the same cents as the scalar versions
+"""
+from typing import Any, Dict, Iterable, Union
+
+import numpy as np
+
+# Same shares as backend.reward_split
+USER_SHARE, BROKER_SHARE, PLATFORM_SHARE = 0.96, 0.03, 0.01
+# Largest number of scenarios one request may evaluate
+WHATIF_MAX_CELLS = 250_000
+# Within this distance of a half cent, np.round and Python's round() can disagree
+_TIE_WINDOW = 1e-6
+
+ArrayLike = Union[float, Iterable[float], np.ndarray]
+
+def round_cents(values: np.ndarray) -> np.ndarray:
+    """
+    Element-wise round(x, 2), bit-identical to Python's round. np.round
+    scales by 100 first, which only matters for values within a hair of a
+    half cent, so those few are redone with round() itself.
+    """
+    values = np.asarray(values, dtype=float)
+    scaled = values * 100.0
+    out = np.round(scaled) / 100.0
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < _TIE_WINDOW
+    if near_tie.any():
+        out[near_tie] = [round(float(v), 2) for v in values[near_tie]]
+    return out
+
+def reward_split_batch(total_reward: ArrayLike) -> Dict[str, np.ndarray]:
+    """reward_split over an array of profits: user/broker/platform/total arrays"""
+    total = np.asarray(total_reward, dtype=float)
+    user = round_cents(total * USER_SHARE)
+    broker = round_cents(total * BROKER_SHARE)
+    platform = round_cents(total * PLATFORM_SHARE)
+    # Whatever the cent rounding left over goes to the platform
+    platform = platform + round_cents(total - (user + broker + platform))
+    return {"user": user, "broker": broker, "platform": platform, "total": total}
+
+def calculate_profit_batch(eth_holdings: ArrayLike, eth_price: ArrayLike, expected_return_pct: ArrayLike,
+                           time_limit_days: ArrayLike) -> Dict[str, np.ndarray]:
+    """calculate_profit over broadcastable arrays of inputs"""
+    eth_holdings, eth_price, expected_return_pct, time_limit_days = np.broadcast_arrays(
+        np.asarray(eth_holdings, dtype=float),
+        np.asarray(eth_price, dtype=float),
+        np.asarray(expected_return_pct, dtype=float),
+        np.trunc(np.asarray(time_limit_days, dtype=float)),  # int() in the scalar version
+    )
+    initial_investment = round_cents(eth_holdings * eth_price)
+    profit = round_cents(initial_investment * (expected_return_pct / 100.0) * (time_limit_days / 365.0))
+    final_value = round_cents(initial_investment + profit)
+    return {
+        "initial_investment": initial_investment,
+        "profit": profit,
+        "final_value": final_value,
+        "expected_return_pct": expected_return_pct,
+        "time_period_days": time_limit_days.astype(int),
+    }
+
+def what_if(eth_holdings: ArrayLike, eth_price: ArrayLike, expected_return_pct: ArrayLike,
+            time_limit_days: ArrayLike, grid: bool = True) -> Dict[str, Any]:
+    """
+    Profit, final value and reward split for every scenario. With `grid`,
+    each input is an axis and the result has shape (holdings, prices,
+    returns, days); otherwise the inputs are broadcast against each other.
+    Raises ValueError when there are more than WHATIF_MAX_CELLS scenarios.
+    """
+    axes = [np.atleast_1d(np.asarray(axis, dtype=float))
+            for axis in (eth_holdings, eth_price, expected_return_pct, time_limit_days)]
+    if any(axis.ndim != 1 for axis in axes) and grid:
+        raise ValueError("Grid axes must be scalars or flat lists")
+    if grid:
+        shape = tuple(len(axis) for axis in axes)
+        axes = [axis.reshape([-1 if i == j else 1 for j in range(4)]) for i, axis in enumerate(axes)]
+    else:
+        shape = np.broadcast_shapes(*(axis.shape for axis in axes))
+    cells = int(np.prod(shape))
+    if cells > WHATIF_MAX_CELLS:
+        raise ValueError(f"{cells} scenarios requested; the limit is {WHATIF_MAX_CELLS}")
+
+    profit = calculate_profit_batch(*axes)
+    split = reward_split_batch(profit["profit"])
+    return {
+        "shape": list(shape),
+        "initial_investment": profit["initial_investment"],
+        "profit": profit["profit"],
+        "final_value": profit["final_value"],
+        "reward_split": {share: split[share] for share in ("user", "broker", "platform")},
+    }
+
+def to_json(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Nested lists in place of arrays, for jsonify"""
+    return {
+        key: to_json(value) if isinstance(value, dict) else value.tolist() if isinstance(value, np.ndarray) else value
+        for key, value in result.items()
+    }